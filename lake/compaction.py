@@ -0,0 +1,177 @@
+"""Small-file compaction for the partitioned event lake.
+
+Every closed `event_type=*/event_dt=*/event_hour=*` partition holding more
+than one file is rewritten into files of roughly `target_file_bytes`, sorted
+by the event type's key. The rewritten partition is built next to the lake
+and swapped in with a directory exchange, so a reader listing the partition
+sees either all of the old files or all of the new ones.
+"""
+import argparse
+import ctypes
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import duckdb
+
+# Sort key per event type; sorting clusters rows so min/max statistics prune well
+SORT_KEYS = {
+    'post': 'event_us',
+    'like': 'event_us',
+    'follow': 'event_us',
+    'repost': 'event_us',
+}
+
+
+@dataclass
+class CompactionResult:
+    partition: str
+    rows: int
+    files_before: int
+    bytes_before: int
+    files_after: int
+    bytes_after: int
+    seconds: float
+
+
+def _partition_end(partition_dir: Path) -> Optional[datetime]:
+    values = dict(part.split('=', 1) for part in partition_dir.parts if '=' in part)
+    if 'event_dt' not in values or 'event_hour' not in values:
+        return None
+    return datetime.strptime(values['event_dt'], '%Y-%m-%d') + timedelta(hours=int(values['event_hour']) + 1)
+
+
+def _exchange_directories(first: Path, second: Path) -> None:
+    """Swap two directories atomically (renameat2 RENAME_EXCHANGE on Linux)"""
+    if sys.platform.startswith('linux'):
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = getattr(libc, 'renameat2', None)
+        if renameat2 is not None:
+            at_fdcwd, rename_exchange = -100, 2
+            if renameat2(at_fdcwd, os.fsencode(first), at_fdcwd, os.fsencode(second), rename_exchange) == 0:
+                return
+    # Fallback: the partition is briefly missing, but never half-written
+    parked = first.with_name(first.name + '.parked')
+    os.rename(first, parked)
+    os.rename(second, first)
+    os.rename(parked, second)
+
+
+class Compactor:
+    """Rewrites closed hourly partitions of a lake into fewer, larger sorted files"""
+
+    def __init__(self, root: str = 'data', target_file_bytes: int = 128 * 1024 ** 2,
+                 grace_period: timedelta = timedelta(minutes=10),
+                 sort_keys: Optional[Dict[str, str]] = None,
+                 log_path: str = '.ddse/compaction_log.jsonl'):
+        self.root = Path(root)
+        self.target_file_bytes = target_file_bytes
+        self.grace_period = grace_period
+        self.sort_keys = sort_keys or SORT_KEYS
+        self.log_path = Path(log_path)
+        # Staging sits next to the lake so renames stay on one filesystem and out of its globs
+        self.staging = self.root.parent / f".{self.root.name}_compaction"
+
+    def closed_partitions(self, now: Optional[datetime] = None) -> List[Path]:
+        """Partitions whose hour (plus the grace period) is over and that hold several files"""
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        partitions = {path.parent for path in self.root.rglob('*.parquet')}
+        closed = []
+        for partition in sorted(partitions):
+            end = _partition_end(partition.relative_to(self.root))
+            if end is None or end + self.grace_period > now:
+                continue
+            if len(list(partition.glob('*.parquet'))) > 1:
+                closed.append(partition)
+        return closed
+
+    def compact(self, partition: Path, conn: Optional[duckdb.DuckDBPyConnection] = None) -> CompactionResult:
+        started = time.perf_counter()
+        conn = conn or duckdb.connect()
+        files = sorted(partition.glob('*.parquet'))
+        bytes_before = sum(f.stat().st_size for f in files)
+        relative = partition.relative_to(self.root)
+        event_type = dict(part.split('=', 1) for part in relative.parts if '=' in part).get('event_type')
+        sort_key = self.sort_keys.get(event_type)
+
+        work_dir = self.staging / uuid.uuid4().hex
+        new_partition = work_dir / 'partition'
+        work_dir.mkdir(parents=True)
+        try:
+            source = f"read_parquet({[str(f) for f in files]}, hive_partitioning = false, union_by_name = true)"
+            rows = conn.execute(f"SELECT count(*) FROM {source}").fetchone()[0]
+            conn.execute(f"""
+                COPY (SELECT * FROM {source} {f'ORDER BY {sort_key}' if sort_key else ''})
+                TO '{new_partition}' (FORMAT PARQUET, COMPRESSION ZSTD, FILE_SIZE_BYTES {self.target_file_bytes})
+            """)
+            for written in new_partition.glob('*.parquet'):
+                written.rename(new_partition / f"part_{uuid.uuid4()}.parquet")
+
+            new_files = list(new_partition.glob('*.parquet'))
+            written_rows = conn.execute(
+                f"SELECT count(*) FROM read_parquet({[str(f) for f in new_files]})"
+            ).fetchone()[0]
+            if written_rows != rows:
+                raise RuntimeError(f"Compacted {relative} has {written_rows} rows, expected {rows}")
+
+            _exchange_directories(partition, new_partition)
+            # After the exchange new_partition holds the old directory. A writer may have added
+            # files to it since they were listed; those weren't compacted, so move them back.
+            compacted = {f.name for f in files}
+            for late in new_partition.iterdir():
+                if late.name not in compacted:
+                    late.rename(partition / late.name)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            try:
+                self.staging.rmdir()
+            except OSError:
+                # Another compaction is still using it
+                pass
+
+        after = list(partition.glob('*.parquet'))
+        return CompactionResult(
+            partition=str(relative),
+            rows=rows,
+            files_before=len(files),
+            bytes_before=bytes_before,
+            files_after=len(after),
+            bytes_after=sum(f.stat().st_size for f in after),
+            seconds=time.perf_counter() - started,
+        )
+
+    def run(self, now: Optional[datetime] = None) -> List[CompactionResult]:
+        results = []
+        conn = duckdb.connect()
+        for partition in self.closed_partitions(now):
+            results.append(self.compact(partition, conn))
+        if results:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                for result in results:
+                    f.write(json.dumps({'compacted_at': datetime.now(timezone.utc).isoformat(), **asdict(result)}) + '\n')
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact closed hourly partitions of the event lake")
+    parser.add_argument('root', nargs='?', default='data')
+    parser.add_argument('--target-mb', type=float, default=128)
+    parser.add_argument('--grace-minutes', type=float, default=10)
+    args = parser.parse_args()
+
+    compactor = Compactor(args.root, target_file_bytes=int(args.target_mb * 1024 ** 2),
+                          grace_period=timedelta(minutes=args.grace_minutes))
+    results = compactor.run()
+    for result in results:
+        print(f"{result.partition}: {result.files_before} files / {result.bytes_before} bytes -> "
+              f"{result.files_after} files / {result.bytes_after} bytes ({result.rows} rows, {result.seconds:.2f}s)")
+    if not results:
+        print("Nothing to compact")
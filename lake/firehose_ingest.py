@@ -0,0 +1,277 @@
+"""Streaming ingestion of the Bluesky Jetstream firehose into the event lake.
+
+Reads newline-delimited Jetstream events (such as `data/firehose.json`) in
+bounded-memory batches, routes each commit by `commit.collection` to an
+`event_type`, and partitions it by `event_dt`/`event_hour` of its `time_us`.
+Rows are buffered per partition as Arrow record batches and written out as
+one Parquet file once a partition reaches the target file size, instead of
+many tiny `part_<uuid>.parquet` files per hour. A partition is also written
+once the stream has moved `close_after` past its hour, or when it has had
+no new rows for `flush_interval` seconds, so closed hours reach the lake
+before compaction's grace period is over. Optionally, each
+partition's sketches (see sketches.py) are updated from the same batches
+and saved when its file is written.
+"""
+import argparse
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sketches import SketchStore, sketch_batch
+
+_COMMON_FIELDS = [
+    ('event_us', pa.int64()),
+    ('actor_did', pa.string()),
+    ('operation', pa.string()),
+    ('created_ts', pa.timestamp('us')),
+]
+
+# The existing part files mark reply/embed with the Parquet JSON logical type (pyarrow >= 19)
+_JSON = pa.json_() if hasattr(pa, 'json_') else pa.string()
+
+# Same columns as the existing part files under data/event_type=*/
+SCHEMAS = {
+    'post': pa.schema(_COMMON_FIELDS + [
+        ('text', pa.string()),
+        ('language', pa.string()),
+        ('is_reply', pa.bool_()),
+        ('reply', _JSON),
+        ('embed', _JSON),
+    ]),
+    'like': pa.schema(_COMMON_FIELDS + [('uri', pa.string())]),
+    'follow': pa.schema(_COMMON_FIELDS + [('subject_did', pa.string())]),
+    'repost': pa.schema(_COMMON_FIELDS + [('uri', pa.string())]),
+}
+
+COLLECTIONS = {
+    'app.bsky.feed.post': 'post',
+    'app.bsky.feed.like': 'like',
+    'app.bsky.graph.follow': 'follow',
+    'app.bsky.feed.repost': 'repost',
+}
+
+Partition = Tuple[str, str, int]  # (event_type, event_dt, event_hour)
+
+
+def _partition_end(partition: Partition) -> datetime:
+    return datetime.strptime(partition[1], '%Y-%m-%d') + timedelta(hours=partition[2] + 1)
+
+
+class FileSource:
+    """Replayable firehose source reading a local NDJSON dump"""
+
+    def __init__(self, path: str, repeat: int = 1):
+        self.path = Path(path)
+        self.repeat = repeat
+
+    def __iter__(self) -> Iterator[str]:
+        for _ in range(self.repeat):
+            with open(self.path) as f:
+                yield from f
+
+
+def _parse_ts(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def route(event: dict) -> Optional[Tuple[Partition, dict]]:
+    """Map a Jetstream event to its partition and row, or None if it isn't tracked"""
+    commit = event.get('commit') or {}
+    event_type = COLLECTIONS.get(commit.get('collection'))
+    if event.get('kind') != 'commit' or event_type is None:
+        return None
+
+    event_time = datetime.fromtimestamp(event['time_us'] / 1_000_000, tz=timezone.utc)
+    record = commit.get('record') or {}
+    row = {
+        'event_us': event['time_us'],
+        'actor_did': event.get('did'),
+        'operation': commit.get('operation'),
+        'created_ts': _parse_ts(record.get('createdAt')),
+    }
+    if event_type == 'post':
+        langs = record.get('langs') or []
+        row.update({
+            'text': record.get('text'),
+            'language': langs[0] if langs else None,
+            'is_reply': 'reply' in record,
+            'reply': json.dumps(record['reply'], separators=(',', ':')) if 'reply' in record else None,
+            'embed': json.dumps(record['embed'], separators=(',', ':')) if 'embed' in record else None,
+        })
+    elif event_type == 'follow':
+        row['subject_did'] = record.get('subject')
+    else:
+        row['uri'] = (record.get('subject') or {}).get('uri')
+
+    partition = (event_type, event_time.strftime('%Y-%m-%d'), event_time.hour)
+    return partition, row
+
+
+@dataclass
+class IngestStats:
+    events: int = 0
+    rows: int = 0
+    skipped: int = 0  # Untracked collections and non-commit events
+    malformed: int = 0
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    files_by_partition: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.seconds if self.seconds else 0.0
+
+
+class FirehoseIngester:
+    """Buffers routed events per partition and flushes size-targeted Parquet files"""
+
+    def __init__(self, output_dir: str = 'data', batch_size: int = 10_000,
+                 target_file_bytes: int = 128 * 1024 ** 2,
+                 max_buffered_bytes: int = 512 * 1024 ** 2,
+                 close_after: timedelta = timedelta(minutes=5),
+                 flush_interval: float = 60.0,
+                 sketch_dir: Optional[str] = None):
+        self.output_dir = Path(output_dir)
+        self.batch_size = batch_size
+        self.target_file_bytes = target_file_bytes
+        self.max_buffered_bytes = max_buffered_bytes
+        # Keep this shorter than compaction's grace period, or it may compact an hour still buffered here
+        self.close_after = close_after
+        self.flush_interval = flush_interval
+        self._buffers: Dict[Partition, List[pa.RecordBatch]] = {}
+        self._buffered_bytes: Dict[Partition, int] = {}
+        self._last_append: Dict[Partition, float] = {}  # time.monotonic() of each partition's last rows
+        self._stream_time: Optional[datetime] = None  # Latest event time seen
+        self.sketches = SketchStore(sketch_dir) if sketch_dir else None
+        self._sketches: Dict[Partition, Dict[str, object]] = {}
+        self.stats = IngestStats()
+
+    def ingest(self, lines: Iterable[str]) -> IngestStats:
+        """Consume a stream of NDJSON lines and flush everything at the end"""
+        started = time.perf_counter()
+        rows: Dict[Partition, List[dict]] = {}
+        pending = 0
+        next_check = time.monotonic() + self.flush_interval
+        for line in lines:
+            if not line.strip():
+                continue
+            self.stats.events += 1
+            try:
+                routed = route(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                self.stats.malformed += 1
+                continue
+            if routed is None:
+                self.stats.skipped += 1
+                continue
+            partition, row = routed
+            rows.setdefault(partition, []).append(row)
+            pending += 1
+            if pending >= self.batch_size or time.monotonic() >= next_check:
+                self._buffer(rows)
+                rows, pending = {}, 0
+                self._flush_closed()
+                next_check = time.monotonic() + self.flush_interval
+
+        self._buffer(rows)
+        self.flush()
+        self.stats.seconds += time.perf_counter() - started
+        return self.stats
+
+    def _buffer(self, rows: Dict[Partition, List[dict]]) -> None:
+        now = time.monotonic()
+        for partition, partition_rows in rows.items():
+            batch = pa.RecordBatch.from_pylist(partition_rows, schema=SCHEMAS[partition[0]])
+            latest = datetime.fromtimestamp(max(row['event_us'] for row in partition_rows) / 1_000_000,
+                                            tz=timezone.utc).replace(tzinfo=None)
+            self._stream_time = max(self._stream_time or latest, latest)
+            self._last_append[partition] = now
+            self._buffers.setdefault(partition, []).append(batch)
+            if self.sketches:
+                sketch_batch(partition[0], batch, self._sketches.setdefault(partition, {}))
+            self._buffered_bytes[partition] = self._buffered_bytes.get(partition, 0) + batch.nbytes
+            self.stats.rows += batch.num_rows
+            if self._buffered_bytes[partition] >= self.target_file_bytes:
+                self._flush_partition(partition)
+
+        # Backpressure: keep total memory bounded by writing the largest buffers early
+        while sum(self._buffered_bytes.values()) > self.max_buffered_bytes:
+            self._flush_partition(max(self._buffered_bytes, key=self._buffered_bytes.get))
+
+    def flush(self) -> None:
+        for partition in list(self._buffers):
+            self._flush_partition(partition)
+
+    def _flush_closed(self) -> None:
+        """Write partitions the stream has left behind, or that stopped receiving rows"""
+        idle_since = time.monotonic() - self.flush_interval
+        for partition in list(self._buffers):
+            if (_partition_end(partition) + self.close_after <= self._stream_time
+                    or self._last_append[partition] <= idle_since):
+                self._flush_partition(partition)
+
+    def _flush_partition(self, partition: Partition) -> None:
+        batches = self._buffers.pop(partition)
+        self._buffered_bytes.pop(partition)
+        self._last_append.pop(partition)
+        event_type, event_dt, event_hour = partition
+        directory = self.output_dir / f"event_type={event_type}" / f"event_dt={event_dt}" / f"event_hour={event_hour}"
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # Readers glob *.parquet, so a half-written file is never visible under its final name
+        path = directory / f"part_{uuid.uuid4()}.parquet"
+        tmp_path = path.with_suffix('.parquet.tmp')
+        pq.write_table(pa.Table.from_batches(batches), tmp_path, compression='zstd')
+        tmp_path.rename(path)
+        if self.sketches:
+            self.sketches.update(partition, self._sketches.pop(partition, {}))
+
+        self.stats.files += 1
+        self.stats.bytes += path.stat().st_size
+        key = str(directory.relative_to(self.output_dir))
+        self.stats.files_by_partition[key] = self.stats.files_by_partition.get(key, 0) + 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a Jetstream NDJSON dump into the partitioned event lake")
+    parser.add_argument('source', nargs='?', default='data/firehose.json')
+    parser.add_argument('--output', default='data')
+    parser.add_argument('--repeat', type=int, default=1, help="Replay the source file this many times")
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--target-mb', type=float, default=128)
+    parser.add_argument('--close-after-minutes', type=float, default=5,
+                        help="Write an hour once the stream is this far past it (below compaction's grace period)")
+    parser.add_argument('--flush-seconds', type=float, default=60,
+                        help="Write partitions that got no rows for this long")
+    parser.add_argument('--sketches', default='.ddse/sketches',
+                        help="Where to keep per-partition sketches; empty to skip them")
+    args = parser.parse_args()
+
+    ingester = FirehoseIngester(args.output, batch_size=args.batch_size,
+                                target_file_bytes=int(args.target_mb * 1024 ** 2),
+                                close_after=timedelta(minutes=args.close_after_minutes),
+                                flush_interval=args.flush_seconds,
+                                sketch_dir=args.sketches or None)
+    stats = ingester.ingest(FileSource(args.source, repeat=args.repeat))
+    print(f"Ingested {stats.rows} rows from {stats.events} events "
+          f"({stats.skipped} skipped, {stats.malformed} malformed) "
+          f"in {stats.seconds:.2f}s: {stats.events_per_second:,.0f} events/s")
+    print(f"Wrote {stats.files} files, {stats.bytes} bytes")
+    for partition, files in sorted(stats.files_by_partition.items()):
+        print(f"  {partition}: {files} files")
@@ -0,0 +1,247 @@
+"""Partition index for the hive-partitioned Bluesky event lake in `data/`.
+
+The lake is laid out as `event_type=*/event_dt=*/event_hour=*/part_*.parquet`.
+This module catalogs every part file with its partition values, row count
+and per-column min/max statistics, read from the Parquet footers only.
+Queries can then prune files by partition and by statistics, and project
+just the columns they need, before DuckDB opens a single file.
+
+The index is refreshed incrementally: only files that are new or changed
+since the last refresh have their footers read.
+"""
+import argparse
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import duckdb
+
+# Long string statistics (JSON blobs, post text) are useless for pruning
+MAX_STAT_LENGTH = 64
+
+_NUMERIC_TYPES = {'INT32': int, 'INT64': int, 'FLOAT': float, 'DOUBLE': float}
+
+# Converted types whose statistics DuckDB formats as ISO text, which sorts chronologically
+_TEMPORAL_TYPES = {'DATE', 'TIME_MILLIS', 'TIME_MICROS', 'TIMESTAMP_MILLIS', 'TIMESTAMP_MICROS'}
+
+
+@dataclass
+class FileEntry:
+    path: str  # Relative to the lake root
+    partitions: Dict[str, Any]
+    size: int
+    mtime: float
+    row_count: int = 0
+    stats: Dict[str, List[Any]] = field(default_factory=dict)  # column -> [min, max]; dates and times as ISO text
+
+
+def _partition_value(value: str) -> Any:
+    return int(value) if value.isdigit() else value
+
+
+def _parse_partitions(relative_path: Path) -> Dict[str, Any]:
+    partitions = {}
+    for part in relative_path.parent.parts:
+        if '=' in part:
+            key, value = part.split('=', 1)
+            partitions[key] = _partition_value(value)
+    return partitions
+
+
+def _stat_value(value: Optional[str], physical_type: str, converted_type: Optional[str] = None,
+                logical_type: Optional[str] = None) -> Any:
+    """A statistic as formatted by parquet_metadata(), or None if it can't be used for pruning"""
+    if value is None:
+        return None
+    if converted_type in _TEMPORAL_TYPES or (logical_type or '').startswith(('TimestampType', 'DateType', 'TimeType')):
+        return value
+    if converted_type == 'DECIMAL' or physical_type in _NUMERIC_TYPES:
+        try:
+            return _NUMERIC_TYPES.get(physical_type, float)(value)
+        except ValueError:
+            # Some other logical type formatted as text
+            return None
+    if physical_type == 'BOOLEAN':
+        return value == 'true'
+    return value if len(value) <= MAX_STAT_LENGTH else None
+
+
+def _sql_literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _in_range(low: Any, high: Any, bounds: Tuple[Any, Any]) -> bool:
+    """Whether [low, high] can overlap `bounds`; unknown or incomparable means yes"""
+    lower, upper = bounds
+    try:
+        if lower is not None and high is not None and high < lower:
+            return False
+        if upper is not None and low is not None and low > upper:
+            return False
+    except TypeError:
+        pass
+    return True
+
+
+class PartitionIndex:
+    """Catalog of the files, partitions and column statistics of a Parquet lake"""
+
+    def __init__(self, root: str = 'data', index_path: str = '.ddse/partition_index.json'):
+        self.root = Path(root)
+        self.index_path = Path(index_path)
+        self.files: Dict[str, FileEntry] = {}
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                self.files = {path: FileEntry(**entry) for path, entry in json.load(f).items()}
+
+    def refresh(self, conn: Optional[duckdb.DuckDBPyConnection] = None) -> int:
+        """Pick up new, changed and removed files; returns how many footers were read"""
+        conn = conn or duckdb.connect()
+        current = {}
+        for path in self.root.rglob('*.parquet'):
+            relative = path.relative_to(self.root)
+            stat = path.stat()
+            current[str(relative)] = FileEntry(
+                path=str(relative),
+                partitions=_parse_partitions(relative),
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+            )
+
+        changed = [entry for path, entry in current.items()
+                   if path not in self.files
+                   or (self.files[path].size, self.files[path].mtime) != (entry.size, entry.mtime)]
+        changed_paths = {entry.path for entry in changed}
+        for path in current:
+            if path not in changed_paths:
+                current[path] = self.files[path]
+
+        if changed:
+            self._read_footers(conn, changed)
+        self.files = current
+        return len(changed)
+
+    def _read_footers(self, conn: duckdb.DuckDBPyConnection, entries: List[FileEntry]) -> None:
+        by_file = {str(self.root / entry.path): entry for entry in entries}
+        # Statistics are formatted by logical type, which only the schema tells
+        rows = conn.execute("""
+            SELECT m.file_name, m.row_group_id, m.row_group_num_rows, m.path_in_schema, m.type,
+                   s.converted_type, s.logical_type, m.stats_min_value, m.stats_max_value
+            FROM parquet_metadata(?) AS m
+            LEFT JOIN parquet_schema(?) AS s ON s.file_name = m.file_name AND s.name = m.path_in_schema
+        """, [list(by_file), list(by_file)]).fetchall()
+
+        row_groups = set()
+        for file_name, row_group, num_rows, column, physical_type, converted, logical, low, high in rows:
+            entry = by_file[file_name]
+            if (file_name, row_group) not in row_groups:
+                row_groups.add((file_name, row_group))
+                entry.row_count += num_rows
+            low = _stat_value(low, physical_type, converted, logical)
+            high = _stat_value(high, physical_type, converted, logical)
+            if low is None or high is None:
+                # Without statistics on every row group the column can't be pruned on
+                entry.stats[column] = [None, None]
+                continue
+            known = entry.stats.get(column)
+            if known is None:
+                entry.stats[column] = [low, high]
+            elif known[0] is not None:
+                entry.stats[column] = [min(known[0], low), max(known[1], high)]
+
+    def save(self) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({path: asdict(entry) for path, entry in self.files.items()}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def partitions(self) -> Dict[Tuple, Dict[str, int]]:
+        """File count, rows and bytes per partition"""
+        summary: Dict[Tuple, Dict[str, int]] = {}
+        for entry in self.files.values():
+            key = tuple(entry.partitions.items())
+            totals = summary.setdefault(key, {'files': 0, 'rows': 0, 'bytes': 0})
+            totals['files'] += 1
+            totals['rows'] += entry.row_count
+            totals['bytes'] += entry.size
+        return summary
+
+    def prune(self, filters: Optional[Dict[str, Any]] = None,
+              ranges: Optional[Dict[str, Tuple[Any, Any]]] = None) -> List[FileEntry]:
+        """Files that can contain matching rows.
+
+        `filters` match partition values exactly (a list or set means any of).
+        `ranges` are inclusive (low, high) bounds, None for open ended, checked
+        against partition values or against column min/max statistics. Bounds
+        on date and timestamp columns are ISO text, e.g. '2024-12-13 15:00:00'.
+        """
+        selected = []
+        for entry in self.files.values():
+            if not self._matches_filters(entry, filters or {}):
+                continue
+            if not all(self._matches_range(entry, column, bounds)
+                       for column, bounds in (ranges or {}).items()):
+                continue
+            selected.append(entry)
+        return sorted(selected, key=lambda entry: entry.path)
+
+    @staticmethod
+    def _matches_filters(entry: FileEntry, filters: Dict[str, Any]) -> bool:
+        for key, wanted in filters.items():
+            if key not in entry.partitions:
+                continue
+            allowed = wanted if isinstance(wanted, (list, tuple, set, frozenset)) else [wanted]
+            if str(entry.partitions[key]) not in {str(value) for value in allowed}:
+                return False
+        return True
+
+    @staticmethod
+    def _matches_range(entry: FileEntry, column: str, bounds: Tuple[Any, Any]) -> bool:
+        if column in entry.partitions:
+            value = entry.partitions[column]
+            return _in_range(value, value, bounds)
+        low, high = entry.stats.get(column, [None, None])
+        return _in_range(low, high, bounds)
+
+    def scan(self, conn: duckdb.DuckDBPyConnection, columns: Optional[Iterable[str]] = None,
+             filters: Optional[Dict[str, Any]] = None,
+             ranges: Optional[Dict[str, Tuple[Any, Any]]] = None) -> duckdb.DuckDBPyRelation:
+        """A relation over only the pruned files, projected to `columns`"""
+        files = self.prune(filters, ranges)
+        if not files:
+            raise ValueError(f"No files in {self.root} match filters={filters} ranges={ranges}")
+
+        # Event types have different columns; take the union rather than the first file's schema
+        relation = conn.read_parquet([str(self.root / entry.path) for entry in files],
+                                     hive_partitioning=True, union_by_name=True)
+        # Statistics only prune whole files; rows still need the exact predicate
+        for column, (low, high) in (ranges or {}).items():
+            if low is not None:
+                relation = relation.filter(f"{column} >= {_sql_literal(low)}")
+            if high is not None:
+                relation = relation.filter(f"{column} <= {_sql_literal(high)}")
+        if columns:
+            relation = relation.project(', '.join(columns))
+        return relation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalog the partitions of a hive-partitioned Parquet lake")
+    parser.add_argument('root', nargs='?', default='data')
+    parser.add_argument('--index', default='.ddse/partition_index.json')
+    args = parser.parse_args()
+
+    index = PartitionIndex(args.root, args.index)
+    read = index.refresh()
+    index.save()
+    print(f"Indexed {len(index.files)} files ({read} footers read)")
+    for partition, totals in sorted(index.partitions().items()):
+        name = '/'.join(f"{key}={value}" for key, value in partition)
+        print(f"  {name}: {totals['files']} files, {totals['rows']} rows, {totals['bytes']} bytes")
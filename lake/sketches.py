@@ -0,0 +1,379 @@
+"""Mergeable sketches kept per partition of the event lake, for approximate queries.
+
+Exact answers to "how many distinct actors", "which posts get the most
+likes" or "median post length" scan every file of the lake. Instead, each
+`event_type=*/event_dt=*/event_hour=*` partition keeps small sketches that
+are updated as rows are ingested and merged at query time:
+
+- HyperLogLog for distinct counts (about 1.6% standard error)
+- Space-saving counters for top-k heavy hitters, with a per-item bound
+- Log-bucketed histograms (DDSketch) for quantiles, within 1% relative error
+
+Every answer is an `Estimate` carrying its error bounds. Sketches are JSON
+files under `.ddse/sketches/`, outside the lake, so compaction and Parquet
+globs never see them. Sketches take Arrow arrays and update from them
+without a Python loop per value. HyperLogLog hashes with DuckDB's `hash()`.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+HLL_PRECISION = 12  # 4096 registers
+TOP_K_CAPACITY = 1000  # Counters kept per top-k sketch; answers are reliable for k well below this
+QUANTILE_ACCURACY = 0.01  # Relative error of quantile values
+
+
+@dataclass
+class Estimate:
+    value: float
+    low: float
+    high: float
+
+    @property
+    def relative_error(self) -> float:
+        return (self.high - self.low) / 2 / self.value if self.value else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.value:,.0f} (±{self.relative_error:.1%})"
+
+
+# Hashing needs no catalog, so one private connection serves every sketch
+_hasher = duckdb.connect(':memory:')
+_hasher_lock = threading.Lock()
+HASH_FUNCTION = 'duckdb'  # Recorded with each HyperLogLog; registers from different hashes don't merge
+
+
+def _arrow(values: Iterable[Any]) -> pa.Array:
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return values
+    return pa.array(list(values))
+
+
+def _hash64(values: Iterable[Any]) -> np.ndarray:
+    """64-bit hashes of the distinct non-null values, vectorized in DuckDB and the same in every process"""
+    with _hasher_lock:
+        _hasher.register('sketch_values', pa.table({'v': _arrow(values)}))
+        try:
+            hashes = _hasher.execute("SELECT DISTINCT hash(v) FROM sketch_values WHERE v IS NOT NULL").arrow()
+        finally:
+            _hasher.unregister('sketch_values')
+    return hashes.column(0).to_numpy().astype(np.uint64)
+
+
+class HyperLogLog:
+    """Distinct-count sketch; merging takes the register-wise maximum"""
+    kind = 'hll'
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[np.ndarray] = None,
+                 hash_function: str = HASH_FUNCTION):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+        self.hash_function = hash_function
+
+    def add(self, values: Iterable[Any]) -> None:
+        if self.hash_function != HASH_FUNCTION:
+            raise ValueError(f"Can't add {HASH_FUNCTION} hashes to a HyperLogLog of {self.hash_function} hashes")
+        hashes = _hash64(values)
+        if not len(hashes):
+            return
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        # Rank of the first set bit in the next 32 bits; exact in float64
+        rest = ((hashes >> np.uint64(32 - self.precision)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise ValueError(f"Can't merge HyperLogLogs of precision {self.precision} and {other.precision}")
+        if other.hash_function != self.hash_function:
+            raise ValueError(f"Can't merge HyperLogLogs of {self.hash_function} and {other.hash_function} hashes")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> Estimate:
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        value = m * math.log(m / zeros) if raw <= 2.5 * m and zeros else raw
+        # Two standard errors, about 95% confidence
+        margin = 2 * 1.04 / math.sqrt(m) * value
+        return Estimate(value, max(0.0, value - margin), value + margin)
+
+    def to_json(self) -> dict:
+        return {'precision': self.precision, 'registers': base64.b64encode(self.registers.tobytes()).decode(),
+                'hash': self.hash_function}
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'HyperLogLog':
+        registers = np.frombuffer(base64.b64decode(data['registers']), dtype=np.uint8).copy()
+        return cls(data['precision'], registers, data['hash'])
+
+
+class TopK:
+    """Space-saving heavy hitters.
+
+    Each kept item has an upper-bound count and the most it may be over by;
+    `floor` bounds the count of any item that isn't kept.
+    """
+    kind = 'topk'
+
+    def __init__(self, capacity: int = TOP_K_CAPACITY, counters: Optional[Dict[str, List[int]]] = None,
+                 floor: int = 0):
+        self.capacity = capacity
+        self.counters = counters or {}  # item -> [count, error]
+        self.floor = floor
+
+    def add(self, values: Iterable[Any]) -> None:
+        counts = pc.value_counts(pc.drop_null(_arrow(values)))
+        items = pc.cast(counts.field('values'), pa.string()).to_pylist()
+        self.merge(TopK(self.capacity, {item: [count, 0]
+                                        for item, count in zip(items, counts.field('counts').to_pylist())}))
+
+    def merge(self, other: 'TopK') -> None:
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            mine = self.counters.get(item, [self.floor, self.floor])
+            theirs = other.counters.get(item, [other.floor, other.floor])
+            merged[item] = [mine[0] + theirs[0], mine[1] + theirs[1]]
+        floor = self.floor + other.floor
+        if len(merged) > self.capacity:
+            ranked = sorted(merged.items(), key=lambda entry: -entry[1][0])
+            floor = max(floor, ranked[self.capacity][1][0])
+            merged = dict(ranked[:self.capacity])
+        self.counters, self.floor = merged, floor
+
+    def top(self, k: int) -> List[Tuple[str, Estimate]]:
+        ranked = sorted(self.counters.items(), key=lambda entry: (-entry[1][0], entry[0]))[:k]
+        return [(item, Estimate(count, count - error, count)) for item, (count, error) in ranked]
+
+    def to_json(self) -> dict:
+        return {'capacity': self.capacity, 'counters': self.counters, 'floor': self.floor}
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'TopK':
+        return cls(data['capacity'], data['counters'], data['floor'])
+
+
+class Quantiles:
+    """DDSketch: counts per logarithmic bucket, so values come back within `accuracy` relative error"""
+    kind = 'quantiles'
+
+    def __init__(self, accuracy: float = QUANTILE_ACCURACY, buckets: Optional[Dict[int, int]] = None,
+                 zeros: int = 0):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.buckets = buckets or {}
+        self.zeros = zeros  # Values of zero or less; the sketch is for non-negative measures
+
+    @property
+    def count(self) -> int:
+        return self.zeros + sum(self.buckets.values())
+
+    def add(self, values: Iterable[Any]) -> None:
+        values = pc.drop_null(_arrow(values)).to_numpy(zero_copy_only=False).astype(np.float64)
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / math.log(self.gamma)).astype(np.int64),
+                                     return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other: 'Quantiles') -> None:
+        if other.accuracy != self.accuracy:
+            raise ValueError(f"Can't merge quantile sketches of accuracy {self.accuracy} and {other.accuracy}")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+
+    def quantile(self, q: float) -> Optional[Estimate]:
+        if not 0 <= q <= 1:
+            raise ValueError(f"Quantile must be between 0 and 1, got {q}")
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return Estimate(0.0, 0.0, 0.0)
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return Estimate(value, value * (1 - self.accuracy), value * (1 + self.accuracy))
+        value = 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+        return Estimate(value, value * (1 - self.accuracy), value * (1 + self.accuracy))
+
+    def to_json(self) -> dict:
+        return {'accuracy': self.accuracy, 'buckets': self.buckets, 'zeros': self.zeros}
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Quantiles':
+        return cls(data['accuracy'], {int(key): count for key, count in data['buckets'].items()}, data['zeros'])
+
+
+SKETCH_TYPES = {cls.kind: cls for cls in (HyperLogLog, TopK, Quantiles)}
+
+
+def _column(name: str) -> Callable[[pa.RecordBatch], pa.Array]:
+    return lambda batch: batch.column(name)
+
+
+def _text_length(batch: pa.RecordBatch) -> pa.Array:
+    return pc.utf8_length(batch.column('text'))
+
+
+def _ingest_lag_ms(batch: pa.RecordBatch) -> pa.Array:
+    # Firehose time minus the record's own createdAt
+    created = pc.cast(batch.column('created_ts'), pa.int64())
+    return pc.divide(pc.subtract(batch.column('event_us'), created), 1000)
+
+
+# Sketches kept per event type: name -> (kind, values of a batch)
+SKETCHES: Dict[str, Dict[str, Tuple[str, Callable[[pa.RecordBatch], pa.Array]]]] = {
+    'post': {
+        'actors': ('hll', _column('actor_did')),
+        'languages': ('topk', _column('language')),
+        'text_length': ('quantiles', _text_length),
+        'ingest_lag_ms': ('quantiles', _ingest_lag_ms),
+    },
+    'like': {
+        'actors': ('hll', _column('actor_did')),
+        'engaged_posts': ('topk', _column('uri')),
+        'ingest_lag_ms': ('quantiles', _ingest_lag_ms),
+    },
+    'repost': {
+        'actors': ('hll', _column('actor_did')),
+        'engaged_posts': ('topk', _column('uri')),
+        'ingest_lag_ms': ('quantiles', _ingest_lag_ms),
+    },
+    'follow': {
+        'actors': ('hll', _column('actor_did')),
+        'followed': ('topk', _column('subject_did')),
+        'ingest_lag_ms': ('quantiles', _ingest_lag_ms),
+    },
+}
+
+
+def sketch_batch(event_type: str, batch: pa.RecordBatch, sketches: Dict[str, Any]) -> None:
+    """Add a batch of one event type's rows to that partition's `sketches`, creating them as needed"""
+    for name, (kind, values) in SKETCHES.get(event_type, {}).items():
+        sketch = sketches.setdefault(name, SKETCH_TYPES[kind]())
+        sketch.add(values(batch))
+
+
+def _partition_values(path: Path) -> Dict[str, Any]:
+    values = dict(part.split('=', 1) for part in path.with_suffix('').parts if '=' in part)
+    if 'event_hour' in values:
+        values['event_hour'] = int(values['event_hour'])
+    return values
+
+
+class SketchStore:
+    """Per-partition sketches in JSON files mirroring the lake's partition layout"""
+
+    def __init__(self, root: str = '.ddse/sketches'):
+        self.root = Path(root)
+
+    def _path(self, partition: Tuple[str, str, int]) -> Path:
+        event_type, event_dt, event_hour = partition
+        return self.root / f"event_type={event_type}" / f"event_dt={event_dt}" / f"event_hour={event_hour}.json"
+
+    def load(self, path: Path) -> Dict[str, Any]:
+        with open(path) as f:
+            return {name: SKETCH_TYPES[data['kind']].from_json(data) for name, data in json.load(f).items()}
+
+    def update(self, partition: Tuple[str, str, int], sketches: Dict[str, Any]) -> None:
+        """Merge `sketches` into the partition's stored ones"""
+        path = self._path(partition)
+        stored = self.load(path) if path.exists() else {}
+        for name, sketch in sketches.items():
+            if name in stored:
+                stored[name].merge(sketch)
+            else:
+                stored[name] = sketch
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({name: {'kind': s.kind, **s.to_json()} for name, s in stored.items()}, f)
+        os.replace(tmp_path, path)
+
+    def build_from_lake(self, lake_root: str = 'data') -> int:
+        """Sketch every partition already in the lake from scratch; returns the partitions sketched"""
+        lake_root = Path(lake_root)
+        directories = sorted({path.parent for path in lake_root.rglob('*.parquet')})
+        for directory in directories:
+            values = _partition_values(directory.relative_to(lake_root))
+            partition = (values['event_type'], values['event_dt'], values['event_hour'])
+            sketches: Dict[str, Any] = {}
+            for file in sorted(directory.glob('*.parquet')):
+                for batch in pq.ParquetFile(file).iter_batches():
+                    sketch_batch(partition[0], batch, sketches)
+            self._path(partition).unlink(missing_ok=True)
+            self.update(partition, sketches)
+        return len(directories)
+
+    def merged(self, name: str, event_types: Optional[Iterable[str]] = None,
+               first_dt: Optional[str] = None, last_dt: Optional[str] = None) -> Optional[Any]:
+        """Sketch `name` merged over the matching partitions, or None if none has it"""
+        wanted = set(event_types) if event_types is not None else None
+        merged = None
+        for path in sorted(self.root.rglob('*.json')):
+            values = _partition_values(path.relative_to(self.root))
+            if wanted is not None and values.get('event_type') not in wanted:
+                continue
+            if (first_dt and values['event_dt'] < first_dt) or (last_dt and values['event_dt'] > last_dt):
+                continue
+            sketch = self.load(path).get(name)
+            if sketch is None:
+                continue
+            if merged is None:
+                merged = sketch
+            else:
+                merged.merge(sketch)
+        return merged
+
+    def distinct(self, name: str = 'actors', **where) -> Optional[Estimate]:
+        sketch = self.merged(name, **where)
+        return sketch.estimate() if sketch else None
+
+    def top(self, name: str, k: int = 30, **where) -> List[Tuple[str, Estimate]]:
+        sketch = self.merged(name, **where)
+        return sketch.top(k) if sketch else []
+
+    def quantile(self, name: str, q: float, **where) -> Optional[Estimate]:
+        sketch = self.merged(name, **where)
+        return sketch.quantile(q) if sketch else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Approximate answers from the event lake's partition sketches")
+    parser.add_argument('--sketches', default='.ddse/sketches')
+    parser.add_argument('--build', metavar='LAKE', help="Rebuild the sketches from the lake's files first")
+    parser.add_argument('--from', dest='first_dt', help="First event_dt, inclusive")
+    parser.add_argument('--to', dest='last_dt', help="Last event_dt, inclusive")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    store = SketchStore(args.sketches)
+    if args.build:
+        print(f"Sketched {store.build_from_lake(args.build)} partitions of {args.build}")
+    where = {'first_dt': args.first_dt, 'last_dt': args.last_dt}
+    print(f"Unique actors: {store.distinct('actors', **where)}")
+    for event_type in SKETCHES:
+        print(f"  {event_type}: {store.distinct('actors', event_types=[event_type], **where)}")
+    print("Most engaged posts (likes + reposts):")
+    for uri, count in store.top('engaged_posts', args.top, **where):
+        print(f"  {uri}: {count.high:,.0f} (at least {count.low:,.0f})")
+    for q in (0.5, 0.99):
+        print(f"Post length p{q * 100:.0f}: {store.quantile('text_length', q, event_types=['post'], **where)}")
@@ -2,27 +2,28 @@ import duckdb
 import yaml
 from pathlib import Path
 from datetime import datetime, timedelta
-import pandas as pd
+import time
+from arrow_io import sample_sales
+from incremental import WatermarkStore, ingest_incremental, is_decomposable, maintain_aggregate
+from loaders import BatchLoader
+from materialization_cache import MaterializationCache, fingerprint, table_fingerprint, watermark_fingerprint
+from planner import plan_inlined, prepare_relation
+from sql_analysis import SQLAnalysisError, analyze
+from sql_compiler import SQLCompiler
+from storage import StorageConfig, connect
 
 class SimpleDataStack:
-    def __init__(self):
-        self.conn = duckdb.connect(':memory:')  # Use in-memory database for simplicity
+    def __init__(self, storage: StorageConfig = None):
+        self.conn = connect(storage)  # In-memory database unless a file is configured
         
     def _create_sample_data(self):
-        # Create sample sales data
-        dates = pd.date_range(start='2024-01-01', end='2024-01-10', freq='h')
-        sales_data = pd.DataFrame({
-            'sale_date': dates,
-            'amount': np.random.randint(50, 500, size=len(dates)),
-            'product_id': np.random.randint(1, 10, size=len(dates))
-        })
-        return sales_data
+        # Create sample sales data as an Arrow stream DuckDB scans batch by batch
+        return sample_sales('2024-01-01', '2024-01-10')
         
     def ingest(self):
-        # Create sample data and load it directly
-        sales_data = self._create_sample_data()
-        self.conn.execute("CREATE TABLE raw_sales AS SELECT * FROM sales_data")
-        print("Ingested sample sales data")
+        # Stream sample data into the table in bounded batches
+        stats = BatchLoader().load(self.conn, 'raw_sales', self._create_sample_data())
+        print(f"Ingested sample sales data: {stats.summary()}")
         
     def transform(self):
         self.conn.execute("""
@@ -54,67 +55,113 @@ class SimpleDataStack:
             yaml.dump(dashboard_config, f)
         print("Created dashboard configuration")
         
-        # Display sample results
-        result = self.conn.execute("SELECT * FROM sales_daily LIMIT 5").fetchdf()
+        # Display sample results, rendered by DuckDB without a pandas round trip
         print("\nSample results:")
-        print(result)
+        print(self.conn.sql("SELECT * FROM sales_daily LIMIT 5"))
 
 class TemplateDataStack:
-    def __init__(self, config_path: str):
-        self.conn = duckdb.connect(':memory:')  # Use in-memory database
+    def __init__(self, config_path: str, state_dir: str = '.ddse', storage: StorageConfig = None,
+                 preview_rows: int = 0):
+        self.conn = connect(storage)  # In-memory database unless a file is configured
         self.config = self._load_config(config_path)
+        self.watermarks = WatermarkStore(Path(state_dir) / 'watermarks.json')
+        self.cache = MaterializationCache(Path(state_dir) / 'cache')
+        self.compiler = SQLCompiler(Path(state_dir) / 'compiled_sql.json')
+        # Debug mode: print the first rows of every table built (off by default)
+        self.preview_rows = preview_rows
         
     def _load_config(self, config_path: str) -> dict:
         with open(config_path) as f:
             return yaml.safe_load(f)
     
     def _create_sample_data(self):
-        # Create sample sales data
-        dates = pd.date_range(start='2024-01-01', end='2024-01-10', freq='h')
-        sales_data = pd.DataFrame({
-            'sale_date': dates,
-            'amount': np.random.randint(50, 500, size=len(dates)),
-            'product_id': np.random.randint(1, 10, size=len(dates))
-        })
-        return sales_data
+        # Create sample sales data as an Arrow stream DuckDB scans batch by batch
+        return sample_sales('2024-01-01', '2024-01-10')
     
     def ingest(self):
-        sales_data = self._create_sample_data()
-        
         for source in self.config['sources']:
             table_name = source['table']
-            # Load sample data directly into table
-            self.conn.execute(f"CREATE TABLE {table_name} AS SELECT * FROM sales_data")
-            print(f"Created and populated table: {table_name}")
+            if source.get('incremental'):
+                # A record batch reader is consumed by one scan, so each source gets its own
+                self.conn.register('sales_data', self._create_sample_data())
+                # Only pull rows newer than the last load's watermark
+                started = time.perf_counter()
+                rows = ingest_incremental(self.conn, table_name, "SELECT * FROM sales_data",
+                                          source['timestamp_column'], self.watermarks,
+                                          source.get('unique_key'))
+                print(f"Ingested {rows} new rows into table: {table_name} "
+                      f"({time.perf_counter() - started:.2f}s)")
+                continue
+            # Stream sample data into the table, at most `batch_rows` rows / `max_batch_mb` MB at a time
+            loader = BatchLoader(batch_rows=source.get('batch_rows', 100_000),
+                                 max_batch_bytes=int(source.get('max_batch_mb', 64) * 1024 ** 2))
+            stats = loader.load(self.conn, table_name, self._create_sample_data())
+            print(f"Created and populated table: {table_name}: {stats.summary()}")
+    
+    def _inlined_outputs(self) -> set:
+        """Transformation outputs only one other transformation reads, to create as views"""
+        served = set()
+        for viz in self.config['dashboard']['visualizations']:
+            try:
+                served |= analyze(viz['query']).tables
+            except SQLAnalysisError:
+                continue
+        transforms = self.config['transformations']
+        return plan_inlined({t['output_table']: [t['source_table']] for t in transforms}, served,
+                            [t['output_table'] for t in transforms if t.get('persistent')])
     
     def transform(self):
+        fingerprints = {}
+        inlined = self._inlined_outputs()
+        incremental = {source['table'] for source in self.config['sources'] if source.get('incremental')}
+        # Append-only incremental sources, whose aggregates can be maintained from new rows only
+        append_only = {source['table']: source for source in self.config['sources']
+                       if source.get('incremental') and not source.get('unique_key')}
         for transform in self.config['transformations']:
-            table_name = transform['output_table']
-            group_by = transform.get('group_by', [])
-            metrics = transform['metrics']
-            source_table = transform['source_table']
+            compiled = self.compiler.compile(transform)
+            table_name = compiled.output
+            source_table = compiled.source
             
-            # Build dynamic query
-            select_parts = []
-            for col in group_by:
-                select_parts.append(col)
-            for metric in metrics:
-                select_parts.append(f"{metric['agg']}({metric['column']}) as {metric['name']}")
-                
-            query = f"""
-                CREATE OR REPLACE TABLE {table_name} AS
-                SELECT {', '.join(select_parts)}
-                FROM {source_table}
-                {f"GROUP BY {', '.join(str(i+1) for i in range(len(group_by)))}" if group_by else ''}
-                ORDER BY {group_by[0] if group_by else '1'}
-            """
-            self.conn.execute(query)
-            print(f"Created transformed table: {table_name}")
+            # Skip tables whose SQL, config and input data are unchanged since the last build
+            if source_table in incremental and source_table not in fingerprints:
+                # No scan of the history: every load that changes rows moves the watermark
+                fingerprints[source_table] = watermark_fingerprint(self.conn, source_table,
+                                                                   self.watermarks.get(source_table))
+            elif source_table not in fingerprints:
+                fingerprints[source_table] = table_fingerprint(self.conn, source_table)
+            fingerprints[table_name] = fingerprint(compiled.select_literal, transform, [fingerprints[source_table]])
+            if table_name in inlined:
+                # Its only consumer reads through the view, so nothing is written out
+                prepare_relation(self.conn, table_name, view=True)
+                self.conn.execute(compiled.create_view)
+                self.cache.discard(table_name)
+                print(f"Created inlined view: {table_name}")
+                continue
+            prepare_relation(self.conn, table_name, view=False)
+            if self.cache.is_fresh(table_name, fingerprints[table_name]) and \
+                    self.cache.restore(self.conn, table_name):
+                print(f"Skipped unchanged table: {table_name}")
+                continue
             
-            # Display sample results
-            result = self.conn.execute(f"SELECT * FROM {table_name} LIMIT 5").fetchdf()
-            print(f"\nSample results from {table_name}:")
-            print(result)
+            if source_table in append_only and transform.get('incremental', True) and \
+                    is_decomposable(compiled.aggregates):
+                rows = maintain_aggregate(self.conn, table_name, source_table, compiled.group_by,
+                                          compiled.aggregates, append_only[source_table]['timestamp_column'],
+                                          self.watermarks, compiled.where_literal or None)
+                print(f"Aggregated {rows} new rows into table: {table_name}")
+            else:
+                self.conn.execute(compiled.create_table, compiled.params)
+                print(f"Created transformed table: {table_name}")
+            self.cache.store(self.conn, table_name, fingerprints[table_name])
+            
+            if self.preview_rows:
+                print(f"\nSample results from {table_name}:")
+                print(self.preview(table_name, self.preview_rows))
+        self.compiler.save(keep=self.config['transformations'])
+    
+    def preview(self, table_name: str, rows: int = 5) -> duckdb.DuckDBPyRelation:
+        """The first rows of a table as a lazy relation; nothing runs until it is shown"""
+        return self.conn.table(table_name).limit(rows)
     
     def serve(self):
         dashboard_config = {
@@ -140,6 +187,8 @@ class TemplateDataStack:
 example_config = """
 sources:
   - table: raw_sales
+    incremental: true
+    timestamp_column: sale_date
     
 transformations:
   - output_table: sales_daily
@@ -185,14 +234,12 @@ def run_template_stack():
     print(f"Created config file at {config_path}")
     
     # Run stack with config
-    stack = TemplateDataStack(config_path)
+    stack = TemplateDataStack(config_path, preview_rows=5)
     stack.ingest()
     stack.transform()
     stack.serve()
 
 if __name__ == "__main__":
-    import numpy as np  # Added import for random data generation
-    
     # Create necessary directories
     Path('dashboards').mkdir(exist_ok=True)
     
@@ -1,11 +1,16 @@
 from typing import Dict, List, Optional
-import duckdb
+import threading
 import yaml
 from pathlib import Path
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from abc import ABC, abstractmethod
+from dag import DependencyDAG
+from storage import StorageConfig, connect
+
+# Notifications this close together are refreshed as one burst; see StateManager
+DEFAULT_DEBOUNCE_SECONDS = 0.5
 
 class DataSource(ABC):
     """Abstract base class for data sources"""
@@ -33,12 +38,29 @@ class DeclarativeStack:
     1. Continuous updates vs one-time generation
     2. True declarative interface
     3. Better testing support
+
+    Change notifications are debounced by `debounce_seconds`, taken from the
+    argument, else the config's `debounce_seconds`, else
+    DEFAULT_DEBOUNCE_SECONDS. Pass 0 to refresh on every notification.
     """
-    def __init__(self, config_path: str):
-        self.conn = duckdb.connect(':memory:')
+    def __init__(self, config_path: str, storage: Optional[StorageConfig] = None,
+                 debounce_seconds: Optional[float] = None):
+        self.conn = connect(storage)
+        self._local = threading.local()
         self.config = self._load_config(config_path)
-        self.state_manager = StateManager()
+        if debounce_seconds is None:
+            debounce_seconds = self.config.get('debounce_seconds', DEFAULT_DEBOUNCE_SECONDS)
+        self.state_manager = StateManager(debounce_seconds)
         self.dependency_graph = DependencyGraph()
+        for transform in self.config['transformations']:
+            self.dependency_graph.add_dependency(transform['source_table'], transform['output_table'])
+        
+    def _cursor(self):
+        """Per-thread cursor on the shared database; debounced refreshes run on a timer thread"""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.conn.cursor()
+        return cursor
         
     def _load_config(self, config_path: str) -> dict:
         with open(config_path) as f:
@@ -72,51 +94,116 @@ class DeclarativeStack:
                 self._update_transform(change)
                 
     def _refresh_data(self, data_changes: List[str]):
-        """Refresh data for affected tables"""
+        """Refresh data for affected tables, parents before children"""
         affected_tables = self.dependency_graph.get_affected_tables(data_changes)
+        transforms = {t['output_table']: t for t in self.config['transformations']}
         for table in affected_tables:
-            self._refresh_table(table)
+            # Changed source tables already hold their new data
+            if table in transforms:
+                self._refresh_table(transforms[table])
+                
+    def _refresh_table(self, transform: Dict):
+        """Rebuild a transformation's output table"""
+        group_by = transform.get('group_by', [])
+        select_parts = list(group_by)
+        for metric in transform['metrics']:
+            select_parts.append(f"{metric['agg']}({metric['column']}) as {metric['name']}")
+        query = f"""
+            CREATE OR REPLACE TABLE {transform['output_table']} AS
+            SELECT {', '.join(select_parts)}
+            FROM {transform['source_table']}
+            {f"GROUP BY {', '.join(str(i+1) for i in range(len(group_by)))}" if group_by else ''}
+        """
+        self._cursor().execute(query)
+        print(f"Refreshed table: {transform['output_table']}")
 
 class StateManager:
-    """Manages the state of the data stack"""
-    def __init__(self):
+    """Manages the state of the data stack
+    
+    Notifications arriving within `debounce_seconds` of each other are
+    coalesced into a single callback, so a burst of upstream changes
+    triggers one refresh instead of one per change.
+    """
+    def __init__(self, debounce_seconds: float = 0.0):
         self.state = {}
         self.callbacks = []
+        self.debounce_seconds = debounce_seconds
+        self._pending: Dict = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
         
     def register_callback(self, callback):
         self.callbacks.append(callback)
         
     def update_state(self, changes: Dict):
         """Update state and notify callbacks"""
-        self.state.update(changes)
+        with self._lock:
+            self.state.update(changes)
+            self._coalesce(changes)
+            if self.debounce_seconds <= 0:
+                pending, self._pending = self._pending, {}
+            else:
+                # Restart the window so a steady burst is delivered once it settles
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = threading.Timer(self.debounce_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self._notify(pending)
+        
+    def flush(self):
+        """Deliver pending changes now instead of waiting for the debounce window"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, {}
+        if pending:
+            self._notify(pending)
+            
+    def _coalesce(self, changes: Dict):
+        for key, value in changes.items():
+            if key == 'data':
+                # Deduplicate changed tables, keeping first-seen order
+                known = self._pending.setdefault('data', [])
+                known.extend(table for table in value if table not in known)
+            elif key == 'config':
+                self._pending.setdefault('config', []).extend(value)
+            else:
+                self._pending[key] = value
+                
+    def _notify(self, changes: Dict):
         for callback in self.callbacks:
             callback(changes)
 
 class DependencyGraph:
-    """Manages dependencies between data objects"""
+    """Manages dependencies between data objects
+    
+    Backed by the shared DependencyDAG, which caches the topological order
+    and the descendants of every node until the graph is edited.
+    """
     def __init__(self):
-        self.dependencies = {}
+        self._dag = DependencyDAG()
+        
+    @property
+    def dependencies(self) -> Dict[str, set]:
+        return {node: set(self._dag.children(node)) for node in self._dag.nodes}
         
     def add_dependency(self, source: str, target: str):
-        if source not in self.dependencies:
-            self.dependencies[source] = set()
-        self.dependencies[source].add(target)
+        self._dag.add_edge(source, target)
+        
+    def topological_order(self) -> List[str]:
+        """All nodes, parents before children"""
+        return self._dag.topological_order()
         
     def get_affected_tables(self, changed_tables: List[str]) -> List[str]:
-        """Get all tables affected by changes"""
-        affected = set(changed_tables)
-        for table in changed_tables:
-            affected.update(self._get_descendants(table))
-        return list(affected)
+        """Get all tables affected by changes, in dependency order"""
+        return self._dag.affected(changed_tables)
         
     def _get_descendants(self, node: str) -> set:
         """Get all descendants of a node"""
-        descendants = set()
-        if node in self.dependencies:
-            for child in self.dependencies[node]:
-                descendants.add(child)
-                descendants.update(self._get_descendants(child))
-        return descendants
+        return self._dag.descendants(node)
 
 class TestManager:
     """Manages test cases and validation"""
@@ -1,12 +1,29 @@
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Set, Union
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import json
+import os
+import re
+import sys
+import threading
 import yaml
 import duckdb
-import pandas as pd
-from datetime import datetime
-import numpy as np
 from pathlib import Path
+from arrow_io import write_parquet
+from dag import DependencyDAG
+from incremental import WatermarkStore, ingest_incremental, is_decomposable, maintain_aggregate
+from materialization_cache import (MaterializationCache, fingerprint, normalize_sql, table_fingerprint,
+                                   watermark_fingerprint)
+from partitions import (PartitionSpec, PartitionStatus, partition_fingerprints, refresh_partitions,
+                        stale_partitions)
+from planner import plan_inlined, prepare_relation
+from profiler import MONITORING_METRICS, Profiler
+from query_service import ConnectionPool, QueryService
+from rollups import build_rollups, load_metrics_views, model_query, plan_rollups, write_rill_files
+from serving_cache import ServingCache, parse_interval
+from sql_analysis import SQLAnalysisError, analyze
+from storage import StorageConfig, connect
 
 # Existing types from previous implementation...
 class DataType(Enum):
@@ -15,6 +32,58 @@ class DataType(Enum):
     STRING = "string"
     TIMESTAMP = "timestamp"
 
+_DUCKDB_TYPES = {
+    DataType.INTEGER: "INTEGER",
+    DataType.FLOAT: "DOUBLE",
+    DataType.STRING: "VARCHAR",
+    DataType.TIMESTAMP: "TIMESTAMP",
+}
+
+def _sql_literal(value: Any) -> str:
+    """Render a filter value as a SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+# Metric queries of the form `SELECT <expression> FROM <table>` can share one scan
+_SCALAR_METRIC = re.compile(r'^\s*select\s+(?P<expr>.+?)\s+from\s+(?P<table>[\w.]+)\s*;?\s*$',
+                            re.IGNORECASE | re.DOTALL)
+
+def _has_top_level_comma(expr: str) -> bool:
+    depth = 0
+    in_string = False
+    for char in expr:
+        if char == "'":
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            return True
+    return False
+
+def _plan_metric_batches(metrics: List['Metric']) -> Dict[Optional[str], List['Metric']]:
+    """Group metrics by the table they scan.
+
+    Metrics that aren't a single expression over a single table are returned
+    under the `None` key and run on their own.
+    """
+    batches: Dict[Optional[str], List[Metric]] = {}
+    for metric in metrics:
+        match = _SCALAR_METRIC.match(metric.query)
+        table = None
+        if match and not _has_top_level_comma(match.group('expr')):
+            table = match.group('table').lower()
+        batches.setdefault(table, []).append(metric)
+    return batches
+
 # New visualization-specific types
 class ChartType(Enum):
     LINE = "line"
@@ -39,6 +108,11 @@ class DataSource:
     schema: Schema
     refresh_interval: str
     retention_period: str
+    query: Optional[str] = None  # SQL producing the source rows, like `config.query` in data-stack-config.yaml
+    incremental: bool = False  # Only ingest rows newer than the last load's watermark
+    timestamp_column: Optional[str] = None
+    unique_key: Optional[List[str]] = None  # Merge on these columns instead of appending
+    partition: Optional[PartitionSpec] = None  # Lets individual partitions be reloaded by backfill()
 
 @dataclass
 class Transformation:
@@ -49,6 +123,9 @@ class Transformation:
     aggregations: Optional[Dict[str, List[str]]] = None
     filters: Optional[Dict[str, Any]] = None
     joins: Optional[List[Dict[str, Any]]] = None
+    time_grain: Optional[str] = None  # e.g. "day": truncate timestamp group keys
+    persistent: bool = False  # Always materialize, even when a single transformation reads it
+    partition: Optional[PartitionSpec] = None  # Build, track and backfill the output per partition
 
 # New serving-related classes
 @dataclass
@@ -85,13 +162,28 @@ class Pipeline:
     sources: List[DataSource]
     transformations: List[Transformation]
     serving: ServingLayer
+    rill_project: Optional[str] = None  # Rill project whose metrics views get rollup cubes
+
+    def validate(self, catalog: Optional[Dict[str, Set[str]]] = None) -> bool:
+        """Validate the entire pipeline declaratively.
 
-    def validate(self) -> bool:
-        """Validate the entire pipeline declaratively"""
-        # Build and validate dependency graph
-        dependency_graph = self._build_dependency_graph()
+        `catalog` maps tables that already exist in the database, which the
+        pipeline may read without declaring them, to their columns; names
+        are lower-cased.
+        """
+        catalog = catalog or {}
+        # Build and validate dependency graph, including what the dashboards read
+        dependency_graph = self._build_lineage_graph()
         if self._has_cycles(dependency_graph):
             raise ValueError("Pipeline contains cyclic dependencies")
+            
+        for transform in self.transformations:
+            self._validate_schema_compatibility(transform, catalog)
+            
+        # Validate serving layer
+        self._validate_serving_layer(catalog)
+        
+        return True
 
     def _build_dependency_graph(self) -> Dict[str, List[str]]:
         """Build a graph of dependencies between transformations"""
@@ -110,42 +202,47 @@ class Pipeline:
         return graph
 
     def _has_cycles(self, graph: Dict[str, List[str]]) -> bool:
-        """Check if the dependency graph has cycles using DFS"""
-        visited = set()
-        rec_stack = set()
-
-        def is_cyclic_util(node: str) -> bool:
-            visited.add(node)
-            rec_stack.add(node)
-
-            for neighbor in graph.get(node, []):
-                if neighbor not in visited:
-                    if is_cyclic_util(neighbor):
-                        return True
-                elif neighbor in rec_stack:
-                    return True
-
-            rec_stack.remove(node)
-            return False
+        """Check if the dependency graph has cycles"""
+        return DependencyDAG.from_adjacency(graph).has_cycle()
 
-        for node in graph:
-            if node not in visited:
-                if is_cyclic_util(node):
-                    return True
-        return False
-            
-        for transform in self.transformations:
-            self._validate_schema_compatibility(transform)
-            
-        # Validate serving layer
-        self._validate_serving_layer()
-        
-        return True
+    def _build_lineage_graph(self) -> Dict[str, List[str]]:
+        """Dependency graph extended with `dashboard:<name>` nodes fed by the tables their queries read"""
+        graph = self._build_dependency_graph()
+        for dashboard in self.serving.dashboards:
+            node = f"dashboard:{dashboard.name}"
+            for query in [m.query for m in dashboard.metrics] + [c.query for c in dashboard.charts]:
+                try:
+                    tables = analyze(query).tables
+                except SQLAnalysisError:
+                    continue
+                for table in tables:
+                    if node not in graph.setdefault(table, []):
+                        graph[table].append(node)
+        return graph
+
+    def _validate_schema_compatibility(self, transform: Transformation, catalog: Dict[str, Set[str]]) -> None:
+        """Check that a transformation's inputs exist and provide the columns it aggregates"""
+        columns = {source.name: {col.name for col in source.schema.columns} for source in self.sources}
+        columns.update({t.output: {col.name for col in t.schema.columns} for t in self.transformations})
+        input_columns = set()
+        for input_table in transform.inputs:
+            if input_table in columns:
+                input_columns |= columns[input_table]
+            elif input_table.lower() in catalog:
+                input_columns |= catalog[input_table.lower()]
+            else:
+                raise ValueError(f"Transformation {transform.name} reads unknown table {input_table}")
+
+        for func, cols in (transform.aggregations or {}).items():
+            for col in cols:
+                if col != '*' and col not in input_columns:
+                    raise ValueError(f"Transformation {transform.name} aggregates unknown column {col}")
     
-    def _validate_serving_layer(self) -> None:
+    def _validate_serving_layer(self, catalog: Dict[str, Set[str]]) -> None:
         """Validate that all queries in serving layer reference valid tables"""
         available_tables = {source.name for source in self.sources}
         available_tables.update(transform.output for transform in self.transformations)
+        available_tables.update(catalog)
         
         for dashboard in self.serving.dashboards:
             # Validate metrics
@@ -159,65 +256,634 @@ class Pipeline:
                     raise ValueError(f"Invalid query in chart {chart.name}")
     
     def _validate_query(self, query: str, available_tables: set) -> bool:
-        """Simple validation that query only references available tables"""
-        # This is a simplified validation - in practice you'd want to parse the SQL
-        query_lower = query.lower()
-        for table in available_tables:
-            query_lower = query_lower.replace(table.lower(), '')
-        
-        # Check if any table-like words remain in FROM or JOIN clauses
-        # This is a very simple check - in practice you'd want proper SQL parsing
-        remaining_query = query_lower.split('from')[-1]
-        suspicious_words = ['select', 'from', 'join']
-        return not any(word in remaining_query for word in suspicious_words)
+        """Check that a query parses and only reads available tables"""
+        try:
+            lineage = analyze(query)
+        except SQLAnalysisError:
+            return False
+        return lineage.tables <= {table.lower() for table in available_tables}
 
 class DeclarativeEngine:
     """Engine that interprets and executes declarative specifications"""
     
-    def __init__(self):
-        self.conn = duckdb.connect(':memory:')
+    def __init__(self, max_parallelism: Optional[int] = None, state_dir: str = '.ddse',
+                 storage: Optional[StorageConfig] = None):
+        self.storage = storage or StorageConfig()
+        self.conn = connect(self.storage)
+        # Independent nodes of the DAG run concurrently, each worker on its own cursor
+        self.max_parallelism = max_parallelism or (storage and storage.threads) or os.cpu_count() or 1
+        self._local = threading.local()
+        self.state_dir = Path(state_dir)
+        self.watermarks = WatermarkStore(self.state_dir / 'watermarks.json')
+        self.cache = MaterializationCache(self.state_dir / 'cache')
+        # Fingerprints of every table built in this run, see materialization_cache
+        self._fingerprints: Dict[str, str] = {}
+        self._sources: Dict[str, DataSource] = {}
+        # Tables reading each table, as in Pipeline._build_dependency_graph
+        self._readers: Dict[str, List[str]] = {}
+        # Columns each table needs to keep, keyed by lower-cased table name; see _plan_projections
+        self._projections: Dict[str, Optional[Set[str]]] = {}
+        # Transformation outputs created as views instead of tables; see planner
+        self._inlined: Set[str] = set()
+        self.serving_cache = ServingCache(self.state_dir / 'serving_cache.json')
+        self.partitions = PartitionStatus(self.state_dir / 'partitions.json')
+        # Spans of every node of the last run, exported as an OTLP trace; see profiler
+        self.profiler = Profiler(self.state_dir / 'traces')
+        self.monitoring: List[str] = list(MONITORING_METRICS)
+
+    @classmethod
+    def from_stack_config(cls, config_path: str, database: str = ':memory:') -> 'DeclarativeEngine':
+        """Create an engine sized by `resources.compute` of a data-stack-config.yaml.
+
+        The run reports the `monitoring.metrics` the file lists.
+        """
+        engine = cls(storage=StorageConfig.from_stack_config(config_path, database=database))
+        with open(config_path) as f:
+            monitoring = (yaml.safe_load(f) or {}).get('monitoring') or {}
+        metrics = [m.get('type') for m in monitoring.get('metrics') or []]
+        unknown = [m for m in metrics if m not in MONITORING_METRICS]
+        if unknown:
+            raise ValueError(f"Unknown monitoring metric(s) {unknown}, expected one of {list(MONITORING_METRICS)}")
+        engine.monitoring = metrics
+        return engine
+
+    def _catalog(self) -> Dict[str, Set[str]]:
+        """Columns of every table and view already in the database, by lower-cased name"""
+        catalog: Dict[str, Set[str]] = {}
+        for table, column in self.conn.execute(
+                "SELECT table_name, column_name FROM information_schema.columns").fetchall():
+            catalog.setdefault(table.lower(), set()).add(column)
+        return catalog
+
+    def _cursor(self) -> duckdb.DuckDBPyConnection:
+        """Per-thread cursor on the shared database"""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.conn.cursor()
+        return cursor
         
     def execute_pipeline(self, pipeline: Pipeline) -> None:
         """Execute complete pipeline including serving layer"""
-        # Validate entire pipeline
-        pipeline.validate()
-        
-        # Execute data pipeline
-        self._execute_data_pipeline(pipeline)
-        
-        # Generate serving layer
-        self._generate_serving_layer(pipeline.serving)
+        # Validate entire pipeline; inputs it doesn't declare may already exist in the catalog
+        pipeline.validate(self._catalog())
+
+        try:
+            with self.profiler.run('pipeline', parallelism=self.max_parallelism):
+                # Execute data pipeline
+                self._execute_data_pipeline(pipeline)
+                if pipeline.rill_project:
+                    self._build_rollups(Path(pipeline.rill_project))
+
+                # Generate serving layer
+                self._generate_serving_layer(pipeline.serving)
+        finally:
+            self._report_run(pipeline)
+
+    def _report_run(self, pipeline: Pipeline) -> None:
+        """Profile the slowest nodes, attach the monitoring metrics and export the trace"""
+        root = next(span for span in self.profiler.spans if span.kind == 'pipeline')
+        if not root.error and self.profiler.profile_slowest:
+            self.profiler.profile(self.conn)
+        freshness = None
+        if 'data_freshness' in self.monitoring:
+            # Seconds since the newest row of each source with a timestamp column
+            freshness = {}
+            for source in pipeline.sources:
+                if not source.timestamp_column:
+                    continue
+                try:
+                    age = self.conn.execute(
+                        f"SELECT epoch(now()::TIMESTAMP) - epoch(max({source.timestamp_column})::TIMESTAMP) "
+                        f"FROM {source.name}").fetchone()[0]
+                except duckdb.Error:
+                    continue
+                if age is not None:
+                    freshness[source.name] = round(age, 3)
+        metrics = {name: value for name, value in self.profiler.monitoring_metrics(freshness).items()
+                   if name in self.monitoring}
+        for name, value in metrics.items():
+            if isinstance(value, dict):
+                root.set(**{f"monitoring.{name}.{key}": v for key, v in value.items()})
+            else:
+                root.set(**{f"monitoring.{name}": value})
+
+        print(self.profiler.summary())
+        print(f"Monitoring: {metrics}")
+        print(f"Trace written to {self.profiler.export()}")
     
     def _execute_data_pipeline(self, pipeline: Pipeline) -> None:
         """Execute data ingestion and transformation"""
-        # Create sources
+        self._sources = {source.name: source for source in pipeline.sources}
+        self._readers = pipeline._build_dependency_graph()
+        self._plan_projections(pipeline)
+        self._plan_materializations(pipeline)
+        if self.max_parallelism == 1:
+            # Create sources
+            for source in pipeline.sources:
+                self._run_node(self._create_source, source)
+
+            # Execute transformations in dependency order
+            ordered_transforms = self._topological_sort(pipeline)
+            for transform in ordered_transforms:
+                self._run_node(self._execute_transformation, transform)
+            return
+
+        self._execute_dag(pipeline)
+
+    def _run_node(self, func, spec: Union[DataSource, Transformation]) -> None:
+        """Build one source or transformation inside a profiler span"""
+        if isinstance(spec, Transformation):
+            name, kind, inputs = spec.output, 'transformation', spec.inputs
+            attributes = {'node': spec.name, 'inlined': spec.output in self._inlined}
+        else:
+            name, kind, inputs, attributes = spec.name, 'source', [], {}
+        with self.profiler.span(name, kind, inputs=inputs, **attributes) as span:
+            # Only a query that ran in full is worth profiling; skipped and incremental nodes return None
+            span.statement = func(spec)
+            self.profiler.record_tables(self._cursor(), span, inputs, name)
+
+    def _execute_dag(self, pipeline: Pipeline) -> None:
+        """Run sources and transformations on a worker pool.
+
+        A node is submitted as soon as all of its inputs have finished, so
+        independent branches of the graph are built at the same time.
+        """
+        graph = pipeline._build_dependency_graph()
+        tasks = {source.name: (self._create_source, source) for source in pipeline.sources}
+        tasks.update({t.output: (self._execute_transformation, t) for t in pipeline.transformations})
+
+        # Inputs that are neither a source nor a transformation already exist in the catalog
+        waiting_on = {name: set() for name in tasks}
+        for transform in pipeline.transformations:
+            waiting_on[transform.output] = {i for i in transform.inputs if i in tasks}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallelism,
+                                thread_name_prefix='ddse-node') as pool:
+            running = {}
+
+            def submit_ready():
+                for node in [n for n, deps in waiting_on.items() if not deps]:
+                    del waiting_on[node]
+                    func, spec = tasks[node]
+                    running[pool.submit(self._run_node, func, spec)] = node
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    future.result()  # Propagate the first failing node
+                    for child in graph.get(node, []):
+                        if child in waiting_on:
+                            waiting_on[child].discard(node)
+                submit_ready()
+
+        if waiting_on:
+            raise ValueError(f"Unschedulable nodes (cyclic dependencies?): {sorted(waiting_on)}")
+
+    def _topological_sort(self, pipeline: Pipeline) -> List[Transformation]:
+        """Order transformations level by level so every input is built first.
+
+        Raises CycleError (a ValueError) naming the cycle if there is one.
+        """
+        by_output = {t.output: t for t in pipeline.transformations}
+        dag = DependencyDAG.from_adjacency(pipeline._build_dependency_graph())
+        return [by_output[name] for name in dag.topological_order() if name in by_output]
+
+    def _plan_projections(self, pipeline: Pipeline) -> None:
+        """Work out which columns of each table anything downstream reads.
+
+        Column lineage is traced from the serving queries back through the
+        transformations to the sources, resolving each query's column
+        references against the declared schemas. Tables nothing reads keep
+        all their columns, as they are outputs in their own right, and so do
+        aggregating transformations, whose shape is fixed by their grain.
+        """
+        schemas = {source.name: [col.name for col in source.schema.columns] for source in pipeline.sources}
+        schemas.update({t.output: [col.name for col in t.schema.columns] for t in pipeline.transformations})
+        consumed: Dict[str, Optional[Set[str]]] = {}
+
+        def consume(query: str) -> None:
+            try:
+                used = analyze(query).columns_by_table(schemas)
+            except SQLAnalysisError:
+                used = {name.lower(): None for name in schemas}
+            for table, columns in used.items():
+                if columns is None or consumed.get(table, set()) is None:
+                    consumed[table] = None
+                else:
+                    consumed[table] = consumed.get(table, set()) | columns
+
+        for dashboard in pipeline.serving.dashboards:
+            for query in [m.query for m in dashboard.metrics] + [c.query for c in dashboard.charts]:
+                consume(query)
+
+        self._projections = {}
+        # Consumers first, so each transformation's own projection is known before it is parsed
+        for transform in reversed(self._topological_sort(pipeline)):
+            if not transform.aggregations and transform.output.lower() in consumed:
+                self._projections[transform.output.lower()] = consumed[transform.output.lower()]
+            consume(self._build_transformation_query(transform))
         for source in pipeline.sources:
-            self._create_source(source)
-            
-        # Execute transformations in dependency order
-        ordered_transforms = self._topological_sort(pipeline)
-        for transform in ordered_transforms:
-            self._execute_transformation(transform)
+            if source.name.lower() in consumed:
+                self._projections[source.name.lower()] = consumed[source.name.lower()]
+
+    def _plan_materializations(self, pipeline: Pipeline) -> None:
+        """Decide which transformation outputs are inlined as views"""
+        served = set()
+        for dashboard in pipeline.serving.dashboards:
+            for query in [m.query for m in dashboard.metrics] + [c.query for c in dashboard.charts]:
+                try:
+                    served |= analyze(query).tables
+                except SQLAnalysisError:
+                    continue
+        self._inlined = plan_inlined({t.output: t.inputs for t in pipeline.transformations}, served,
+                                     [t.output for t in pipeline.transformations
+                                      if t.persistent or t.partition])
+
+    def _projected_columns(self, name: str, schema: Schema, keep: List[str] = ()) -> Optional[List[str]]:
+        """Declared columns of `name` that are read downstream, or None to keep them all"""
+        needed = self._projections.get(name.lower())
+        if needed is None:
+            return None
+        needed = needed | {column.lower() for column in keep}
+        selected = [col.name for col in schema.columns if col.name.lower() in needed]
+        if len(selected) == len(schema.columns):
+            return None
+        # A table read only by count(*) still needs one column
+        return selected or [schema.columns[0].name]
+
+    def _create_source(self, source: DataSource) -> Optional[str]:
+        """Create a source table from its query, or empty from its schema.
+
+        Returns the query when the table was loaded from it in full.
+        """
+        conn = self._cursor()
+        keep = [col for col in [source.timestamp_column] + (source.unique_key or []) if col]
+        projected = self._projected_columns(source.name, source.schema, keep)
+        query = source.query
+        if query and projected:
+            query = f"SELECT {', '.join(projected)} FROM ({query})"
+        note = f" ({len(projected)} of {len(source.schema.columns)} columns)" if projected else ''
+
+        if query and source.incremental:
+            if not source.timestamp_column:
+                raise ValueError(f"Incremental source {source.name} needs a timestamp_column")
+            existing = {row[0].lower() for row in conn.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [source.name]
+            ).fetchall()}
+            expected = {column.lower() for column in projected or [col.name for col in source.schema.columns]}
+            if existing and (expected - existing or (projected and existing != expected)):
+                # The columns read downstream changed, so reload rather than append to a stale shape
+                self.watermarks.clear(source.name)
+            rows = ingest_incremental(conn, source.name, query, source.timestamp_column,
+                                      self.watermarks, source.unique_key)
+            print(f"Ingested {rows} new rows into source: {source.name}{note}")
+            if source.partition:
+                self._reload_source_partitions(source, query)
+        elif query:
+            conn.execute(f"CREATE OR REPLACE TABLE {source.name} AS {query}")
+            print(f"Created source: {source.name}{note}")
+            if source.partition:
+                # A full load has just re-read every partition
+                self.partitions.forget(source.name)
+        else:
+            columns = ', '.join(
+                f"{col.name} {_DUCKDB_TYPES[col.type]}{'' if col.nullable else ' NOT NULL'}"
+                for col in source.schema.columns
+                if projected is None or col.name in projected
+            )
+            conn.execute(f"CREATE OR REPLACE TABLE {source.name} ({columns})")
+            print(f"Created source: {source.name}{note}")
+        full_load = query if query and not source.incremental else None
+        if query and source.incremental:
+            # No scan of the history: new rows move the watermark, reloaded partitions the status
+            generation = json.dumps(self.partitions.get(source.name), sort_keys=True) if source.partition else ''
+            self._fingerprints[source.name] = watermark_fingerprint(conn, source.name,
+                                                                    self.watermarks.get(source.name), generation)
+        else:
+            self._fingerprints[source.name] = table_fingerprint(conn, source.name)
+        return full_load
+
+    def _reload_source_partitions(self, source: DataSource, query: str) -> None:
+        """Re-read invalidated partitions of an incremental source from its query"""
+        invalid = sorted(key for key, entry in self.partitions.get(source.name).items()
+                         if entry.get('status') != 'done')
+        if not invalid:
+            return
+        # Rows behind the watermark are about to change, so readers can't trust it to find them:
+        # partitioned readers hash every partition and maintained aggregates rebuild in full
+        for reader in self._readers.get(source.name, []):
+            self.watermarks.clear(f"{reader}__partitions")
+            self.watermarks.clear(f"{reader}__state")
+        spec = source.partition
+        written = refresh_partitions(
+            self._cursor, source.name, spec,
+            lambda key: f"SELECT * FROM ({query}) WHERE {spec.predicate(key)}",
+            {key: 'reloaded' for key in invalid}, invalid, self.partitions, self.max_parallelism
+        )
+        print(f"Reloaded {len(invalid)} partitions ({sum(written.values())} rows) of source: {source.name}")
+
+    def _aggregation_plan(self, transform: Transformation):
+        """Group-key select expressions and (name, function, column) aggregates.
+
+        The trailing schema columns receive the aggregates in declaration
+        order and the leading ones are the group keys.
+        """
+        columns = transform.schema.columns
+        aggregates = [(func.upper(), col)
+                      for func, cols in transform.aggregations.items()
+                      for col in cols]
+        key_columns = columns[:len(columns) - len(aggregates)]
+        keys = []
+        for col in key_columns:
+            expr = col.name
+            if transform.time_grain and col.type == DataType.TIMESTAMP:
+                expr = f"date_trunc('{transform.time_grain}', {col.name})"
+            keys.append((expr, col.name))
+        named = [(col.name, func, arg) for col, (func, arg) in zip(columns[len(key_columns):], aggregates)]
+        return keys, named
+
+    def _filter_clause(self, transform: Transformation) -> Optional[str]:
+        if not transform.filters:
+            return None
+        return ' AND '.join(f"{col} = {_sql_literal(value)}" for col, value in transform.filters.items())
+
+    def _build_transformation_query(self, transform: Transformation, partition: Optional[str] = None) -> str:
+        """Generate the SELECT for a transformation, or for one partition of its output"""
+        group_keys = []
+        if transform.aggregations:
+            keys, aggregates = self._aggregation_plan(transform)
+            group_keys = [expr for expr, _ in keys]
+            select_parts = [f"{expr} AS {name}" for expr, name in keys]
+            select_parts += [f"{func}({arg}) AS {name}" for name, func, arg in aggregates]
+        else:
+            select_parts = (self._projected_columns(transform.output, transform.schema)
+                            or [col.name for col in transform.schema.columns])
+
+        query = f"SELECT {', '.join(select_parts)} FROM {transform.inputs[0]}"
+        for join in transform.joins or []:
+            query += f" {join.get('type', 'inner').upper()} JOIN {join['table']} ON {join['on']}"
+        conditions = [self._filter_clause(transform)] if transform.filters else []
+        if partition is not None:
+            conditions.append(transform.partition.predicate(partition, qualifier=transform.inputs[0]))
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        if group_keys:
+            query += f" GROUP BY {', '.join(group_keys)} ORDER BY {', '.join(group_keys)}"
+        return query
+
+    def _append_only_source(self, transform: Transformation) -> Optional[DataSource]:
+        """The transformation's source, if its aggregate can be maintained from new rows only"""
+        if not transform.aggregations or transform.joins or len(transform.inputs) != 1:
+            return None
+        source = self._sources.get(transform.inputs[0])
+        if source is None or not source.incremental or source.unique_key:
+            return None
+        _, aggregates = self._aggregation_plan(transform)
+        return source if is_decomposable(aggregates) else None
+
+    def _execute_transformation(self, transform: Transformation) -> Optional[str]:
+        """Materialize a transformation into its output table, unless it is unchanged.
+
+        Returns the query when the output was rebuilt from it in full.
+        """
+        conn = self._cursor()
+        query = self._build_transformation_query(transform)
+        input_fingerprints = [self._fingerprints.get(name) or table_fingerprint(conn, name)
+                              for name in transform.inputs]
+        node_fingerprint = fingerprint(query, transform, input_fingerprints)
+        self._fingerprints[transform.output] = node_fingerprint
+
+        if transform.partition:
+            self._execute_partitioned(transform, query, input_fingerprints)
+            return None
+
+        if transform.output in self._inlined:
+            # Its only consumer reads through the view, so nothing is written out
+            prepare_relation(conn, transform.output, view=True)
+            conn.execute(f"CREATE OR REPLACE VIEW {transform.output} AS {query}")
+            self.cache.discard(transform.output)
+            print(f"Inlined transformation: {transform.name} -> {transform.output}")
+            return None
+
+        if self.cache.is_fresh(transform.output, node_fingerprint) and \
+                self.cache.restore(conn, transform.output):
+            print(f"Skipped unchanged transformation: {transform.name} -> {transform.output}")
+            return None
+
+        prepare_relation(conn, transform.output, view=False)
+        source = self._append_only_source(transform)
+        full_build = None
+        if source is not None:
+            keys, aggregates = self._aggregation_plan(transform)
+            rows = maintain_aggregate(conn, transform.output, source.name,
+                                      [f"{expr} AS {name}" for expr, name in keys], aggregates,
+                                      source.timestamp_column, self.watermarks,
+                                      self._filter_clause(transform))
+            print(f"Aggregated {rows} new rows: {transform.name} -> {transform.output}")
+        else:
+            conn.execute(f"CREATE OR REPLACE TABLE {transform.output} AS {query}")
+            full_build = query
+            print(f"Executed transformation: {transform.name} -> {transform.output}")
+        self.cache.store(conn, transform.output, node_fingerprint)
+        return full_build
     
+    def _execute_partitioned(self, transform: Transformation, query: str,
+                             input_fingerprints: List[str]) -> None:
+        """Rebuild only the partitions of a transformation whose input rows changed.
+
+        A partition's input is the matching partition of the first input;
+        any other (joined) input is tracked as a whole, so changing it
+        rebuilds every partition.
+        """
+        conn = self._cursor()
+        spec = transform.partition
+        output = transform.output
+        definition = fingerprint(query, transform)
+        status = self.partitions.get(output)
+        exists = conn.execute(
+            "SELECT count(*) FROM information_schema.tables WHERE table_name = ? AND table_type = 'BASE TABLE'",
+            [output]
+        ).fetchone()[0]
+        if not exists or any(entry.get('definition') != definition for entry in status.values()):
+            prepare_relation(conn, output, view=False)
+            conn.execute(f"CREATE OR REPLACE TABLE {output} AS SELECT * FROM ({query}) LIMIT 0")
+            self.partitions.forget(output)
+            status = {}
+
+        where = self._filter_clause(transform)
+        cutoff = self._partition_cutoff(transform, status)
+        fingerprints = {}
+        if cutoff is not None:
+            # Partitions before the one holding the input's last watermark can't have new rows;
+            # only those that didn't build are hashed again
+            fingerprints = {key: entry['fingerprint'] for key, entry in status.items()
+                            if key < cutoff and entry.get('status') == 'done'}
+            changed = [spec.since(cutoff)] + [spec.predicate(key) for key in status
+                                              if key < cutoff and key not in fingerprints]
+            where = f"({where}) AND ({' OR '.join(changed)})" if where else ' OR '.join(changed)
+        fingerprints.update({
+            key: fingerprint(definition, None, [value] + input_fingerprints[1:])
+            for key, value in partition_fingerprints(conn, transform.inputs[0], spec, where).items()
+        })
+        dropped = [key for key in status if key not in fingerprints]
+        stale = stale_partitions(status, fingerprints)
+        if not stale and not dropped:
+            self._record_partition_watermark(transform)
+            print(f"Skipped unchanged partitions: {transform.name} -> {output}")
+            return
+
+        written = refresh_partitions(
+            self._cursor, output, spec, lambda key: self._build_transformation_query(transform, key),
+            fingerprints, stale + dropped, self.partitions, self.max_parallelism, {'definition': definition}
+        )
+        self._record_partition_watermark(transform)
+        print(f"Rebuilt {len(stale)} of {len(fingerprints)} partitions ({sum(written.values())} rows)"
+              f"{f', dropped {len(dropped)}' if dropped else ''}: {transform.name} -> {output}")
+
+    def _partition_cutoff(self, transform: Transformation, status: Dict[str, dict]) -> Optional[str]:
+        """First partition that can have new input rows since the last build, when that is all that changed.
+
+        Holds for a single append-only incremental source partitioned on its
+        timestamp column; otherwise every partition is hashed.
+        """
+        spec = transform.partition
+        source = self._sources.get(transform.inputs[0])
+        if (not status or spec.grain is None or transform.joins or len(transform.inputs) != 1
+                or source is None or not source.incremental or source.unique_key
+                or source.timestamp_column != spec.column):
+            return None
+        built = self.watermarks.get(f"{transform.output}__partitions")
+        return spec.key_of(built['value']) if built else None
+
+    def _record_partition_watermark(self, transform: Transformation) -> None:
+        """Remember the input watermark a partitioned output is now up to date with"""
+        watermark = self.watermarks.get(transform.inputs[0])
+        if watermark is not None and transform.inputs[0] in self._sources:
+            self.watermarks.set(f"{transform.output}__partitions", watermark['value'], watermark['type'])
+
+    def backfill(self, pipeline: Pipeline, table: str, first: str, last: Optional[str] = None) -> None:
+        """Rebuild partitions `first` to `last` of `table` and of the tables downstream of it.
+
+        Downstream tables partitioned on the same grain have the same
+        partitions invalidated; others pick up the change through their
+        input fingerprints, and aggregates maintained from a reloaded
+        source's new rows are rebuilt in full, as the rewritten rows lie
+        behind their watermark. Partitions outside the range are not
+        rewritten.
+        """
+        specs = {source.name: source.partition for source in pipeline.sources}
+        specs.update({t.output: t.partition for t in pipeline.transformations})
+        spec = specs.get(table)
+        if spec is None:
+            raise ValueError(f"{table} is not a partitioned source or transformation")
+        keys = spec.keys_between(first, last or first)
+        dag = DependencyDAG.from_adjacency(pipeline._build_dependency_graph())
+        self.partitions.invalidate(table, keys)
+        for name in dag.descendants(table):
+            if specs.get(name) and specs[name].grain == spec.grain:
+                self.partitions.invalidate(name, keys)
+        print(f"Backfilling {len(keys)} partition(s) of {table}: {keys[0]} .. {keys[-1]}")
+        self.execute_pipeline(pipeline)
+
+    def _build_rollups(self, project_dir: Path) -> None:
+        """Pre-aggregate every Rill metrics view of the project and point Rill at the rollups.
+
+        A view whose definition and model inputs are unchanged keeps its
+        rollups from the previous run.
+        """
+        for view in load_metrics_views(project_dir):
+            query = model_query(project_dir, view.model)
+            key = ServingCache.make_key(f"rollup:{view.name}", yaml.safe_dump(view.definition) + query,
+                                        self._upstream_fingerprints(query))
+            tables = [rollup.table for rollup in plan_rollups(view)]
+            hit, _ = self.serving_cache.lookup(key, float('inf'))
+            existing = {row[0] for row in self.conn.execute(
+                "SELECT table_name FROM information_schema.tables WHERE table_name IN (SELECT unnest(?))",
+                [tables]).fetchall()}
+            if hit and existing == set(tables):
+                continue
+            try:
+                written = build_rollups(self.conn, view, query)
+            except duckdb.Error as e:
+                print(f"Error building rollups for {view.name}: {e}")
+                continue
+            write_rill_files(self.conn, view, project_dir)
+            print(f"Built {len(written)} rollups for {view.name} "
+                  f"({written[tables[0]]:,} rows in the base cube)")
+            self.serving_cache.put(key, written)
+        self.serving_cache.save()
+
+    def serve(self, serving: ServingLayer, host: str = '127.0.0.1', port: int = 8321,
+              pool_size: int = 4) -> None:
+        """Serve the dashboards' metrics and charts over HTTP from the materialized tables"""
+        service = QueryService(serving.dashboards, self.serving_pool(pool_size))
+        service.run(host, port)
+
+    def serving_pool(self, pool_size: int = 4) -> ConnectionPool:
+        """Read-only connections to the engine's database file, for serving once the pipeline is done.
+
+        DuckDB won't open a file read-only while this process holds it
+        read-write, so the engine's own connection is closed first and the
+        engine can't run pipelines afterwards.
+        """
+        if self.storage.database == ':memory:':
+            raise ValueError("Serving needs a database file; an in-memory database can't be opened read-only")
+        self.conn.close()
+        return ConnectionPool.open(self.storage.database, pool_size)
+
     def _generate_serving_layer(self, serving: ServingLayer) -> None:
         """Generate dashboard configurations and assets"""
         output_dir = Path('dashboards')
         output_dir.mkdir(exist_ok=True)
         
         for dashboard in serving.dashboards:
-            dashboard_config = self._generate_dashboard_config(dashboard)
-            
-            # Save dashboard configuration
-            dashboard_path = output_dir / f"{dashboard.name.lower().replace(' ', '_')}.yaml"
-            with open(dashboard_path, 'w') as f:
-                yaml.dump(dashboard_config, f)
-            
-            # Execute and save metric values
-            metric_values = self._compute_metrics(dashboard.metrics)
-            metric_path = output_dir / f"{dashboard.name.lower().replace(' ', '_')}_metrics.yaml"
-            with open(metric_path, 'w') as f:
-                yaml.dump(metric_values, f)
+            with self.profiler.span(dashboard.name, 'dashboard', metrics=len(dashboard.metrics),
+                                    charts=len(dashboard.charts)):
+                dashboard_config = self._generate_dashboard_config(dashboard)
+
+                # Save dashboard configuration
+                dashboard_path = output_dir / f"{dashboard.name.lower().replace(' ', '_')}.yaml"
+                with open(dashboard_path, 'w') as f:
+                    yaml.dump(dashboard_config, f)
+
+                # Execute and save metric values, reusing results younger than the refresh interval
+                metric_values = self._cached_metrics(dashboard)
+                metric_path = output_dir / f"{dashboard.name.lower().replace(' ', '_')}_metrics.yaml"
+                with open(metric_path, 'w') as f:
+                    yaml.dump(metric_values, f)
+
+                self._export_chart_data(dashboard, output_dir / dashboard.name.lower().replace(' ', '_'))
     
+    def _export_chart_data(self, dashboard: Dashboard, output_dir: Path) -> None:
+        """Stream each chart's result to Parquet in bounded record batches.
+
+        A chart whose query and upstream tables are unchanged within the
+        dashboard's refresh interval keeps its existing file.
+        """
+        ttl = parse_interval(dashboard.refresh_interval)
+        for chart in dashboard.charts:
+            path = output_dir / f"{chart.name.lower().replace(' ', '_')}.parquet"
+            key = ServingCache.make_key(dashboard.name, normalize_sql(chart.query),
+                                        self._upstream_fingerprints(chart.query))
+            hit, rows = self.serving_cache.lookup(key, ttl)
+            cached = hit and path.exists()
+            with self.profiler.span(chart.name, 'chart', statement=None if cached else chart.query,
+                                    cached=cached) as span:
+                if cached:
+                    span.set(rows_out=rows)
+                    continue
+                try:
+                    rows = write_parquet(self.conn, chart.query, path)
+                except duckdb.Error as e:
+                    span.error = str(e)
+                    print(f"Error exporting chart {chart.name}: {e}")
+                    continue
+                span.set(rows_out=rows)
+            self.serving_cache.put(key, rows)
+        self.serving_cache.save()
+
     def _generate_dashboard_config(self, dashboard: Dashboard) -> dict:
         """Generate dashboard configuration"""
         return {
@@ -239,23 +905,85 @@ class DeclarativeEngine:
                     'x_axis': chart.x_axis,
                     'y_axis': chart.y_axis,
                     'color_by': chart.color_by,
-                    'filters': chart.filters
+                    'filters': chart.filters,
+                    'data': f"{dashboard.name.lower().replace(' ', '_')}/{chart.name.lower().replace(' ', '_')}.parquet"
                 }
                 for chart in dashboard.charts
             ]
         }
     
+    def _upstream_fingerprints(self, query: str) -> List[str]:
+        """Fingerprints of the tables a serving query reads"""
+        try:
+            tables = analyze(query).tables
+        except SQLAnalysisError:
+            return []
+        fingerprints = []
+        for table in sorted(tables):
+            if table not in self._fingerprints:
+                try:
+                    self._fingerprints[table] = table_fingerprint(self.conn, table)
+                except duckdb.Error:
+                    continue
+            fingerprints.append(self._fingerprints[table])
+        return fingerprints
+
+    def _cached_metrics(self, dashboard: Dashboard) -> dict:
+        """Metric values for a dashboard, computing only those not fresh in the serving cache"""
+        ttl = parse_interval(dashboard.refresh_interval)
+        values = {}
+        keys = {}
+        stale = []
+        for metric in dashboard.metrics:
+            key = ServingCache.make_key(dashboard.name, normalize_sql(metric.query),
+                                        self._upstream_fingerprints(metric.query))
+            hit, value = self.serving_cache.lookup(key, ttl)
+            if hit:
+                values[metric.name] = value
+            else:
+                keys[metric.name] = key
+                stale.append(metric)
+
+        for name, value in self._compute_metrics(stale).items():
+            values[name] = value
+            if value is not None:
+                self.serving_cache.put(keys[name], value)
+        self.serving_cache.save()
+        return {metric.name: values[metric.name] for metric in dashboard.metrics}
+
     def _compute_metrics(self, metrics: List[Metric]) -> dict:
-        """Compute current values for all metrics"""
+        """Compute current values for all metrics, one scan per source table"""
         values = {}
-        for metric in metrics:
+        for table, batch in _plan_metric_batches(metrics).items():
+            if table is None or len(batch) == 1:
+                for metric in batch:
+                    values[metric.name] = self._compute_metric(metric)
+                continue
+
+            expressions = [_SCALAR_METRIC.match(metric.query).group('expr') for metric in batch]
+            fused = f"SELECT {', '.join(f'{expr} AS m{i}' for i, expr in enumerate(expressions))} FROM {table}"
             try:
-                result = self.conn.execute(metric.query).fetchone()[0]
+                with self.profiler.span(f"metrics:{table}", 'metric', statement=fused, inputs=[table],
+                                        metrics=[metric.name for metric in batch]):
+                    row = self.conn.execute(fused).fetchone()
+            except Exception:
+                # One bad metric fails the fused query; isolate it by running each on its own
+                for metric in batch:
+                    values[metric.name] = self._compute_metric(metric)
+                continue
+            for metric, result in zip(batch, row):
                 values[metric.name] = result
+        # Keep the declared metric order in the output
+        return {metric.name: values[metric.name] for metric in metrics}
+
+    def _compute_metric(self, metric: Metric) -> Any:
+        with self.profiler.span(metric.name, 'metric', statement=metric.query) as span:
+            try:
+                return self.conn.execute(metric.query).fetchone()[0]
             except Exception as e:
+                span.error = str(e)
                 print(f"Error computing metric {metric.name}: {e}")
-                values[metric.name] = None
-        return values
+                return None
 
 # Example usage
 def create_example_pipeline() -> Pipeline:
@@ -271,7 +999,15 @@ def create_example_pipeline() -> Pipeline:
         name="raw_sales",
         schema=sales_schema,
         refresh_interval="1h",
-        retention_period="1y"
+        retention_period="1y",
+        query="""
+            SELECT ts AS sale_date,
+                   (50 + random() * 450)::INTEGER::DOUBLE AS amount,
+                   (1 + random() * 9)::INTEGER AS product_id
+            FROM generate_series(TIMESTAMP '2024-01-01', TIMESTAMP '2024-01-10', INTERVAL 1 HOUR) t(ts)
+        """,
+        incremental=True,
+        timestamp_column="sale_date"
     )
     
     daily_sales_schema = Schema([
@@ -288,7 +1024,8 @@ def create_example_pipeline() -> Pipeline:
         aggregations={
             "sum": ["amount"],
             "count": ["*"]
-        }
+        },
+        time_grain="day"
     )
     
     # Define serving layer
@@ -336,15 +1073,52 @@ def create_example_pipeline() -> Pipeline:
         serving=serving_layer
     )
 
+def create_testing_trends_source() -> DataSource:
+    """Sample rows for the Rill project's model (the SDF mart dm_monthly_testing_positive_trends)"""
+    return DataSource(
+        name="dm_monthly_testing_positive_trends",
+        schema=Schema([
+            Column("month", DataType.TIMESTAMP),
+            Column("country_code", DataType.STRING),
+            Column("monthly_tests", DataType.INTEGER),
+            Column("monthly_cases", DataType.INTEGER),
+            Column("monthly_positivity_rate", DataType.FLOAT),
+        ]),
+        refresh_interval="1d",
+        retention_period="5y",
+        query="""
+            SELECT month, country_code, monthly_tests, monthly_cases,
+                   round(monthly_cases * 100.0 / monthly_tests, 2) AS monthly_positivity_rate
+            FROM (
+                SELECT month, country_code,
+                       (1000 + random() * 9000)::INTEGER AS monthly_tests,
+                       (random() * 1000)::INTEGER AS monthly_cases
+                FROM generate_series(TIMESTAMP '2020-01-01', TIMESTAMP '2022-12-01', INTERVAL 1 MONTH) t(month),
+                     unnest(['DE', 'FR', 'GB', 'IT', 'US']) c(country_code)
+            )
+        """
+    )
+
 if __name__ == "__main__":
     # Create and execute pipeline
     pipeline = create_example_pipeline()
+    if '--rill' in sys.argv:
+        # Pre-aggregate the Rill project's metrics views, over sample rows for its model
+        pipeline.sources.append(create_testing_trends_source())
+        pipeline.rill_project = str(Path(__file__).parent.parent / 'serve')
     
-    engine = DeclarativeEngine()
+    config_path = Path(__file__).parent.parent / 'data-stack-config.yaml'
+    engine = DeclarativeEngine.from_stack_config(config_path, database='.ddse/stack.duckdb')
+    if '--profile' in sys.argv:
+        # Re-run the three slowest full queries under EXPLAIN ANALYZE after the run
+        engine.profiler.profile_slowest = 3
     engine.execute_pipeline(pipeline)
     
     # Show results
     print("\nTransformed Data Sample:")
-    print(engine.conn.execute("SELECT * FROM sales_daily LIMIT 5").fetchdf())
+    print(engine.conn.sql("SELECT * FROM sales_daily LIMIT 5"))
     
     print("\nDashboard files generated in ./dashboards/")
+
+    if '--serve' in sys.argv:
+        engine.serve(pipeline.serving)
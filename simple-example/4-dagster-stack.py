@@ -2,6 +2,7 @@ from dagster import (
     asset,
     AssetIn,
     AutoMaterializePolicy,
+    Config,
     DailyPartitionsDefinition,
     MetadataValue,
     Output,
@@ -10,8 +11,14 @@ from dagster import (
     define_asset_job,
 )
 import duckdb
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from datetime import datetime, timedelta
+from pathlib import Path
+from arrow_io import sample_sales, write_parquet
+
+# raw_sales partitions are handed downstream as Parquet files, never as in-memory tables
+STAGING_DIR = Path('.ddse/dagster')
 
 # Define time partitions for our data
 daily_partitions = DailyPartitionsDefinition(
@@ -19,6 +26,13 @@ daily_partitions = DailyPartitionsDefinition(
     end_date="2024-12-31"
 )
 
+class PreviewConfig(Config):
+    """Opt-in diagnostics; previews convert to pandas, so they stay off the hot path"""
+    preview: bool = False
+
+def _preview(table: pa.Table) -> MetadataValue:
+    return MetadataValue.md(table.slice(0, 5).to_pandas().to_markdown())
+
 # Source data asset
 @asset(
     auto_materialize_policy=AutoMaterializePolicy.eager(),
@@ -29,34 +43,31 @@ daily_partitions = DailyPartitionsDefinition(
         "description": "Raw sales data from source system"
     }
 )
-def raw_sales(context) -> Output[pd.DataFrame]:
-    """Raw sales data ingested from source."""
+def raw_sales(context, config: PreviewConfig) -> Output[str]:
+    """Raw sales data ingested from source; the output is the partition's Parquet file."""
     # In real implementation, this would read from your actual source
     # For demo, we'll generate sample data for the partition
     partition_date = context.partition_key
     
-    # Generate sample data for this partition
-    dates = pd.date_range(
-        start=partition_date,
-        end=pd.Timestamp(partition_date) + timedelta(days=1),
-        freq='H'
-    )
-    
-    df = pd.DataFrame({
-        'sale_date': dates,
-        'amount': np.random.randint(50, 500, size=len(dates)),
-        'product_id': np.random.randint(1, 10, size=len(dates))
-    })
+    # Generate sample data for this partition lazily, in Arrow batches, and stream it
+    # through DuckDB into Parquet, so only one batch is in memory at a time
+    end = (datetime.fromisoformat(partition_date) + timedelta(days=1)).isoformat()
+    reader = sample_sales(partition_date, end)
+    path = STAGING_DIR / 'raw_sales' / f"{partition_date}.parquet"
+    conn = duckdb.connect()
+    conn.register('sample_sales', reader)
+    rows = write_parquet(conn, "SELECT * FROM sample_sales", path)
     
     # Add metadata about the asset
-    return Output(
-        df,
-        metadata={
-            "row_count": len(df),
-            "preview": MetadataValue.md(df.head().to_markdown()),
-            "schema": MetadataValue.json(df.dtypes.astype(str).to_dict())
-        }
-    )
+    metadata = {
+        "row_count": rows,
+        "path": str(path),
+        "schema": MetadataValue.json({field.name: str(field.type) for field in reader.schema})
+    }
+    if config.preview:
+        metadata["preview"] = _preview(conn.execute("SELECT * FROM read_parquet(?) LIMIT 5", [str(path)]).arrow())
+    conn.close()
+    return Output(str(path), metadata=metadata)
 
 # Transformed data asset
 @asset(
@@ -68,28 +79,30 @@ def raw_sales(context) -> Output[pd.DataFrame]:
         "description": "Daily aggregated sales metrics"
     }
 )
-def sales_daily(context, raw_sales: pd.DataFrame) -> Output[pd.DataFrame]:
+def sales_daily(context, config: PreviewConfig, raw_sales: str) -> Output[pa.Table]:
     """Daily sales aggregations."""
-    # Perform aggregations
-    daily_sales = raw_sales.groupby(
-        pd.Grouper(key='sale_date', freq='D')
-    ).agg({
-        'amount': ['sum', 'count']
-    }).reset_index()
-    
-    # Clean up column names
-    daily_sales.columns = ['sale_date', 'daily_sales', 'transaction_count']
+    # DuckDB streams the partition's Parquet file; only the small aggregate comes back, as Arrow
+    conn = duckdb.connect()
+    daily_sales = conn.execute("""
+        SELECT
+            date_trunc('day', sale_date)::TIMESTAMP AS sale_date,
+            SUM(amount)::BIGINT AS daily_sales,
+            COUNT(amount) AS transaction_count
+        FROM read_parquet(?)
+        GROUP BY 1
+        ORDER BY 1
+    """, [raw_sales]).arrow()
+    conn.close()
     
     # Add metadata about the transformation
-    return Output(
-        daily_sales,
-        metadata={
-            "row_count": len(daily_sales),
-            "total_sales": float(daily_sales['daily_sales'].sum()),
-            "total_transactions": int(daily_sales['transaction_count'].sum()),
-            "preview": MetadataValue.md(daily_sales.head().to_markdown())
-        }
-    )
+    metadata = {
+        "row_count": daily_sales.num_rows,
+        "total_sales": float(pc.sum(daily_sales['daily_sales']).as_py() or 0),
+        "total_transactions": int(pc.sum(daily_sales['transaction_count']).as_py() or 0)
+    }
+    if config.preview:
+        metadata["preview"] = _preview(daily_sales)
+    return Output(daily_sales, metadata=metadata)
 
 # Dashboard asset (using Rill)
 @asset(
@@ -100,7 +113,7 @@ def sales_daily(context, raw_sales: pd.DataFrame) -> Output[pd.DataFrame]:
         "description": "Sales overview dashboard configuration"
     }
 )
-def sales_dashboard(context, sales_daily: pd.DataFrame) -> Output[dict]:
+def sales_dashboard(context, sales_daily: pa.Table) -> Output[dict]:
     """Generate dashboard configuration for Rill."""
     dashboard_config = {
         'title': 'Sales Overview',
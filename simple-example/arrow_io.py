@@ -0,0 +1,66 @@
+"""Arrow interchange between pipeline stages.
+
+Sources hand DuckDB a pyarrow RecordBatchReader, which it scans batch by
+batch without a pandas copy, and results leave DuckDB through
+`fetch_record_batch`, so no stage holds a whole large table in Python
+memory at once.
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_BATCH_ROWS = 100_000
+
+SALES_SCHEMA = pa.schema([
+    ('sale_date', pa.timestamp('us')),
+    ('amount', pa.int64()),
+    ('product_id', pa.int64()),
+])
+
+
+def sample_sales(start: str, end: str, step: timedelta = timedelta(hours=1),
+                 batch_rows: int = DEFAULT_BATCH_ROWS) -> pa.RecordBatchReader:
+    """Random sales from `start` to `end` inclusive, one row per `step`, generated lazily in batches"""
+    first = np.datetime64(datetime.fromisoformat(start), 'us')
+    last = np.datetime64(datetime.fromisoformat(end), 'us')
+    step_us = np.timedelta64(int(step.total_seconds() * 1_000_000), 'us')
+    total = int((last - first) // step_us) + 1
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        for offset in range(0, total, batch_rows):
+            count = min(batch_rows, total - offset)
+            yield pa.RecordBatch.from_arrays([
+                pa.array(first + step_us * np.arange(offset, offset + count), type=pa.timestamp('us')),
+                pa.array(np.random.randint(50, 500, size=count), type=pa.int64()),
+                pa.array(np.random.randint(1, 10, size=count), type=pa.int64()),
+            ], schema=SALES_SCHEMA)
+
+    return pa.RecordBatchReader.from_batches(SALES_SCHEMA, batches())
+
+
+def iter_batches(conn: duckdb.DuckDBPyConnection, query: str, params: Optional[List] = None,
+                 batch_rows: int = DEFAULT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """Stream a query's result as record batches of at most `batch_rows` rows"""
+    reader = conn.execute(query, params or []).fetch_record_batch(batch_rows)
+    yield from reader
+
+
+def write_parquet(conn: duckdb.DuckDBPyConnection, query: str, path: Path,
+                  batch_rows: int = DEFAULT_BATCH_ROWS) -> int:
+    """Stream a query's result into a Parquet file; returns the number of rows written"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.parquet.tmp')
+    reader = conn.execute(query).fetch_record_batch(batch_rows)
+    rows = 0
+    with pq.ParquetWriter(tmp_path, reader.schema, compression='zstd') as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    tmp_path.replace(path)
+    return rows
@@ -0,0 +1,519 @@
+"""End-to-end benchmarks of the example stacks on synthetic data.
+
+Generates sales, COVID and Bluesky-shaped datasets as Parquet at a scale
+factor (1.0 is a million rows each), then runs every engine variant on them
+in a fresh working directory:
+
+    simple               SimpleDataStack            sales
+    template             TemplateDataStack          sales
+    declarative_stack    DeclarativeStack           sales
+    declarative_engine   DeclarativeEngine          sales, covid, bluesky
+    dagster              Dagster assets             its own sample partition (skipped without dagster)
+
+Each stage records wall time, rows per second and the process's peak RSS
+while it ran. Results are written as JSON; with --baseline, stages slower
+or larger than the baseline by more than the tolerance are reported as
+regressions and the exit status is 1.
+
+    python benchmark.py --scale 0.1 --output results.json
+    python benchmark.py --scale 0.1 --baseline results.json
+"""
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from queue import Empty
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from arrow_io import DEFAULT_BATCH_ROWS, sample_sales
+from loaders import BatchLoader
+
+HERE = Path(__file__).resolve().parent
+ROWS_PER_SCALE = 1_000_000
+
+COVID_SCHEMA = pa.schema([
+    ('country', pa.string()),
+    ('date', pa.timestamp('us')),
+    ('cases', pa.int64()),
+    ('deaths', pa.int64()),
+    ('total_vaccinations', pa.int64()),
+    ('people_vaccinated', pa.int64()),
+    ('people_fully_vaccinated', pa.int64()),
+])
+
+# The post columns of the event lake, without the text and JSON payloads
+BLUESKY_SCHEMA = pa.schema([
+    ('event_us', pa.int64()),
+    ('actor_did', pa.string()),
+    ('created_ts', pa.timestamp('us')),
+    ('language', pa.string()),
+    ('is_reply', pa.bool_()),
+])
+
+
+@dataclass
+class StageResult:
+    variant: str
+    dataset: str
+    stage: str
+    seconds: float
+    rows: Optional[int]
+    peak_rss_mb: float
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return self.variant, self.dataset, self.stage
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        return self.rows / self.seconds if self.rows is not None and self.seconds else None
+
+
+def _load_script(filename: str):
+    """Import one of the numbered example scripts, whose names aren't valid module names"""
+    spec = importlib.util.spec_from_file_location(Path(filename).stem.replace('-', '_'), HERE / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Lifetime peak in KiB on Linux, bytes on macOS; only an upper bound for the stage
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RSSSampler:
+    """Highest resident set size seen while the block runs, sampled every `interval` seconds"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> 'RSSSampler':
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+# Synthetic datasets
+
+def _covid_batches(rows: int, batch_rows: int) -> Iterator[pa.RecordBatch]:
+    rng = np.random.default_rng(7)
+    countries = np.array([f"C{i:03d}" for i in range(200)])
+    start = np.datetime64('2020-01-01', 'us')
+    for offset in range(0, rows, batch_rows):
+        index = np.arange(offset, min(rows, offset + batch_rows))
+        day = index // len(countries)
+        count = len(index)
+        yield pa.RecordBatch.from_arrays([
+            pa.array(countries[index % len(countries)]),
+            pa.array(start + day * np.timedelta64(86_400_000_000, 'us'), type=pa.timestamp('us')),
+            pa.array(rng.poisson(200, count)),
+            pa.array(rng.poisson(3, count)),
+            pa.array(rng.integers(0, 100_000, count)),
+            pa.array(rng.integers(0, 50_000, count)),
+            pa.array(rng.integers(0, 40_000, count)),
+        ], schema=COVID_SCHEMA)
+
+
+def _bluesky_batches(rows: int, batch_rows: int) -> Iterator[pa.RecordBatch]:
+    rng = np.random.default_rng(11)
+    actors = max(1, rows // 10)
+    languages = np.array(['en', 'ja', 'pt', 'de', 'es', 'fr'])
+    first_us = int(datetime(2024, 12, 1, tzinfo=timezone.utc).timestamp() * 1_000_000)
+    span_us = 7 * 86_400_000_000  # A week of firehose
+    for offset in range(0, rows, batch_rows):
+        count = min(batch_rows, rows - offset)
+        event_us = first_us + (np.arange(offset, offset + count, dtype=np.int64) * span_us) // rows
+        # Heavy-tailed activity: a few actors post most of the time
+        actor = np.minimum(rng.zipf(1.3, count), actors) - 1
+        yield pa.RecordBatch.from_arrays([
+            pa.array(event_us),
+            pa.array(np.char.add('did:plc:', actor.astype(str))),
+            pa.array(event_us - rng.integers(0, 5_000_000, count), type=pa.int64()).cast(pa.timestamp('us')),
+            pa.array(languages[rng.choice(len(languages), count, p=[.5, .2, .12, .08, .06, .04])]),
+            pa.array(rng.random(count) < 0.3),
+        ], schema=BLUESKY_SCHEMA)
+
+
+def _sales_reader(rows: int, batch_rows: int) -> pa.RecordBatchReader:
+    # Spread the rows over a year, like sample_sales' hourly rows over ten days
+    step = timedelta(microseconds=max(1, int(365 * 86_400_000_000 // max(rows - 1, 1))))
+    end = datetime(2024, 1, 1) + step * (rows - 1)
+    return sample_sales('2024-01-01', end.isoformat(), step, batch_rows)
+
+
+def generate_dataset(name: str, rows: int, path: Path, batch_rows: int = DEFAULT_BATCH_ROWS) -> dict:
+    """Write a synthetic dataset to Parquet; returns what was written"""
+    started = time.perf_counter()
+    if name == 'sales':
+        reader = _sales_reader(rows, batch_rows)
+    elif name == 'covid':
+        reader = pa.RecordBatchReader.from_batches(COVID_SCHEMA, _covid_batches(rows, batch_rows))
+    elif name == 'bluesky':
+        reader = pa.RecordBatchReader.from_batches(BLUESKY_SCHEMA, _bluesky_batches(rows, batch_rows))
+    else:
+        raise ValueError(f"Unknown dataset {name!r}, expected sales, covid or bluesky")
+    written = 0
+    with pq.ParquetWriter(path, reader.schema, compression='zstd') as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            written += batch.num_rows
+    return {'rows': written, 'bytes': path.stat().st_size, 'seconds': time.perf_counter() - started}
+
+
+def _parquet_reader(path: Path, batch_rows: int = DEFAULT_BATCH_ROWS) -> pa.RecordBatchReader:
+    parquet = pq.ParquetFile(path)
+    return pa.RecordBatchReader.from_batches(parquet.schema_arrow, parquet.iter_batches(batch_rows))
+
+
+# Engine variants: each yields (stage, run) pairs; run() returns the rows it processed
+
+Stages = List[Tuple[str, Callable[[], Optional[int]]]]
+
+
+def _simple_stack(data: Dict[str, Path]) -> Stages:
+    module = _load_script('1-simple-stack.py')
+    stack = module.SimpleDataStack()
+    stack._create_sample_data = lambda: _parquet_reader(data['sales'])
+    rows = pq.ParquetFile(data['sales']).metadata.num_rows
+    return [
+        ('ingest', lambda: (stack.ingest(), rows)[1]),
+        ('transform', lambda: (stack.transform(), rows)[1]),
+        ('serve', lambda: stack.serve()),
+    ]
+
+
+def _template_stack(data: Dict[str, Path]) -> Stages:
+    module = _load_script('1-simple-stack.py')
+    config_path = Path('config') / 'stack_config.yaml'
+    config_path.parent.mkdir(exist_ok=True)
+    config_path.write_text(module.example_config)
+    stack = module.TemplateDataStack(config_path)
+    stack._create_sample_data = lambda: _parquet_reader(data['sales'])
+    rows = pq.ParquetFile(data['sales']).metadata.num_rows
+    return [
+        ('ingest', lambda: (stack.ingest(), rows)[1]),
+        ('transform', lambda: (stack.transform(), rows)[1]),
+        ('serve', lambda: stack.serve()),
+    ]
+
+
+def _declarative_stack(data: Dict[str, Path]) -> Stages:
+    module = _load_script('2-stack-update.py')
+    config_path = Path('stack_config.yaml')
+    config_path.write_text(_load_script('1-simple-stack.py').example_config)
+    stack = module.DeclarativeStack(str(config_path))
+
+    def load() -> int:
+        return BatchLoader().load(stack.conn, 'raw_sales', _parquet_reader(data['sales'])).rows
+
+    rows = pq.ParquetFile(data['sales']).metadata.num_rows
+    return [
+        ('ingest', load),
+        ('refresh', lambda: (stack.update_stack({'data': ['raw_sales']}), rows)[1]),
+    ]
+
+
+def _engine_pipeline(m, dataset: str, path: Path):
+    """The declarative pipeline for one dataset, reading it from Parquet; `m` is 3-stack-truly-declarative"""
+    source_query = f"SELECT * FROM read_parquet('{path}')"
+    if dataset == 'sales':
+        pipeline = m.create_example_pipeline()
+        pipeline.sources[0].query = source_query
+        return pipeline
+
+    if dataset == 'covid':
+        source = m.DataSource(
+            name='covid_raw',
+            schema=m.Schema([m.Column(name, m.DataType.STRING if name == 'country' else
+                                      m.DataType.TIMESTAMP if name == 'date' else m.DataType.INTEGER)
+                             for name in COVID_SCHEMA.names]),
+            refresh_interval='24h', retention_period='1y', query=source_query)
+        transformations = [
+            m.Transformation(
+                name='covid_aggregation', inputs=['covid_raw'], output='covid_by_country',
+                schema=m.Schema([m.Column('country', m.DataType.STRING), m.Column('cases', m.DataType.INTEGER),
+                                 m.Column('deaths', m.DataType.INTEGER)]),
+                aggregations={'sum': ['cases', 'deaths']}),
+            m.Transformation(
+                name='vaccination_metrics', inputs=['covid_raw'], output='vaccinations_monthly',
+                schema=m.Schema([m.Column('country', m.DataType.STRING), m.Column('date', m.DataType.TIMESTAMP),
+                                 m.Column('total_vaccinations', m.DataType.INTEGER),
+                                 m.Column('people_vaccinated', m.DataType.INTEGER),
+                                 m.Column('people_fully_vaccinated', m.DataType.INTEGER)]),
+                aggregations={'sum': ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated']},
+                time_grain='month'),
+        ]
+        dashboard = m.Dashboard(
+            name='Covid Overview',
+            metrics=[m.Metric('Total Cases', 'SELECT SUM(cases) FROM covid_by_country'),
+                     m.Metric('Total Deaths', 'SELECT SUM(deaths) FROM covid_by_country')],
+            charts=[m.Chart('Cases by Country', m.ChartType.BAR,
+                            'SELECT country, cases FROM covid_by_country ORDER BY cases DESC LIMIT 20'),
+                    m.Chart('Monthly Vaccinations', m.ChartType.LINE,
+                            'SELECT date, SUM(total_vaccinations) AS total_vaccinations '
+                            'FROM vaccinations_monthly GROUP BY date ORDER BY date')])
+        return m.Pipeline([source], transformations, m.ServingLayer([dashboard]))
+
+    if dataset == 'bluesky':
+        source = m.DataSource(
+            name='bsky_posts',
+            schema=m.Schema([m.Column('event_us', m.DataType.INTEGER), m.Column('actor_did', m.DataType.STRING),
+                             m.Column('created_ts', m.DataType.TIMESTAMP), m.Column('language', m.DataType.STRING)]),
+            refresh_interval='1h', retention_period='30d', query=source_query,
+            incremental=True, timestamp_column='created_ts')
+        transformations = [
+            m.Transformation(
+                name='posts_daily', inputs=['bsky_posts'], output='bsky_posts_daily',
+                schema=m.Schema([m.Column('created_ts', m.DataType.TIMESTAMP), m.Column('posts', m.DataType.INTEGER)]),
+                aggregations={'count': ['*']}, time_grain='day'),
+            m.Transformation(
+                name='posts_by_language', inputs=['bsky_posts'], output='bsky_posts_by_language',
+                schema=m.Schema([m.Column('language', m.DataType.STRING), m.Column('posts', m.DataType.INTEGER)]),
+                aggregations={'count': ['*']}),
+        ]
+        dashboard = m.Dashboard(
+            name='Bluesky Activity',
+            metrics=[m.Metric('Unique Posters', 'SELECT COUNT(DISTINCT actor_did) FROM bsky_posts'),
+                     m.Metric('Posts', 'SELECT SUM(posts) FROM bsky_posts_daily')],
+            charts=[m.Chart('Posts per Day', m.ChartType.LINE,
+                            'SELECT created_ts, posts FROM bsky_posts_daily ORDER BY created_ts'),
+                    m.Chart('Languages', m.ChartType.BAR,
+                            'SELECT language, posts FROM bsky_posts_by_language ORDER BY posts DESC')])
+        return m.Pipeline([source], transformations, m.ServingLayer([dashboard]))
+
+    raise ValueError(f"Unknown dataset {dataset!r}")
+
+
+def _declarative_engine(data: Dict[str, Path], dataset: str) -> Stages:
+    module = _load_script('3-stack-truly-declarative.py')
+    engine = module.DeclarativeEngine()
+    pipeline = _engine_pipeline(module, dataset, data[dataset])
+    rows = pq.ParquetFile(data[dataset]).metadata.num_rows
+
+    def run_pipeline() -> int:
+        pipeline.validate()
+        engine._execute_data_pipeline(pipeline)
+        return rows
+
+    return [
+        ('pipeline', run_pipeline),
+        ('serve', lambda: engine._generate_serving_layer(pipeline.serving)),
+    ]
+
+
+def _dagster(data: Dict[str, Path]) -> Stages:
+    # Imported here: dagster is optional for everything but this variant
+    from dagster import materialize
+    module = _load_script('4-dagster-stack.py')
+
+    def run() -> int:
+        result = materialize([module.raw_sales, module.sales_daily], partition_key='2024-01-01')
+        if not result.success:
+            raise ValueError("Dagster materialization failed")
+        # raw_sales hands its partition downstream as a Parquet file
+        return pq.ParquetFile(result.output_for_node('raw_sales')).metadata.num_rows
+
+    return [('materialize', run)]
+
+
+VARIANTS: Dict[str, Tuple[List[str], Callable]] = {
+    'simple': (['sales'], lambda data, dataset: _simple_stack(data)),
+    'template': (['sales'], lambda data, dataset: _template_stack(data)),
+    'declarative_stack': (['sales'], lambda data, dataset: _declarative_stack(data)),
+    'declarative_engine': (['sales', 'covid', 'bluesky'], _declarative_engine),
+    'dagster': (['sales'], lambda data, dataset: _dagster(data)),
+}
+
+
+def _run_variant(name: str, dataset: str, paths: Dict[str, Path], run_dir: Path, verbose: bool,
+                 queue) -> None:
+    """Run one variant on one dataset in `run_dir` and put its stage results on `queue`"""
+    os.chdir(run_dir)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    results = []
+    try:
+        with output:
+            stages = VARIANTS[name][1](paths, dataset)
+        for stage, run in stages:
+            gc.collect()
+            with output, RSSSampler() as rss:
+                started = time.perf_counter()
+                stage_rows = run()
+                seconds = time.perf_counter() - started
+            result = StageResult(name, dataset, stage, seconds, stage_rows, rss.peak / 1024 ** 2)
+            results.append(asdict(result))
+            rate = f", {result.rows_per_second:,.0f} rows/s" if result.rows_per_second else ''
+            print(f"  {name:<19} {dataset:<8} {stage:<11} {seconds:8.3f}s{rate}, "
+                  f"peak RSS {result.peak_rss_mb:,.0f} MB", flush=True)
+    except ImportError as e:
+        queue.put({'skipped': str(e), 'results': []})
+        return
+    except Exception as e:
+        queue.put({'error': f"{type(e).__name__}: {e}", 'results': results})
+        return
+    queue.put({'results': results})
+
+
+def _outcome(process: multiprocessing.Process, queue: multiprocessing.Queue, poll: float = 1.0) -> dict:
+    """The message a variant's process sends, or an error if it exits without sending one"""
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Empty:
+            if process.is_alive():
+                continue
+        # The process may have sent its message just before it exited
+        try:
+            return queue.get(timeout=poll)
+        except Empty:
+            return {'error': f"process exited with code {process.exitcode} without reporting results",
+                    'results': []}
+
+
+def run_benchmarks(scale: float, variants: List[str], work_dir: Path,
+                   verbose: bool = False) -> Tuple[dict, List[StageResult], Dict[str, str]]:
+    """Generate the datasets, then run every variant's stages; returns dataset info, results and skips"""
+    rows = max(1, int(scale * ROWS_PER_SCALE))
+    data_dir = work_dir / 'data'
+    data_dir.mkdir(parents=True, exist_ok=True)
+    needed = sorted({dataset for name in variants for dataset in VARIANTS[name][0]})
+    datasets = {}
+    for dataset in needed:
+        datasets[dataset] = generate_dataset(dataset, rows, data_dir / f"{dataset}.parquet")
+        print(f"Generated {dataset}: {datasets[dataset]['rows']:,} rows, "
+              f"{datasets[dataset]['bytes'] / 1024 ** 2:.1f} MB in {datasets[dataset]['seconds']:.2f}s")
+    paths = {dataset: (data_dir / f"{dataset}.parquet").resolve() for dataset in needed}
+
+    results: List[StageResult] = []
+    skipped: Dict[str, str] = {}
+    # A fresh process per run, so peak RSS isn't inflated by what earlier runs left allocated
+    context = multiprocessing.get_context('spawn')
+    for name in variants:
+        for dataset in VARIANTS[name][0]:
+            run_dir = work_dir / 'runs' / f"{name}-{dataset}"
+            run_dir.mkdir(parents=True, exist_ok=True)
+            queue = context.Queue()
+            process = context.Process(target=_run_variant, args=(name, dataset, paths, run_dir, verbose, queue))
+            process.start()
+            outcome = _outcome(process, queue)
+            process.join()
+            if 'skipped' in outcome:
+                skipped[f"{name}/{dataset}"] = outcome['skipped']
+                print(f"  {name:<19} {dataset:<8} skipped: {outcome['skipped']}")
+            elif 'error' in outcome:
+                raise ValueError(f"Benchmark {name}/{dataset} failed: {outcome['error']}")
+            results.extend(StageResult(**result) for result in outcome['results'])
+    return datasets, results, skipped
+
+
+def compare(results: List[StageResult], baseline: dict, tolerance: float = 0.2,
+            min_seconds: float = 0.05, min_rss_mb: float = 32) -> List[str]:
+    """Stages slower or larger than the baseline by more than `tolerance`.
+
+    Differences under `min_seconds` / `min_rss_mb` are treated as noise.
+    """
+    previous = {(r['variant'], r['dataset'], r['stage']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result.key)
+        if before is None:
+            continue
+        name = '/'.join(result.key)
+        if result.seconds > before['seconds'] * (1 + tolerance) and result.seconds - before['seconds'] > min_seconds:
+            regressions.append(f"{name}: {before['seconds']:.3f}s -> {result.seconds:.3f}s "
+                               f"(+{result.seconds / before['seconds'] - 1:.0%})")
+        if result.peak_rss_mb > before['peak_rss_mb'] * (1 + tolerance) and \
+                result.peak_rss_mb - before['peak_rss_mb'] > min_rss_mb:
+            regressions.append(f"{name}: peak RSS {before['peak_rss_mb']:.0f} MB -> {result.peak_rss_mb:.0f} MB")
+    return regressions
+
+
+def save_results(path: Path, scale: float, datasets: dict, results: List[StageResult],
+                 skipped: Dict[str, str]) -> None:
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'scale': scale,
+        'environment': {
+            'python': platform.python_version(),
+            'duckdb': duckdb.__version__,
+            'pyarrow': pa.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'datasets': datasets,
+        'results': [{**asdict(r), 'rows_per_second': r.rows_per_second} for r in results],
+        'skipped': skipped,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every stack variant end to end on synthetic data")
+    parser.add_argument('--scale', type=float, default=0.1, help="Scale factor; 1.0 is a million rows per dataset")
+    parser.add_argument('--variants', nargs='+', choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="Results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown or growth, 0.2 = 20%%")
+    parser.add_argument('--work-dir', help="Keep generated data and run directories here")
+    parser.add_argument('--verbose', action='store_true', help="Show the stacks' own output")
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix='ddse-bench-')).resolve()
+    try:
+        datasets, results, skipped = run_benchmarks(args.scale, args.variants, work_dir, args.verbose)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    save_results(Path(args.output), args.scale, datasets, results, skipped)
+    print(f"Wrote {len(results)} stage results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
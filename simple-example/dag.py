@@ -0,0 +1,191 @@
+"""Compact dependency graph core shared by the example stacks.
+
+Nodes are interned to integer ids and edges kept as adjacency lists, so
+ordering and reachability work on small ints rather than table names. All
+traversals are iterative, so graphs with thousands of models never approach
+Python's recursion limit. The topological order and the descendant and
+ancestor sets are computed once, as bitsets, and reused until the graph is
+edited.
+"""
+from typing import Dict, Iterable, List, Mapping, Optional, Set
+
+
+class CycleError(ValueError):
+    """Raised when a graph that must be acyclic contains a cycle"""
+
+    def __init__(self, cycle: List[str]):
+        self.cycle = cycle
+        super().__init__(f"Dependency graph contains a cycle: {' -> '.join(cycle)}")
+
+
+class DependencyDAG:
+    """Directed graph of named nodes with cached ordering and reachability"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._children: List[List[int]] = []
+        self._parents: List[List[int]] = []
+        self._order: Optional[List[int]] = None
+        self._descendants: Optional[List[int]] = None  # Bitset of reachable ids per node
+        self._ancestors: Optional[List[int]] = None
+
+    @classmethod
+    def from_adjacency(cls, adjacency: Mapping[str, Iterable[str]]) -> 'DependencyDAG':
+        """Build from a `{node: [children]}` mapping"""
+        graph = cls()
+        for node, children in adjacency.items():
+            graph.add_node(node)
+            for child in children:
+                graph.add_edge(node, child)
+        return graph
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._ids
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._names)
+
+    def add_node(self, node: str) -> int:
+        node_id = self._ids.get(node)
+        if node_id is None:
+            node_id = self._ids[node] = len(self._names)
+            self._names.append(node)
+            self._children.append([])
+            self._parents.append([])
+            self._invalidate()
+        return node_id
+
+    def add_edge(self, parent: str, child: str) -> None:
+        parent_id, child_id = self.add_node(parent), self.add_node(child)
+        if child_id not in self._children[parent_id]:
+            self._children[parent_id].append(child_id)
+            self._parents[child_id].append(parent_id)
+            self._invalidate()
+
+    def children(self, node: str) -> List[str]:
+        return [self._names[i] for i in self._children[self._ids[node]]]
+
+    def parents(self, node: str) -> List[str]:
+        return [self._names[i] for i in self._parents[self._ids[node]]]
+
+    def _invalidate(self) -> None:
+        self._order = None
+        self._descendants = None
+        self._ancestors = None
+
+    def levels(self) -> List[List[str]]:
+        """Nodes grouped so every node's parents are in an earlier level (Kahn's algorithm).
+
+        Within a level, nodes keep the order they were added in.
+        Raises CycleError naming one cycle if the graph isn't acyclic.
+        """
+        in_degree = [len(parents) for parents in self._parents]
+        level = [i for i, degree in enumerate(in_degree) if degree == 0]
+        levels = []
+        placed = 0
+        while level:
+            levels.append(level)
+            placed += len(level)
+            next_level = []
+            for node_id in level:
+                for child in self._children[node_id]:
+                    in_degree[child] -= 1
+                    if in_degree[child] == 0:
+                        next_level.append(child)
+            level = sorted(next_level)
+        if placed != len(self._names):
+            raise CycleError(self._find_cycle(in_degree))
+        self._order = [node_id for level in levels for node_id in level]
+        return [[self._names[i] for i in level] for level in levels]
+
+    def topological_order(self) -> List[str]:
+        """All nodes, parents before children"""
+        if self._order is None:
+            self.levels()
+        return [self._names[i] for i in self._order]
+
+    def has_cycle(self) -> bool:
+        try:
+            self.topological_order()
+        except CycleError:
+            return True
+        return False
+
+    def _find_cycle(self, in_degree: List[int]) -> List[str]:
+        """One cycle among the nodes Kahn's algorithm couldn't place"""
+        # Every unplaced node has an unplaced parent, so walking parents must revisit a node
+        node_id = next(i for i, degree in enumerate(in_degree) if degree > 0)
+        seen: Dict[int, int] = {}
+        path = []
+        while node_id not in seen:
+            seen[node_id] = len(path)
+            path.append(node_id)
+            node_id = next(p for p in self._parents[node_id] if in_degree[p] > 0)
+        cycle = path[seen[node_id]:][::-1]
+        return [self._names[i] for i in cycle + cycle[:1]]
+
+    def _closure(self) -> None:
+        if self._order is None:
+            self.levels()
+        order = self._order
+        descendants = [0] * len(self._names)
+        for node_id in reversed(order):
+            reachable = 0
+            for child in self._children[node_id]:
+                reachable |= (1 << child) | descendants[child]
+            descendants[node_id] = reachable
+        ancestors = [0] * len(self._names)
+        for node_id in order:
+            reachable = 0
+            for parent in self._parents[node_id]:
+                reachable |= (1 << parent) | ancestors[parent]
+            ancestors[node_id] = reachable
+        self._descendants = descendants
+        self._ancestors = ancestors
+
+    def _members(self, bits: int) -> Set[str]:
+        members = set()
+        while bits:
+            low = bits & -bits
+            members.add(self._names[low.bit_length() - 1])
+            bits ^= low
+        return members
+
+    def descendants(self, node: str) -> Set[str]:
+        """Every node reachable from `node`, excluding itself"""
+        if node not in self._ids:
+            return set()
+        if self._descendants is None:
+            self._closure()
+        return self._members(self._descendants[self._ids[node]])
+
+    def ancestors(self, node: str) -> Set[str]:
+        """Every node `node` is reachable from, excluding itself"""
+        if node not in self._ids:
+            return set()
+        if self._ancestors is None:
+            self._closure()
+        return self._members(self._ancestors[self._ids[node]])
+
+    def affected(self, changed: Iterable[str]) -> List[str]:
+        """`changed` and everything downstream of it, in topological order.
+
+        Names not in the graph have nothing upstream, so they come first.
+        """
+        changed = list(dict.fromkeys(changed))
+        unknown = [node for node in changed if node not in self._ids]
+        if len(unknown) == len(changed):
+            return unknown
+        if self._descendants is None:
+            self._closure()
+        bits = 0
+        for node in changed:
+            if node in self._ids:
+                node_id = self._ids[node]
+                bits |= (1 << node_id) | self._descendants[node_id]
+        return unknown + [self._names[i] for i in self._order if bits >> i & 1]
@@ -0,0 +1,206 @@
+"""Watermark-based incremental ingestion shared by the example stacks.
+
+A source declared `incremental: true` with a `timestamp_column` is only read
+for rows newer than the high-watermark recorded after its last load. The new
+rows are appended to the target table, or merged on `unique_key` when one is
+given, so a daily run costs time in proportion to the new data.
+
+Group-by aggregates over an append-only incremental source can be maintained
+the same way: only the rows past the aggregate's own watermark are
+aggregated, and their partial results are merged into the existing ones.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import duckdb
+
+
+class WatermarkStore:
+    """Persistent per-source high-watermarks kept in a small JSON file"""
+
+    def __init__(self, path: str = '.ddse/watermarks.json'):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._watermarks = self._load()
+
+    def _load(self) -> dict:
+        if self.path.exists():
+            with open(self.path) as f:
+                return json.load(f)
+        return {}
+
+    def get(self, source: str) -> Optional[dict]:
+        with self._lock:
+            return self._watermarks.get(source)
+
+    def set(self, source: str, value: str, type_name: str) -> None:
+        with self._lock:
+            self._watermarks[source] = {'value': value, 'type': type_name}
+            self._save()
+
+    def clear(self, source: str) -> None:
+        with self._lock:
+            self._watermarks.pop(source, None)
+            self._save()
+
+    def _save(self) -> None:
+        # Write-then-rename so a crash never leaves a truncated file behind
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._watermarks, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _table_exists(conn: duckdb.DuckDBPyConnection, table: str) -> bool:
+    return conn.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [table]
+    ).fetchone()[0] > 0
+
+
+def ingest_incremental(conn: duckdb.DuckDBPyConnection, table: str, query: str,
+                       timestamp_column: str, store: WatermarkStore,
+                       unique_key: Optional[List[str]] = None) -> int:
+    """Load `query` into `table`, reading only rows past the stored watermark.
+
+    The first load (or a load after the target table disappeared) is a full
+    load. Later loads append the delta, or replace existing rows that share
+    `unique_key` with a delta row. Returns the number of rows ingested.
+    """
+    watermark = store.get(table)
+    if watermark is None or not _table_exists(conn, table):
+        conn.execute(f"CREATE OR REPLACE TABLE {table} AS {query}")
+        loaded = conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    else:
+        delta = f"{table}__delta"
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(
+                f"CREATE OR REPLACE TEMP TABLE {delta} AS "
+                f"SELECT * FROM ({query}) WHERE {timestamp_column} > CAST(? AS {watermark['type']})",
+                [watermark['value']]
+            )
+            loaded = conn.execute(f"SELECT count(*) FROM {delta}").fetchone()[0]
+            if loaded and unique_key:
+                matches = ' AND '.join(f"{table}.{key} = {delta}.{key}" for key in unique_key)
+                conn.execute(f"DELETE FROM {table} USING {delta} WHERE {matches}")
+            if loaded:
+                conn.execute(f"INSERT INTO {table} BY NAME SELECT * FROM {delta}")
+            conn.execute(f"DROP TABLE {delta}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    high, type_name = conn.execute(
+        f"SELECT max({timestamp_column})::VARCHAR, typeof(max({timestamp_column})) FROM {table}"
+    ).fetchone()
+    if high is not None:
+        store.set(table, high, type_name)
+    return loaded
+
+
+# Partial states per aggregate, how partials combine, and how they finalize.
+# AVG is kept as SUM and COUNT; anything not listed here isn't decomposable.
+_PARTIALS = {
+    'SUM': [('sum', 'SUM({col})')],
+    'COUNT': [('count', 'COUNT({col})')],
+    'MIN': [('min', 'MIN({col})')],
+    'MAX': [('max', 'MAX({col})')],
+    'AVG': [('sum', 'SUM({col})'), ('count', 'COUNT({col})')],
+}
+_COMBINE = {
+    'sum': 'SUM({state})',
+    'count': 'SUM({state})::BIGINT',
+    'min': 'MIN({state})',
+    'max': 'MAX({state})',
+}
+_FINALIZE = {
+    'SUM': '{name}__sum',
+    'COUNT': '{name}__count',
+    'MIN': '{name}__min',
+    'MAX': '{name}__max',
+    'AVG': '{name}__sum / NULLIF({name}__count, 0)',
+}
+
+Aggregate = Tuple[str, str, str]  # (output name, function, column expression)
+
+
+def is_decomposable(aggregates: List[Aggregate]) -> bool:
+    """Whether every aggregate can be merged from partial results"""
+    return all(func.upper() in _PARTIALS and not column.strip().lower().startswith('distinct ')
+               for _, func, column in aggregates)
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def maintain_aggregate(conn: duckdb.DuckDBPyConnection, target: str, source: str,
+                       group_by: List[str], aggregates: List[Aggregate],
+                       timestamp_column: str, store: WatermarkStore,
+                       where: Optional[str] = None) -> int:
+    """Keep `target` equal to a GROUP BY over `source`, aggregating only new rows.
+
+    Partial aggregates live in `<target>__state`; `target` is re-derived from
+    it, which costs time in proportion to the number of groups rather than
+    the source's history. The source must be append-only on
+    `timestamp_column`. Returns the number of source rows aggregated.
+    """
+    state = f"{target}__state"
+    partials = [f"{expr.format(col=column)} AS {name}__{kind}"
+                for name, func, column in aggregates
+                for kind, expr in _PARTIALS[func.upper()]]
+    select = f"SELECT {', '.join(group_by + partials)} FROM {source}"
+    conditions = [where] if where else []
+    covered = store.get(state)
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        if covered is None or not _table_exists(conn, state):
+            conn.execute(f"CREATE OR REPLACE TABLE {state} AS {select}"
+                         f"{' WHERE ' + ' AND '.join(conditions) if conditions else ''}"
+                         f"{' GROUP BY ALL' if group_by else ''}")
+            aggregated = conn.execute(f"SELECT count(*) FROM {source}").fetchone()[0]
+        else:
+            conditions.append(f"{timestamp_column} > CAST(? AS {covered['type']})")
+            aggregated = conn.execute(
+                f"SELECT count(*) FROM {source} WHERE {' AND '.join(conditions)}", [covered['value']]
+            ).fetchone()[0]
+            if aggregated:
+                delta = f"{target}__delta"
+                conn.execute(f"CREATE OR REPLACE TEMP TABLE {delta} AS {select} "
+                             f"WHERE {' AND '.join(conditions)}{' GROUP BY ALL' if group_by else ''}",
+                             [covered['value']])
+                columns = [row[0] for row in conn.execute(f"DESCRIBE {state}").fetchall()]
+                keys = [_quote(column) for column in columns[:len(group_by)]]
+                combined = [f"{_COMBINE[column.rsplit('__', 1)[1]].format(state=_quote(column))} AS {_quote(column)}"
+                            for column in columns[len(group_by):]]
+                conn.execute(f"""
+                    CREATE OR REPLACE TABLE {state} AS
+                    SELECT {', '.join(keys + combined)}
+                    FROM (SELECT * FROM {state} UNION ALL BY NAME SELECT * FROM {delta})
+                    {'GROUP BY ALL' if group_by else ''}
+                """)
+                conn.execute(f"DROP TABLE {delta}")
+
+        columns = [row[0] for row in conn.execute(f"DESCRIBE {state}").fetchall()]
+        keys = [_quote(column) for column in columns[:len(group_by)]]
+        finals = [f"{_FINALIZE[func.upper()].format(name=name)} AS {name}" for name, func, _ in aggregates]
+        order = f" ORDER BY {', '.join(str(i + 1) for i in range(len(keys)))}" if keys else ''
+        conn.execute(f"CREATE OR REPLACE TABLE {target} AS SELECT {', '.join(keys + finals)} FROM {state}{order}")
+
+        high, type_name = conn.execute(
+            f"SELECT max({timestamp_column})::VARCHAR, typeof(max({timestamp_column})) FROM {source}"
+        ).fetchone()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    if high is not None:
+        store.set(state, high, type_name)
+    return aggregated
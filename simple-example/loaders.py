@@ -0,0 +1,121 @@
+"""Bounded-memory bulk loading of Arrow sources into DuckDB tables.
+
+A source is any pyarrow RecordBatchReader. A producer thread pulls batches
+from it, re-slices them to at most `batch_rows` rows and `max_batch_bytes`
+bytes, and hands them over through a queue holding at most
+`max_pending_batches`. When inserts fall behind, the producer blocks, so
+memory stays flat however large the source is. The whole load is one
+transaction, so readers never see a half-loaded table.
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+import duckdb
+import pyarrow as pa
+
+_DONE = object()
+
+
+@dataclass
+class LoadStats:
+    table: str
+    rows: int = 0
+    bytes: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    producer_waits: int = 0  # Times the source was paused because inserts fell behind
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes / 1024 ** 2 / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.rows:,} rows in {self.batches} batches, {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} rows/s, {self.megabytes_per_second:.1f} MB/s)")
+
+
+def _rebatch(reader: pa.RecordBatchReader, batch_rows: int, max_batch_bytes: int) -> Iterator[pa.RecordBatch]:
+    """Zero-copy slices of the reader's batches within the row and byte bounds"""
+    for batch in reader:
+        if batch.num_rows == 0:
+            continue
+        row_bytes = max(1, batch.nbytes // batch.num_rows)
+        step = max(1, min(batch_rows, max_batch_bytes // row_bytes))
+        for offset in range(0, batch.num_rows, step):
+            yield batch.slice(offset, step)
+
+
+class BatchLoader:
+    """Streams record batch readers into tables with bounded memory"""
+
+    def __init__(self, batch_rows: int = 100_000, max_batch_bytes: int = 64 * 1024 ** 2,
+                 max_pending_batches: int = 2):
+        self.batch_rows = batch_rows
+        self.max_batch_bytes = max_batch_bytes
+        self.max_pending_batches = max_pending_batches
+
+    def load(self, conn: duckdb.DuckDBPyConnection, table: str, reader: pa.RecordBatchReader,
+             replace: bool = True) -> LoadStats:
+        """Load every batch of `reader` into `table`, replacing it or appending by column name"""
+        stats = LoadStats(table)
+        started = time.perf_counter()
+        pending: queue.Queue = queue.Queue(maxsize=self.max_pending_batches)
+        stop = threading.Event()
+
+        def offer(item) -> bool:
+            # Blocks while the queue is full, unless the load was abandoned
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for batch in _rebatch(reader, self.batch_rows, self.max_batch_bytes):
+                    if pending.full():
+                        stats.producer_waits += 1
+                    if not offer(batch):
+                        return
+                offer(_DONE)
+            except BaseException as e:  # Handed to the consumer, which re-raises it
+                offer(e)
+
+        producer = threading.Thread(target=produce, name=f"ddse-load-{table}", daemon=True)
+        producer.start()
+        staging = f"__ddse_load_{table}"
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            if replace:
+                conn.register(staging, pa.Table.from_batches([], schema=reader.schema))
+                conn.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {staging}")
+            while True:
+                item = pending.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                conn.register(staging, pa.Table.from_batches([item]))
+                conn.execute(f"INSERT INTO {table} BY NAME SELECT * FROM {staging}")
+                stats.rows += item.num_rows
+                stats.bytes += item.nbytes
+                stats.batches += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            stop.set()
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.unregister(staging)
+            producer.join()
+        stats.seconds = time.perf_counter() - started
+        return stats
@@ -0,0 +1,134 @@
+"""Content-addressed cache of materialized tables.
+
+Every node gets a fingerprint: a hash of its normalized SQL, its declarative
+definition and the fingerprints of its inputs. When a node's fingerprint
+matches the last successful run it is not recomputed; the table is either
+still in the catalog or restored from the Parquet copy kept in the cache.
+"""
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import threading
+from enum import Enum
+from pathlib import Path
+from typing import Any, List, Optional
+
+import duckdb
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and trailing semicolons so formatting changes don't invalidate"""
+    return re.sub(r'\s+', ' ', sql).strip().rstrip(';').strip()
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Path):
+        return str(value)
+    raise TypeError(f"Cannot fingerprint {type(value).__name__}")
+
+
+def fingerprint(sql: str, definition: Any = None, input_fingerprints: Optional[List[str]] = None) -> str:
+    """Hash a node's SQL, definition (dataclass or plain dict) and its inputs"""
+    if dataclasses.is_dataclass(definition):
+        definition = dataclasses.asdict(definition)
+    payload = json.dumps({
+        'sql': normalize_sql(sql),
+        'definition': definition,
+        'inputs': list(input_fingerprints or []),
+    }, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def table_fingerprint(conn: duckdb.DuckDBPyConnection, table: str) -> str:
+    """Fingerprint a table by its contents (row count plus an order-independent row hash)"""
+    count, row_hash = conn.execute(
+        f"SELECT count(*), sum(hash(t)::HUGEINT) FROM {table} AS t"
+    ).fetchone()
+    return hashlib.sha256(f"{table}:{count}:{row_hash}".encode()).hexdigest()
+
+
+def watermark_fingerprint(conn: duckdb.DuckDBPyConnection, table: str, watermark: Optional[dict],
+                          generation: str = '') -> str:
+    """Fingerprint an incrementally loaded table by its high-watermark and row count.
+
+    Any load that adds or replaces rows moves the watermark, so this needs
+    no scan of the table's history. `generation` covers rewrites behind the
+    watermark, such as reloaded partitions.
+    """
+    count = conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    value = watermark['value'] if watermark else None
+    return hashlib.sha256(f"{table}:{value}:{count}:{generation}".encode()).hexdigest()
+
+
+class MaterializationCache:
+    """Remembers the fingerprint of each table's last successful build.
+
+    A manifest maps table name to fingerprint and the Parquet file holding
+    that build, so a fresh process can restore a table without recomputing it.
+    """
+
+    def __init__(self, cache_dir: str = '.ddse/cache'):
+        self.cache_dir = Path(cache_dir)
+        self.manifest_path = self.cache_dir / 'manifest.json'
+        self._lock = threading.Lock()
+        self._manifest = self._load()
+
+    def _load(self) -> dict:
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {}
+
+    def _save(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def is_fresh(self, table: str, node_fingerprint: str) -> bool:
+        with self._lock:
+            entry = self._manifest.get(table)
+        return entry is not None and entry['fingerprint'] == node_fingerprint
+
+    def restore(self, conn: duckdb.DuckDBPyConnection, table: str) -> bool:
+        """Make sure `table` is in the catalog; load it from Parquet if it is not"""
+        existing = conn.execute(
+            "SELECT table_type FROM information_schema.tables WHERE table_name = ?", [table]
+        ).fetchone()
+        if existing is not None and existing[0] == 'BASE TABLE':
+            return True
+        with self._lock:
+            path = Path(self._manifest[table]['path'])
+        if not path.exists():
+            return False
+        if existing is not None:
+            # The node was inlined as a view since this build was cached
+            conn.execute(f"DROP VIEW {table}")
+        conn.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM read_parquet('{path}')")
+        return True
+
+    def store(self, conn: duckdb.DuckDBPyConnection, table: str, node_fingerprint: str) -> None:
+        """Record a successful build and keep a Parquet copy of its result"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{table}-{node_fingerprint[:16]}.parquet"
+        conn.execute(f"COPY {table} TO '{path}' (FORMAT PARQUET)")
+        with self._lock:
+            previous = self._manifest.get(table)
+            self._manifest[table] = {'fingerprint': node_fingerprint, 'path': str(path)}
+            self._save()
+        if previous and previous['path'] != str(path):
+            Path(previous['path']).unlink(missing_ok=True)
+
+    def discard(self, table: str) -> None:
+        """Forget a table's build, e.g. once it is no longer materialized"""
+        with self._lock:
+            previous = self._manifest.pop(table, None)
+            if previous is not None:
+                self._save()
+        if previous is not None:
+            Path(previous['path']).unlink(missing_ok=True)
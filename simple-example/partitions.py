@@ -0,0 +1,209 @@
+"""Time-partitioned materialization for the native engines.
+
+A table declared with a PartitionSpec, e.g. daily on `sale_date`, is built
+one partition at a time: each partition is deleted and re-inserted in its
+own transaction, so partitions build in parallel and a failed one leaves
+the others intact. Per-partition status and the fingerprint of the input
+rows each partition was built from are kept in a small JSON file, so a run
+only rebuilds partitions whose input changed, that failed, or that were
+invalidated for a backfill.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import duckdb
+
+# Partition key format per grain; keys sort chronologically as strings
+GRAINS = {
+    'hour': '%Y-%m-%dT%H',
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+}
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+@dataclass(frozen=True)
+class PartitionSpec:
+    column: str
+    grain: Optional[str] = 'day'  # 'hour', 'day', 'month', or None for one partition per value
+
+    def __post_init__(self):
+        if self.grain is not None and self.grain not in GRAINS:
+            raise ValueError(f"Unknown partition grain {self.grain!r}, expected one of {sorted(GRAINS)}")
+
+    def key_expression(self) -> str:
+        """SQL expression giving a row's partition key as text"""
+        if self.grain is None:
+            return f"{self.column}::VARCHAR"
+        return f"strftime(date_trunc('{self.grain}', {self.column}), '{GRAINS[self.grain]}')"
+
+    def _bounds(self, key: str):
+        start = datetime.strptime(key, GRAINS[self.grain])
+        if self.grain == 'month':
+            end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            end = start + timedelta(**{f"{self.grain}s": 1})
+        return start, end
+
+    def predicate(self, key: str, qualifier: Optional[str] = None) -> str:
+        """WHERE condition selecting one partition's rows.
+
+        Time grains compare the raw column against the partition's bounds,
+        so zone maps can skip row groups outside the partition.
+        """
+        column = f"{qualifier}.{self.column}" if qualifier else self.column
+        if self.grain is None:
+            return f"{column}::VARCHAR = {_sql_string(key)}"
+        start, end = self._bounds(key)
+        return f"{column} >= TIMESTAMP '{start}' AND {column} < TIMESTAMP '{end}'"
+
+    def since(self, key: str) -> str:
+        """WHERE condition selecting the rows of partition `key` and every later one"""
+        if self.grain is None:
+            raise ValueError(f"Partitions on {self.column} values have no order")
+        start, _ = self._bounds(key)
+        return f"{self.column} >= TIMESTAMP '{start}'"
+
+    def key_of(self, value: str) -> str:
+        """Partition key of a timestamp or date given as text"""
+        if self.grain is None:
+            return value
+        return datetime.fromisoformat(value).strftime(GRAINS[self.grain])
+
+    def keys_between(self, first: str, last: str) -> List[str]:
+        """Every partition key from `first` to `last`, inclusive"""
+        if self.grain is None:
+            raise ValueError(f"Partitions on {self.column} values have no range")
+        keys = []
+        start, _ = self._bounds(first)
+        final, _ = self._bounds(last)
+        while start <= final:
+            keys.append(start.strftime(GRAINS[self.grain]))
+            start = self._bounds(keys[-1])[1]
+        return keys
+
+
+def partition_fingerprints(conn: duckdb.DuckDBPyConnection, table: str,
+                           spec: PartitionSpec, where: Optional[str] = None) -> Dict[str, str]:
+    """Content fingerprint of every partition of `table`, keyed by partition key"""
+    rows = conn.execute(f"""
+        SELECT {spec.key_expression()} AS partition_key, count(*), sum(hash(t)::HUGEINT)
+        FROM {table} AS t
+        {f'WHERE {where}' if where else ''}
+        GROUP BY partition_key
+    """).fetchall()
+    return {key: hashlib.sha256(f"{table}:{key}:{count}:{row_hash}".encode()).hexdigest()
+            for key, count, row_hash in rows if key is not None}
+
+
+class PartitionStatus:
+    """Per-table, per-partition build status kept in a JSON file"""
+
+    def __init__(self, path: str = '.ddse/partitions.json'):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Dict[str, dict]] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self._tables = json.load(f)
+
+    def get(self, table: str) -> Dict[str, dict]:
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._tables.get(table, {}).items()}
+
+    def mark(self, table: str, key: str, status: str, **details) -> None:
+        with self._lock:
+            self._tables.setdefault(table, {})[key] = {
+                'status': status,
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+                **details,
+            }
+            self._save()
+
+    def invalidate(self, table: str, keys: Optional[Iterable[str]] = None) -> None:
+        """Force partitions (all of them by default) to rebuild on the next run"""
+        with self._lock:
+            entries = self._tables.setdefault(table, {})
+            for key in (list(entries) if keys is None else keys):
+                entries[key] = {**entries.get(key, {}), 'status': 'invalid'}
+            self._save()
+
+    def forget(self, table: str, keys: Optional[Iterable[str]] = None) -> None:
+        with self._lock:
+            if keys is None:
+                self._tables.pop(table, None)
+            else:
+                for key in keys:
+                    self._tables.get(table, {}).pop(key, None)
+            self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._tables, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def stale_partitions(status: Dict[str, dict], fingerprints: Dict[str, str]) -> List[str]:
+    """Partitions that aren't built from exactly these input fingerprints"""
+    return sorted(key for key, value in fingerprints.items()
+                  if status.get(key, {}).get('status') != 'done'
+                  or status[key].get('fingerprint') != value)
+
+
+def refresh_partitions(cursor: Callable[[], duckdb.DuckDBPyConnection], table: str,
+                       spec: PartitionSpec, select_for: Callable[[str], str],
+                       fingerprints: Dict[str, str], keys: List[str], status: PartitionStatus,
+                       max_workers: int = 1, details: Optional[dict] = None) -> Dict[str, int]:
+    """Rebuild `keys` partitions of `table` in parallel.
+
+    `select_for(key)` gives the SELECT producing a partition's rows and
+    `cursor()` a cursor for the calling thread. Partitions missing from
+    `fingerprints` no longer have input rows and are just deleted. Every
+    partition is recorded as done or failed; if any failed, a ValueError
+    naming them is raised once the others have finished. `details` are
+    recorded with every built partition. Returns the rows written per partition.
+    """
+    def build(key: str) -> int:
+        conn = cursor()
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"DELETE FROM {table} WHERE {spec.predicate(key)}")
+            rows = 0
+            if key in fingerprints:
+                rows = conn.execute(f"INSERT INTO {table} BY NAME {select_for(key)}").fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            status.mark(table, key, 'failed', error=str(e))
+            raise
+        if key in fingerprints:
+            status.mark(table, key, 'done', fingerprint=fingerprints[key], rows=rows, **(details or {}))
+        else:
+            status.forget(table, [key])
+        return rows
+
+    written = {}
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ddse-partition') as pool:
+        futures = {key: pool.submit(build, key) for key in keys}
+        for key, future in futures.items():
+            try:
+                written[key] = future.result()
+            except Exception as e:
+                failed[key] = e
+    if failed:
+        details = '; '.join(f"{key}: {error}" for key, error in sorted(failed.items()))
+        raise ValueError(f"{len(failed)} partition(s) of {table} failed: {details}")
+    return written
@@ -0,0 +1,38 @@
+"""Plan which nodes of a transformation DAG get materialized.
+
+A transformation output read by exactly one other transformation, that no
+dashboard queries directly and that isn't marked persistent, is inlined:
+it is created as a view, which DuckDB expands into its consumer's query at
+bind time. A chain of such nodes then runs as one fused query and the
+intermediates are never written out. Every other output is a table.
+"""
+from collections import Counter
+from typing import Iterable, Mapping, Set
+
+import duckdb
+
+
+def plan_inlined(inputs: Mapping[str, Iterable[str]], served: Iterable[str],
+                 persistent: Iterable[str] = ()) -> Set[str]:
+    """Outputs to inline as views.
+
+    `inputs` maps every transformation output to the tables it reads,
+    `served` names the tables dashboards query. Names compare case-insensitively.
+    """
+    consumers = Counter(table.lower() for tables in inputs.values() for table in set(tables))
+    keep = {table.lower() for table in served} | {table.lower() for table in persistent}
+    return {output for output in inputs
+            if consumers[output.lower()] == 1 and output.lower() not in keep}
+
+
+def prepare_relation(conn: duckdb.DuckDBPyConnection, name: str, view: bool) -> None:
+    """Drop `name` if it exists as the other kind of relation.
+
+    CREATE OR REPLACE can't turn a table into a view or back, which happens
+    whenever a node's consumers change between runs.
+    """
+    existing = conn.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_name = ?", [name]
+    ).fetchone()
+    if existing is not None and (existing[0] == 'VIEW') != view:
+        conn.execute(f"DROP {'VIEW' if existing[0] == 'VIEW' else 'TABLE'} {name}")
@@ -0,0 +1,316 @@
+"""Per-node execution profiling and tracing for pipeline runs.
+
+Every source load, transformation, metric query, chart export and
+dashboard render runs inside a span that records its wall time, rows in
+and out, an estimate of the bytes its inputs hold, and the highest process
+RSS and DuckDB memory seen while it ran. Spans started on worker threads
+hang off the run's root span, so parallel DAG nodes show up side by side.
+
+Optionally (`profile_slowest`), the slowest nodes that ran a query in
+full are re-run at the end of the run under `EXPLAIN ANALYZE` with JSON
+profiling. That gives the rows their scans read, the bytes those scans
+pass on after projection and filtering, and the most expensive operators.
+Nodes that were skipped, served from a cache or updated incrementally
+carry no statement and are never re-run. The run can be exported as an
+OpenTelemetry (OTLP/JSON) trace, and the critical path through the DAG,
+the chain of dependent nodes that bounds the run's duration, is
+summarized.
+"""
+import contextlib
+import json
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import duckdb
+
+from dag import DependencyDAG
+
+# Bytes per value as DuckDB counts them in profiles; strings are 16-byte string_t headers
+_TYPE_WIDTHS = {
+    'BOOLEAN': 1, 'TINYINT': 1, 'UTINYINT': 1, 'SMALLINT': 2, 'USMALLINT': 2,
+    'INTEGER': 4, 'UINTEGER': 4, 'DATE': 4, 'FLOAT': 4,
+    'BIGINT': 8, 'UBIGINT': 8, 'DOUBLE': 8, 'TIMESTAMP': 8, 'TIMESTAMP WITH TIME ZONE': 8, 'TIME': 8,
+    'HUGEINT': 16, 'UHUGEINT': 16, 'UUID': 16, 'INTERVAL': 16,
+}
+_DEFAULT_WIDTH = 16
+
+# Node kinds that are vertices of the pipeline DAG
+DAG_KINDS = ('source', 'transformation')
+
+# `monitoring.metrics` types of data-stack-config.yaml that a run reports
+MONITORING_METRICS = ('pipeline_duration', 'data_freshness', 'error_rate')
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process (0 where /proc isn't available)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    if isinstance(value, (list, tuple)):
+        return {'key': key, 'value': {'arrayValue': {'values': [_attribute('', v)['value'] for v in value]}}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str  # pipeline, source, transformation, dashboard, metric, chart
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    statement: Optional[str] = None  # Query the node ran in full, to profile if it turns out slow
+    inputs: List[str] = field(default_factory=list)
+    peak_rss: int = 0
+    profile: Optional[dict] = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+class Profiler:
+    """Collects the spans of pipeline runs"""
+
+    def __init__(self, trace_dir: str = '.ddse/traces', profile_slowest: int = 0,
+                 sample_interval: float = 0.01, service_name: str = 'ddse'):
+        self.trace_dir = Path(trace_dir)
+        self.profile_slowest = profile_slowest
+        self.sample_interval = sample_interval
+        self.service_name = service_name
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._root: Optional[Span] = None
+        self._open: Dict[str, Span] = {}
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        # One sampler for the whole run; every open span keeps the highest RSS seen while it was open
+        while not self._stop.wait(self.sample_interval):
+            current = rss_bytes()
+            with self._lock:
+                for span in self._open.values():
+                    span.peak_rss = max(span.peak_rss, current)
+
+    @contextlib.contextmanager
+    def run(self, name: str, **attributes) -> Iterator[Span]:
+        """Root span of one pipeline run; starts a new trace"""
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self._stop.clear()
+        sampler = threading.Thread(target=self._sample, name='ddse-profiler', daemon=True)
+        sampler.start()
+        try:
+            with self.span(name, 'pipeline', **attributes) as root:
+                self._root = root
+                yield root
+        finally:
+            self._stop.set()
+            sampler.join()
+            self._root = None
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str, statement: Optional[str] = None,
+             inputs: Optional[List[str]] = None, **attributes) -> Iterator[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else self._root
+        span = Span(name, kind, secrets.token_hex(8), parent.span_id if parent else None, time.time_ns(),
+                    attributes=dict(attributes), statement=statement, inputs=list(inputs or []),
+                    peak_rss=rss_bytes())
+        with self._lock:
+            self._open[span.span_id] = span
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            span.end_ns = time.time_ns()
+            with self._lock:
+                del self._open[span.span_id]
+                span.peak_rss = max(span.peak_rss, rss_bytes())
+                self.spans.append(span)
+
+    def record_tables(self, conn: duckdb.DuckDBPyConnection, span: Span, inputs: List[str],
+                      output: Optional[str] = None) -> None:
+        """Rows in and out and estimated scanned bytes of a node, from catalog statistics"""
+        tables = list(inputs) + ([output] if output else [])
+        stats = {name: rows for name, rows in conn.execute(
+            "SELECT table_name, estimated_size FROM duckdb_tables() WHERE table_name IN (SELECT unnest(?))",
+            [tables]).fetchall()}
+        widths: Dict[str, int] = {}
+        for table, data_type in conn.execute(
+                "SELECT table_name, data_type FROM duckdb_columns() WHERE table_name IN (SELECT unnest(?))",
+                [list(inputs)]).fetchall():
+            widths[table] = widths.get(table, 0) + _TYPE_WIDTHS.get(data_type, _DEFAULT_WIDTH)
+        if inputs:
+            span.set(rows_in=sum(stats.get(t, 0) for t in inputs),
+                     bytes_scanned_estimate=sum(stats.get(t, 0) * widths.get(t, 0) for t in inputs))
+        if output and output in stats:
+            span.set(rows_out=stats[output])
+        span.set(duckdb_memory_bytes=conn.execute(
+            "SELECT coalesce(sum(memory_usage_bytes), 0)::BIGINT FROM duckdb_memory()").fetchone()[0])
+
+    def profile(self, conn: duckdb.DuckDBPyConnection) -> List[Span]:
+        """Re-run the `profile_slowest` slowest nodes' queries under EXPLAIN ANALYZE.
+
+        Off by default, as each profiled query runs a second time. Returns
+        the profiled spans.
+        """
+        if self.profile_slowest <= 0:
+            return []
+        candidates = [s for s in self.spans if s.statement and not s.error]
+        slowest = sorted(candidates, key=lambda s: s.seconds, reverse=True)[:self.profile_slowest]
+        cursor = conn.cursor()
+        try:
+            cursor.execute("PRAGMA enable_profiling = 'json'")
+            for span in slowest:
+                try:
+                    plan = json.loads(cursor.execute(f"EXPLAIN ANALYZE {span.statement}").fetchall()[0][1])
+                except (duckdb.Error, ValueError, IndexError) as e:
+                    span.set(profile_error=str(e))
+                    continue
+                operators = []
+
+                def walk(node: dict) -> None:
+                    if node.get('operator_type') not in (None, 'EXPLAIN_ANALYZE'):
+                        operators.append(node)
+                    for child in node.get('children', []):
+                        walk(child)
+
+                walk(plan)
+                scans = [op for op in operators if op.get('operator_rows_scanned')]
+                span.profile = {
+                    'operators': [
+                        {'type': op['operator_type'], 'seconds': op.get('operator_timing', 0.0),
+                         'rows': op.get('operator_cardinality', 0),
+                         'table': (op.get('extra_info') or {}).get('Text')}
+                        for op in sorted(operators, key=lambda op: -op.get('operator_timing', 0.0))[:5]
+                    ],
+                }
+                # result_set_size is what a scan outputs after projection and pushed-down filters,
+                # not what it read from storage; bytes_scanned_estimate sizes the whole inputs
+                span.set(bytes_emitted_by_scans=sum(op.get('result_set_size', 0) for op in scans),
+                         rows_scanned=sum(op['operator_rows_scanned'] for op in scans),
+                         profile=json.dumps(span.profile))
+        finally:
+            cursor.close()
+        return slowest
+
+    def critical_path(self) -> List[Span]:
+        """The chain of dependent DAG nodes with the largest total duration"""
+        nodes = {s.name: s for s in self.spans if s.kind in DAG_KINDS}
+        if not nodes:
+            return []
+        dag = DependencyDAG.from_adjacency({name: [] for name in nodes})
+        for name, span in nodes.items():
+            for upstream in span.inputs:
+                if upstream in nodes:
+                    dag.add_edge(upstream, name)
+
+        # One pass in dependency order: every input's finish time is known before its readers'
+        finish: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+        for name in dag.topological_order():
+            best = max(dag.parents(name), key=finish.__getitem__, default=None)
+            previous[name] = best
+            finish[name] = nodes[name].seconds + (finish[best] if best else 0.0)
+        end = max(finish, key=finish.__getitem__)
+        path = []
+        while end is not None:
+            path.append(nodes[end])
+            end = previous[end]
+        return path[::-1]
+
+    def monitoring_metrics(self, freshness: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """`monitoring.metrics` of data-stack-config.yaml for the last run"""
+        root = next((s for s in self.spans if s.kind == 'pipeline'), None)
+        nodes = [s for s in self.spans if s.kind != 'pipeline']
+        metrics = {
+            'pipeline_duration': root.seconds if root else None,
+            'error_rate': sum(1 for s in nodes if s.error) / len(nodes) if nodes else 0.0,
+        }
+        if freshness is not None:
+            metrics['data_freshness'] = freshness
+        return metrics
+
+    def summary(self) -> str:
+        root = next((s for s in self.spans if s.kind == 'pipeline'), None)
+        total = root.seconds if root else sum(s.seconds for s in self.spans)
+        lines = [f"Run took {total:.3f}s; critical path:"]
+        for span in self.critical_path():
+            rows = span.attributes.get('rows_out')
+            lines.append(f"  {span.kind:<14} {span.name:<30} {span.seconds:8.3f}s "
+                         f"{span.seconds / total:6.1%}{f'  {rows:,} rows' if rows is not None else ''}")
+        profiled = [s for s in self.spans if s.profile]
+        if profiled:
+            lines.append("Slowest profiled nodes:")
+            for span in sorted(profiled, key=lambda s: -s.seconds):
+                operators = span.profile['operators']
+                lines.append(f"  {span.name:<30} {span.seconds:8.3f}s, "
+                             f"{span.attributes.get('bytes_emitted_by_scans', 0) / 1024 ** 2:,.1f} MB out of scans"
+                             + (f", mostly {operators[0]['type']}" if operators else ''))
+        return '\n'.join(lines)
+
+    def to_otlp(self, resource: Optional[Dict[str, Any]] = None) -> dict:
+        """The spans as an OTLP/JSON ExportTraceServiceRequest"""
+        spans = []
+        for span in self.spans:
+            attributes = {'ddse.kind': span.kind, 'process.peak_rss_bytes': span.peak_rss, **span.attributes}
+            if span.statement:
+                attributes['db.statement'] = span.statement
+            if span.inputs:
+                attributes['ddse.inputs'] = span.inputs
+            spans.append({
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                **({'parentSpanId': span.parent_id} if span.parent_id else {}),
+                'name': span.name,
+                'kind': 1,  # SPAN_KIND_INTERNAL
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [_attribute(key, value) for key, value in attributes.items() if value is not None],
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+            })
+        resource_attributes = {'service.name': self.service_name, **(resource or {})}
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_attribute(k, v) for k, v in resource_attributes.items()]},
+            'scopeSpans': [{'scope': {'name': 'ddse.profiler'}, 'spans': spans}],
+        }]}
+
+    def export(self, resource: Optional[Dict[str, Any]] = None) -> Path:
+        """Write the trace to `<trace_dir>/<trace id>.json`"""
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        path = self.trace_dir / f"{self.trace_id}.json"
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_otlp(resource), f, indent=2, default=str)
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,306 @@
+"""Embedded async HTTP service for dashboard metrics and charts.
+
+Serves the `Metric` and `Chart` queries of a serving layer straight from
+the materialized DuckDB catalog, without a separate BI server:
+
+    GET /dashboards                                   dashboards, metrics and charts
+    GET /dashboards/<dashboard>/metrics               every metric value
+    GET /dashboards/<dashboard>/metrics/<metric>      one metric value
+    GET /dashboards/<dashboard>/charts/<chart>        chart rows, paged with
+        ?page=0&page_size=1000&format=json|arrow      (arrow is an IPC stream)
+    GET /stats                                        request count, p50/p99 latency per endpoint
+
+Names in paths are lower-cased with spaces as underscores, as in the files
+under `dashboards/`. Only declared queries run, each on a connection from a
+small pool (read-only when opened from a database file), in worker threads
+so the event loop stays responsive. Identical queries in flight at the same
+time share one execution.
+"""
+import asyncio
+import datetime
+import decimal
+import json
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import duckdb
+import pyarrow as pa
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 100_000
+LATENCY_WINDOW = 10_000  # Most recent requests kept per endpoint for percentiles
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def slug(name: str) -> str:
+    return name.lower().replace(' ', '_')
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        # As text, so DECIMAL columns keep every digit (a float would round them)
+        return str(value)
+    return str(value)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ConnectionPool:
+    """Fixed set of DuckDB connections handed out one request at a time"""
+
+    def __init__(self, connections: List[duckdb.DuckDBPyConnection]):
+        self._connections = connections
+        self._idle: Optional[asyncio.Queue] = None
+
+    @classmethod
+    def open(cls, database: str, size: int = 4) -> 'ConnectionPool':
+        """Read-only connections to a database file (no other process may hold it for writing)"""
+        first = duckdb.connect(database, read_only=True)
+        return cls([first] + [first.cursor() for _ in range(size - 1)])
+
+    @classmethod
+    def from_connection(cls, conn: duckdb.DuckDBPyConnection, size: int = 4) -> 'ConnectionPool':
+        """Cursors on a connection this process already holds, e.g. the engine's"""
+        return cls([conn.cursor() for _ in range(size)])
+
+    @property
+    def size(self) -> int:
+        return len(self._connections)
+
+    async def acquire(self) -> duckdb.DuckDBPyConnection:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for conn in self._connections:
+                self._idle.put_nowait(conn)
+        return await self._idle.get()
+
+    def release(self, conn: duckdb.DuckDBPyConnection) -> None:
+        self._idle.put_nowait(conn)
+
+
+class LatencyTracker:
+    """Per-endpoint request counts and latency percentiles over a sliding window"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._counts: Dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        self._samples[endpoint].append(seconds)
+        self._counts[endpoint] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        stats = {}
+        for endpoint, samples in self._samples.items():
+            ordered = sorted(samples)
+            stats[endpoint] = {
+                'requests': self._counts[endpoint],
+                'p50_ms': round(ordered[int(0.50 * (len(ordered) - 1))] * 1000, 3),
+                'p99_ms': round(ordered[int(0.99 * (len(ordered) - 1))] * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+        return stats
+
+
+class QueryService:
+    """Serves a serving layer's dashboards over HTTP"""
+
+    def __init__(self, dashboards: List[Any], pool: ConnectionPool):
+        self.dashboards = {slug(d.name): d for d in dashboards}
+        self.pool = pool
+        self.latency = LatencyTracker()
+        self.coalesced = 0  # Requests answered by joining an identical in-flight query
+        self._executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix='ddse-query')
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+
+    async def _run(self, query: str, params: Tuple = ()) -> pa.Table:
+        """Run a query on a pooled connection, sharing the result with identical in-flight requests"""
+        key = (query, params)
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            return await asyncio.shield(shared)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._in_flight[key] = future
+        try:
+            conn = await self.pool.acquire()
+            work = loop.run_in_executor(self._executor, lambda: conn.execute(query, list(params)).arrow())
+            # The connection goes back to the pool when its query ends, even if this request is cancelled
+            work.add_done_callback(lambda done: (self.pool.release(conn), done.cancelled() or done.exception()))
+            future.set_result(await asyncio.shield(work))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            if not future.done():
+                # Cancelled: requests sharing this query get an error rather than waiting forever
+                future.set_exception(HTTPError(503, "Query was cancelled"))
+            # Waiters see any exception; mark it retrieved for the case there are none
+            future.exception()
+            self._in_flight.pop(key, None)
+        return await future
+
+    def _dashboard(self, name: str) -> Any:
+        if name not in self.dashboards:
+            raise HTTPError(404, f"Unknown dashboard {name!r}")
+        return self.dashboards[name]
+
+    @staticmethod
+    def _find(items: List[Any], name: str, kind: str) -> Any:
+        for item in items:
+            if slug(item.name) == name:
+                return item
+        raise HTTPError(404, f"Unknown {kind} {name!r}")
+
+    async def _metric_value(self, metric: Any) -> Any:
+        table = await self._run(metric.query)
+        if table.num_rows == 0 or table.num_columns == 0:
+            return None
+        return table.column(0)[0].as_py()
+
+    async def handle(self, path: str, query: Dict[str, List[str]]) -> Tuple[str, Any]:
+        """Route a GET request; returns (endpoint template, body) where body is JSON-able or Arrow"""
+        parts = [part for part in path.split('/') if part]
+        if parts == ['health']:
+            return '/health', {'status': 'ok'}
+        if parts == ['stats']:
+            return '/stats', {'endpoints': self.latency.snapshot(), 'coalesced': self.coalesced}
+        if parts == ['dashboards']:
+            return '/dashboards', [
+                {'name': d.name, 'path': f"/dashboards/{key}",
+                 'metrics': [slug(m.name) for m in d.metrics], 'charts': [slug(c.name) for c in d.charts]}
+                for key, d in self.dashboards.items()
+            ]
+        if len(parts) >= 3 and parts[0] == 'dashboards':
+            dashboard = self._dashboard(parts[1])
+            if parts[2:] == ['metrics']:
+                values = await asyncio.gather(*(self._metric_value(m) for m in dashboard.metrics),
+                                              return_exceptions=True)
+                return '/dashboards/{dashboard}/metrics', {
+                    m.name: None if isinstance(v, Exception) else v for m, v in zip(dashboard.metrics, values)
+                }
+            if len(parts) == 4 and parts[2] == 'metrics':
+                metric = self._find(dashboard.metrics, parts[3], 'metric')
+                return '/dashboards/{dashboard}/metrics/{metric}', {
+                    'name': metric.name, 'value': await self._metric_value(metric)
+                }
+            if len(parts) == 4 and parts[2] == 'charts':
+                chart = self._find(dashboard.charts, parts[3], 'chart')
+                return '/dashboards/{dashboard}/charts/{chart}', await self._chart_page(chart, query)
+        raise HTTPError(404, f"No endpoint at {path}")
+
+    async def _chart_page(self, chart: Any, query: Dict[str, List[str]]) -> Any:
+        try:
+            page = int(query.get('page', ['0'])[0])
+            page_size = int(query.get('page_size', [str(DEFAULT_PAGE_SIZE)])[0])
+        except ValueError:
+            raise HTTPError(400, "page and page_size must be integers")
+        if page < 0 or not 0 < page_size <= MAX_PAGE_SIZE:
+            raise HTTPError(400, f"page must be >= 0 and page_size between 1 and {MAX_PAGE_SIZE}")
+        response_format = query.get('format', ['json'])[0]
+        if response_format not in ('json', 'arrow'):
+            raise HTTPError(400, "format must be json or arrow")
+
+        # One row past the page tells whether another page follows
+        table = await self._run(f"SELECT * FROM ({chart.query}) LIMIT ? OFFSET ?",
+                                (page_size + 1, page * page_size))
+        has_more = table.num_rows > page_size
+        table = table.slice(0, page_size)
+        if response_format == 'arrow':
+            return table
+        return {
+            'name': chart.name,
+            'columns': table.column_names,
+            'rows': [list(row.values()) for row in table.to_pylist()],
+            'page': page,
+            'page_size': page_size,
+            'has_more': has_more,
+        }
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                started = time.perf_counter()
+                endpoint = 'unrouted'
+                try:
+                    try:
+                        method, target, version = request_line.decode('latin-1').split()
+                    except ValueError:
+                        version = 'HTTP/1.0'
+                        raise HTTPError(400, 'Malformed request line')
+                    if method != 'GET':
+                        raise HTTPError(405, f"{method} is not supported")
+                    url = urlsplit(target)
+                    endpoint, body = await self.handle(url.path, parse_qs(url.query))
+                    status = 200
+                except HTTPError as e:
+                    status, body = e.status, {'error': str(e)}
+                except duckdb.Error as e:
+                    status, body = 500, {'error': str(e)}
+                except Exception as e:
+                    # Any other failure still gets a response rather than a dropped connection
+                    status, body = 500, {'error': f"{type(e).__name__}: {e}"}
+
+                if isinstance(body, pa.Table):
+                    sink = pa.BufferOutputStream()
+                    with pa.ipc.new_stream(sink, body.schema) as stream:
+                        stream.write_table(body)
+                    payload, content_type = sink.getvalue().to_pybytes(), 'application/vnd.apache.arrow.stream'
+                else:
+                    payload, content_type = json.dumps(body, default=_json_default).encode(), 'application/json'
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"{version} {status} {_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                self.latency.record(endpoint, time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8321) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    def run(self, host: str = '127.0.0.1', port: int = 8321) -> None:
+        """Serve until interrupted"""
+        async def main():
+            server = await self.start(host, port)
+            print(f"Serving {len(self.dashboards)} dashboard(s) on http://{host}:{port}/dashboards")
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,247 @@
+"""Pre-aggregated rollup cubes for Rill `metrics_view` definitions.
+
+A metrics view declares measures such as SUM(x), AVG(x) or
+COUNT(DISTINCT x) over a model, dimensions and a timeseries column. Each
+measure is kept in a rollup as mergeable state: sums, counts, minimums,
+maximums, and the set of distinct values for COUNT DISTINCT, so AVG is
+sum / count and distinct counts stay exact when cells are merged.
+
+That set is a full list of the distinct values in every cell, so a COUNT
+DISTINCT state grows with the column's cardinality. It suits columns with
+few values, such as country codes. It does not suit ids: on a user or
+event id the base cube is about as large as the model.
+
+One base cube (all dimensions at the smallest time grain) is built from
+the model; the coarser rollups (each dimension alone and the grand total,
+at every grain up to a year) are merged from the base cube, not from the
+model. A Rill source, model, metrics view and explore dashboard pointing
+at the base cube can be written into the Rill project, so dashboards read
+thousands of pre-aggregated rows instead of the raw model.
+"""
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+import yaml
+
+from arrow_io import write_parquet
+
+TIME_GRAINS = ['hour', 'day', 'week', 'month', 'quarter', 'year']
+
+_MEASURE = re.compile(r'^\s*(SUM|AVG|MIN|MAX|COUNT)\s*\(\s*(DISTINCT\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*\)\s*$',
+                      re.IGNORECASE)
+
+# Mergeable state columns kept per measure function, with how to merge each
+_STATES = {
+    'sum': [('sum', 'sum({})', 'sum({})')],
+    'avg': [('sum', 'sum({})', 'sum({})'), ('count', 'count({})', 'sum({})')],
+    'min': [('min', 'min({})', 'min({})')],
+    'max': [('max', 'max({})', 'max({})')],
+    'count': [('count', 'count({})', 'sum({})')],
+    # Exact, so the state lists every distinct value per cell; see the module docstring
+    'count_distinct': [('distinct', 'list(DISTINCT {})', 'list_distinct(flatten(list({})))')],
+}
+
+# Final measure value computed over a rollup's state columns
+_FINAL = {
+    'sum': 'sum({sum})',
+    'avg': 'sum({sum}) / nullif(sum({count}), 0)',
+    'min': 'min({min})',
+    'max': 'max({max})',
+    'count': 'sum({count})',
+    'count_distinct': 'len(list_distinct(flatten(list({distinct}))))',
+}
+
+
+@dataclass(frozen=True)
+class Measure:
+    name: str
+    function: str  # One of _STATES
+    column: str
+
+    @classmethod
+    def parse(cls, name: str, expression: str) -> 'Measure':
+        match = _MEASURE.match(expression)
+        if not match:
+            raise ValueError(f"Measure {name}: {expression!r} can't be rolled up, "
+                             f"expected SUM/AVG/MIN/MAX/COUNT [DISTINCT] of one column")
+        function = match.group(1).lower()
+        if match.group(2):
+            if function != 'count':
+                raise ValueError(f"Measure {name}: only COUNT supports DISTINCT")
+            function = 'count_distinct'
+        return cls(name, function, match.group(3))
+
+    def state_columns(self) -> Dict[str, str]:
+        """State kind -> rollup column name"""
+        return {kind: f"{self.name}__{kind}" for kind, _, _ in _STATES[self.function]}
+
+    def final_expression(self) -> str:
+        return _FINAL[self.function].format(**self.state_columns())
+
+
+@dataclass
+class MetricsView:
+    name: str
+    model: str
+    timeseries: str  # Column name, without any catalog qualifier
+    dimensions: List[str]  # Columns
+    measures: List[Measure]
+    smallest_time_grain: str
+    definition: dict  # The YAML as loaded
+
+    @classmethod
+    def load(cls, path: Path) -> 'MetricsView':
+        path = Path(path)
+        with open(path) as f:
+            definition = yaml.safe_load(f)
+        if definition.get('type') != 'metrics_view':
+            raise ValueError(f"{path} is not a metrics_view")
+        grain = definition.get('smallest_time_grain', 'day')
+        if grain not in TIME_GRAINS:
+            raise ValueError(f"{path}: unknown smallest_time_grain {grain!r}")
+        return cls(
+            name=path.stem,
+            model=definition['model'],
+            timeseries=definition['timeseries'].split('.')[-1],
+            dimensions=[d.get('column', d['name']) for d in definition.get('dimensions', [])],
+            measures=[Measure.parse(m['name'], m['expression']) for m in definition.get('measures', [])],
+            smallest_time_grain=grain,
+            definition=definition,
+        )
+
+    @property
+    def grains(self) -> List[str]:
+        return TIME_GRAINS[TIME_GRAINS.index(self.smallest_time_grain):]
+
+
+@dataclass(frozen=True)
+class Rollup:
+    view: str
+    dimensions: Tuple[str, ...]
+    grain: str
+
+    @property
+    def table(self) -> str:
+        return f"{self.view}__rollup_{'_'.join(self.dimensions) or 'total'}_{self.grain}"
+
+
+def plan_rollups(view: MetricsView) -> List[Rollup]:
+    """Base cube first, then every dimension alone and the grand total at every grain"""
+    dimension_sets = [tuple(view.dimensions)] + [(d,) for d in view.dimensions] + [()]
+    rollups = []
+    for dimensions in dict.fromkeys(dimension_sets):
+        for grain in view.grains:
+            rollups.append(Rollup(view.name, dimensions, grain))
+    return rollups
+
+
+def _select(view: MetricsView, rollup: Rollup, source: str, from_base: bool) -> str:
+    columns = list(rollup.dimensions) + [f"date_trunc('{rollup.grain}', {view.timeseries}) AS {view.timeseries}"]
+    for measure in view.measures:
+        for kind, build, merge in _STATES[measure.function]:
+            state = measure.state_columns()[kind]
+            expression = merge.format(state) if from_base else build.format(measure.column)
+            columns.append(f"{expression} AS {state}")
+    columns.append(f"{'sum(__rows)' if from_base else 'count(*)'} AS __rows")
+    return f"SELECT {', '.join(columns)} FROM {source} GROUP BY ALL"
+
+
+def build_rollups(conn: duckdb.DuckDBPyConnection, view: MetricsView, model_query: str) -> Dict[str, int]:
+    """Create every rollup table of `view` from `model_query`; returns rows per table"""
+    rollups = plan_rollups(view)
+    base = rollups[0]
+    written = {}
+    for rollup in rollups:
+        if rollup == base:
+            select = _select(view, rollup, f"({model_query}) AS model", from_base=False)
+        else:
+            select = _select(view, rollup, base.table, from_base=True)
+        conn.execute(f"CREATE OR REPLACE TABLE {rollup.table} AS {select}")
+        written[rollup.table] = conn.execute(f"SELECT count(*) FROM {rollup.table}").fetchone()[0]
+    return written
+
+
+def rollup_query(view: MetricsView, dimensions: List[str] = (), grain: Optional[str] = None,
+                 measures: Optional[List[str]] = None) -> str:
+    """SQL answering `measures` by `dimensions` and `grain` from the smallest matching rollup"""
+    grain = grain or view.smallest_time_grain
+    if grain not in view.grains:
+        raise ValueError(f"{view.name} has no rollup at grain {grain!r}")
+    unknown = set(dimensions) - set(view.dimensions)
+    if unknown:
+        raise ValueError(f"{view.name} has no dimension(s) {sorted(unknown)}")
+    wanted = [m for m in view.measures if measures is None or m.name in measures]
+    candidates = [r for r in plan_rollups(view) if set(dimensions) <= set(r.dimensions)
+                  and TIME_GRAINS.index(r.grain) <= TIME_GRAINS.index(grain)]
+    # Fewest extra dimensions, then the coarsest grain that still fits
+    rollup = min(candidates, key=lambda r: (len(r.dimensions), -TIME_GRAINS.index(r.grain)))
+    keys = list(dimensions) + [f"date_trunc('{grain}', {view.timeseries}) AS {view.timeseries}"]
+    columns = keys + [f"{m.final_expression()} AS {m.name}" for m in wanted]
+    return f"SELECT {', '.join(columns)} FROM {rollup.table} GROUP BY ALL ORDER BY ALL"
+
+
+def write_rill_files(conn: duckdb.DuckDBPyConnection, view: MetricsView, project_dir: Path) -> Path:
+    """Export the base cube and a Rill source, model, metrics view and explore reading it.
+
+    Files go under `<project_dir>/generated/`; returns the metrics view path.
+    """
+    base = plan_rollups(view)[0]
+    out = Path(project_dir) / 'generated'
+    data_path = out / 'data' / f"{base.table}.parquet"
+    write_parquet(conn, f"SELECT * FROM {base.table}", data_path)
+
+    rollup_model = f"{view.model}_rollup"
+    for folder, filename, content in [
+        ('sources', f"{base.table}.yaml", yaml.safe_dump({
+            'type': 'source',
+            'connector': 'duckdb',
+            'sql': f"from read_parquet('{data_path.relative_to(project_dir)}')",
+        }, sort_keys=False)),
+        ('models', f"{rollup_model}.sql", f"-- Generated from {view.name}: pre-aggregated rollup\n\n"
+                                          f"select * from {base.table}\n"),
+    ]:
+        (out / folder).mkdir(parents=True, exist_ok=True)
+        (out / folder / filename).write_text(content)
+
+    definition = dict(view.definition)
+    definition['model'] = rollup_model
+    definition['timeseries'] = view.timeseries
+    definition['display_name'] = f"{definition.get('display_name', view.name)} (rollup)"
+    expressions = {m.name: m.final_expression() for m in view.measures}
+    definition['measures'] = [{**m, 'expression': expressions[m['name']]} for m in definition['measures']]
+    metrics_path = out / 'metrics' / f"{view.name}_rollup.yaml"
+    metrics_path.parent.mkdir(parents=True, exist_ok=True)
+    metrics_path.write_text(yaml.safe_dump(definition, sort_keys=False))
+
+    explore_path = out / 'dashboards' / f"{view.name}_rollup_explore.yaml"
+    explore_path.parent.mkdir(parents=True, exist_ok=True)
+    explore_path.write_text(yaml.safe_dump({
+        'type': 'explore',
+        'title': definition['display_name'],
+        'metrics_view': metrics_path.stem,
+        'dimensions': '*',
+        'measures': '*',
+    }, sort_keys=False))
+    return metrics_path
+
+
+def model_query(project_dir: Path, model: str) -> str:
+    """A Rill model's SQL without comments, for use as a subquery"""
+    sql = (Path(project_dir) / 'models' / f"{model}.sql").read_text()
+    sql = re.sub(r'--[^\n]*', '', sql).strip().rstrip(';')
+    if not sql:
+        raise ValueError(f"Model {model} has no SQL")
+    return sql
+
+
+def load_metrics_views(project_dir: Path) -> List[MetricsView]:
+    """Every metrics_view under `<project_dir>/metrics/`"""
+    views = []
+    for path in sorted((Path(project_dir) / 'metrics').glob('*.yaml')):
+        with open(path) as f:
+            if (yaml.safe_load(f) or {}).get('type') == 'metrics_view':
+                views.append(MetricsView.load(path))
+    return views
@@ -0,0 +1,107 @@
+"""Refresh-interval-aware result cache for the serving layer.
+
+Dashboard results are cached under (dashboard, query, upstream fingerprint).
+An entry is served until the dashboard's `refresh_interval` has passed or a
+table the query reads has changed (which changes the fingerprint and so the
+key). The cache is size-capped with least-recently-used eviction and kept
+in a JSON file so scheduled runs share it. Decimals, dates, times and
+intervals are stored tagged with their type, so a value read back from the
+file is the same as the query returned.
+"""
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Tuple
+
+_INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+_MISSING = object()
+
+
+def parse_interval(interval: str) -> float:
+    """Turn an interval such as "5m", "24h" or "1h30m" into seconds"""
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([smhdw])', str(interval).lower())
+    if not parts:
+        raise ValueError(f"Invalid refresh interval: {interval!r}")
+    return sum(float(amount) * _INTERVAL_UNITS[unit] for amount, unit in parts)
+
+
+# Types DuckDB returns that JSON can't hold: tag -> (type, encode, decode); datetime before its base class date
+_TYPED = {
+    'decimal': (decimal.Decimal, str, decimal.Decimal),
+    'datetime': (datetime.datetime, datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    'date': (datetime.date, datetime.date.isoformat, datetime.date.fromisoformat),
+    'time': (datetime.time, datetime.time.isoformat, datetime.time.fromisoformat),
+    'timedelta': (datetime.timedelta, lambda value: value // datetime.timedelta(microseconds=1),
+                  lambda value: datetime.timedelta(microseconds=value)),
+}
+
+
+def _to_json(value: Any) -> Any:
+    for tag, (kind, encode, _) in _TYPED.items():
+        if isinstance(value, kind):
+            return {'__type__': tag, 'value': encode(value)}
+    return str(value)
+
+
+def _from_json(obj: dict) -> Any:
+    if obj.keys() == {'__type__', 'value'} and obj['__type__'] in _TYPED:
+        return _TYPED[obj['__type__']][2](obj['value'])
+    return obj
+
+
+class ServingCache:
+    """TTL + LRU cache of serving-layer query results"""
+
+    def __init__(self, path: str = '.ddse/serving_cache.json', max_entries: int = 1024):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        if self.path.exists():
+            with open(self.path) as f:
+                self._entries.update(json.load(f, object_hook=_from_json))
+
+    @staticmethod
+    def make_key(dashboard: str, query: str, upstream_fingerprints: List[str]) -> str:
+        payload = json.dumps([dashboard, query, sorted(upstream_fingerprints)])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str, ttl_seconds: float, default: Any = None) -> Any:
+        """Return the cached value if it is younger than `ttl_seconds`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if time.time() - entry['stored_at'] > ttl_seconds:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry['value']
+
+    def lookup(self, key: str, ttl_seconds: float) -> Tuple[bool, Any]:
+        """Like `get`, but tells a cached None apart from a miss"""
+        value = self.get(key, ttl_seconds, _MISSING)
+        return (False, None) if value is _MISSING else (True, value)
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = {'value': value, 'stored_at': time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f, default=_to_json)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,153 @@
+"""SQL analysis on DuckDB's own parser.
+
+Each query is parsed once with `json_serialize_sql` and the AST is walked to
+extract the relations and columns it references. Results are cached by a
+hash of the query text, so validating hundreds of dashboard queries only
+parses each distinct query once.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+import duckdb
+
+# Parsing needs no catalog, so one private connection serves every caller
+_parser = duckdb.connect(':memory:')
+_parser_lock = threading.Lock()
+_cache: Dict[str, 'QueryLineage'] = {}
+
+
+@dataclass(frozen=True)
+class QueryLineage:
+    tables: FrozenSet[str]  # Base tables read, lower-cased, CTEs excluded
+    columns: FrozenSet[Tuple[str, ...]]  # Dotted column references, e.g. ('p', 'post', 'text')
+    aliases: Tuple[Tuple[str, str], ...]  # (alias, table) for every aliased base table
+    output_aliases: FrozenSet[str]  # Names introduced by `expr AS name`
+    stars: FrozenSet[str] = frozenset()  # Relations expanded by `*`, '' for an unqualified star
+
+    def alias_map(self) -> Dict[str, str]:
+        return dict(self.aliases)
+
+    def columns_by_table(self, schemas: Dict[str, Iterable[str]]) -> Dict[str, Optional[Set[str]]]:
+        """Top-level columns the query reads from each base table, None meaning all of them.
+
+        `schemas` maps table names to their column names. References that
+        can't be tied to one table are attributed to every table declaring
+        that column, so the result may over-approximate but never misses a
+        column. Struct fields count as their top-level column.
+        """
+        declared = {table.lower(): {column.lower() for column in columns}
+                    for table, columns in schemas.items()}
+        alias_map = self.alias_map()
+        used: Dict[str, Optional[Set[str]]] = {table: set() for table in self.tables}
+
+        for star in self.stars:
+            for table in ([alias_map[star]] if star in alias_map else self.tables):
+                used[table] = None
+
+        def attribute(column: str) -> None:
+            for table in self.tables:
+                if used[table] is not None and column in declared.get(table, ()):
+                    used[table].add(column)
+
+        for names in self.columns:
+            if len(names) > 1 and names[0] in alias_map:
+                table = alias_map[names[0]]
+                if used[table] is not None:
+                    used[table].add(names[1])
+                continue
+            # Unqualified, or qualified by a subquery/CTE name or a struct column
+            attribute(names[0])
+            if len(names) > 1:
+                attribute(names[1])
+
+        for table in self.tables:
+            if table not in declared:
+                used[table] = None
+        return used
+
+
+class SQLAnalysisError(ValueError):
+    pass
+
+
+def _parse(query: str) -> dict:
+    with _parser_lock:
+        serialized = _parser.execute("SELECT json_serialize_sql(?::VARCHAR)", [query]).fetchone()[0]
+    ast = json.loads(serialized)
+    if ast.get('error'):
+        raise SQLAnalysisError(ast.get('error_message', 'could not parse query'))
+    if len(ast.get('statements', [])) != 1:
+        raise SQLAnalysisError(f"Expected a single statement, got {len(ast.get('statements', []))}")
+    return ast
+
+
+# Clauses that make a SELECT more than a bare select list
+_CLAUSES = ('where_clause', 'group_expressions', 'having', 'qualify', 'modifiers', 'sample')
+
+
+def select_items(query: str) -> int:
+    """Number of items in the select list of a bare `SELECT ...` (not cached).
+
+    Raises SQLAnalysisError if the query has a FROM, WITH, WHERE, GROUP BY,
+    HAVING, QUALIFY, ORDER BY or LIMIT clause.
+    """
+    node = _parse(query)['statements'][0]['node']
+    if (node.get('type') != 'SELECT_NODE' or node.get('from_table', {}).get('type') != 'EMPTY'
+            or node.get('cte_map', {}).get('map') or any(node.get(clause) for clause in _CLAUSES)):
+        raise SQLAnalysisError("Expected a bare select list")
+    return len(node['select_list'])
+
+
+def analyze(query: str) -> QueryLineage:
+    """Relations and columns referenced by a SELECT query (cached)"""
+    key = hashlib.sha256(query.encode()).hexdigest()
+    lineage = _cache.get(key)
+    if lineage is None:
+        lineage = _walk(_parse(query))
+        _cache[key] = lineage
+    return lineage
+
+
+def _walk(ast: dict) -> QueryLineage:
+    tables = set()
+    ctes = set()
+    columns = set()
+    aliases = {}
+    output_aliases = set()
+    stars = set()
+
+    # Iterative walk, so deeply nested queries can't hit the recursion limit
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+
+        if node.get('type') == 'BASE_TABLE':
+            table = node['table_name'].lower()
+            tables.add(table)
+            aliases[(node.get('alias') or table).lower()] = table
+        elif node.get('class') == 'COLUMN_REF':
+            columns.add(tuple(name.lower() for name in node['column_names']))
+        elif node.get('class') == 'STAR':
+            stars.add((node.get('relation_name') or '').lower())
+        if node.get('alias') and node.get('class'):
+            output_aliases.add(node['alias'].lower())
+        if isinstance(node.get('cte_map'), dict):
+            ctes.update(entry['key'].lower() for entry in node['cte_map'].get('map', []))
+
+        stack.extend(value for value in node.values() if isinstance(value, (dict, list)))
+
+    return QueryLineage(
+        tables=frozenset(tables - ctes),
+        columns=frozenset(columns),
+        aliases=tuple(sorted((alias, table) for alias, table in aliases.items() if table not in ctes)),
+        output_aliases=frozenset(output_aliases),
+        stars=frozenset(stars),
+    )
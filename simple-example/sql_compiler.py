@@ -0,0 +1,188 @@
+"""Compiles TemplateDataStack transformation entries into SQL once.
+
+Each `transformations` entry of a stack config becomes a SELECT with its
+filter values as bind parameters, plus the statements that materialize it
+as a table or a view. Identifiers are quoted, and free-form expressions
+(group keys, metric columns) must parse as a single expression reading no
+table. Compiled entries are cached in memory and in a JSON file keyed by a
+hash of the entry and the compiler version, so an unchanged config is not
+recompiled across runs. Cached entries are trusted without parsing them
+again. Each one is stored with a checksum of its key and every compiled
+field, so an entry edited by hand or truncated is compiled afresh instead
+of run.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from sql_analysis import SQLAnalysisError, analyze, select_items
+
+# Bump when the generated SQL or the cache file's format changes, so cached compilations are not reused
+COMPILER_VERSION = 3
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_literal(value: Any) -> str:
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _name(value: str, what: str) -> str:
+    if not isinstance(value, str) or not _IDENTIFIER.match(value):
+        raise ValueError(f"Invalid {what}: {value!r}")
+    return value
+
+
+def _expression(expr: str) -> str:
+    """A column name, quoted, or an expression checked to be a single table-free expression"""
+    if expr == '*':
+        return expr
+    if isinstance(expr, str) and all(_IDENTIFIER.match(part) for part in expr.split('.')):
+        return '.'.join(quote_identifier(part) for part in expr.split('.'))
+    try:
+        # The trailing item also catches a comment that would swallow the rest of the query
+        items = select_items(f"SELECT {expr}, NULL")
+        lineage = analyze(f"SELECT {expr}")
+    except SQLAnalysisError as e:
+        raise ValueError(f"Invalid SQL expression {expr!r}: {e}")
+    if items != 2:
+        raise ValueError(f"{expr!r} is not a single expression")
+    if lineage.tables:
+        raise ValueError(f"Expression {expr!r} may not read tables: {sorted(lineage.tables)}")
+    return expr
+
+
+@dataclass
+class CompiledTransform:
+    output: str
+    source: str
+    group_by: List[str]  # Compiled group-key expressions
+    aggregates: List[Tuple[str, str, str]]  # (name, function, compiled column), see incremental.Aggregate
+    select: str  # With `?` placeholders for `params`
+    params: List[Any]
+    select_literal: str  # Parameters inlined, for views, which can't take parameters
+    where_literal: str
+
+    @property
+    def create_table(self) -> str:
+        return f"CREATE OR REPLACE TABLE {quote_identifier(self.output)} AS {self.select}"
+
+    @property
+    def create_view(self) -> str:
+        return f"CREATE OR REPLACE VIEW {quote_identifier(self.output)} AS {self.select_literal}"
+
+
+def compile_transform(entry: Dict[str, Any]) -> CompiledTransform:
+    """Turn one `transformations` entry into SQL"""
+    output = _name(entry['output_table'], 'output_table')
+    source = _name(entry['source_table'], 'source_table')
+    group_by = [_expression(expr) for expr in entry.get('group_by', [])]
+    aggregates = [(_name(metric['name'], 'metric name'), _name(metric['agg'], 'aggregate'),
+                   _expression(metric['column']))
+                  for metric in entry['metrics']]
+
+    conditions, literals, params = [], [], []
+    for column, value in (entry.get('filters') or {}).items():
+        column = _expression(column)
+        values = value if isinstance(value, list) else [value]
+        if isinstance(value, list):
+            conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            literals.append(f"{column} IN ({', '.join(sql_literal(v) for v in values)})")
+        else:
+            conditions.append(f"{column} = ?")
+            literals.append(f"{column} = {sql_literal(value)}")
+        params.extend(values)
+
+    select_parts = group_by + [f"{func}({column}) AS {quote_identifier(name)}" for name, func, column in aggregates]
+    head = f"SELECT {', '.join(select_parts)} FROM {quote_identifier(source)}"
+    tail = ''
+    if group_by:
+        tail += f" GROUP BY {', '.join(str(i + 1) for i in range(len(group_by)))}"
+    tail += f" ORDER BY {group_by[0] if group_by else '1'}"
+    return CompiledTransform(
+        output=output,
+        source=source,
+        group_by=group_by,
+        aggregates=aggregates,
+        select=head + (f" WHERE {' AND '.join(conditions)}" if conditions else '') + tail,
+        params=params,
+        select_literal=head + (f" WHERE {' AND '.join(literals)}" if literals else '') + tail,
+        where_literal=' AND '.join(literals),
+    )
+
+
+class SQLCompiler:
+    """Cache of compiled transformation entries, keyed by a hash of each entry"""
+
+    def __init__(self, cache_path: str = '.ddse/compiled_sql.json'):
+        self.cache_path = Path(cache_path)
+        self._lock = threading.Lock()
+        self._compiled: Dict[str, CompiledTransform] = {}
+        if self.cache_path.exists():
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            if cached.get('version') == COMPILER_VERSION:
+                for key, stored in cached.get('entries', {}).items():
+                    try:
+                        if stored['checksum'] != self._checksum(key, stored['compiled']):
+                            # Edited by hand or from a broken run: compile it again when asked for
+                            continue
+                        value = dict(stored['compiled'])
+                        value['aggregates'] = [tuple(aggregate) for aggregate in value['aggregates']]
+                        self._compiled[key] = CompiledTransform(**value)
+                    except (KeyError, TypeError):
+                        continue
+        self.compiled_now = 0  # Entries compiled by this instance rather than found in the cache
+
+    @staticmethod
+    def config_hash(entry: Dict[str, Any]) -> str:
+        payload = json.dumps({'version': COMPILER_VERSION, 'entry': entry}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _checksum(key: str, compiled: Dict[str, Any]) -> str:
+        payload = json.dumps({'key': key, 'compiled': compiled}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def compile(self, entry: Dict[str, Any]) -> CompiledTransform:
+        key = self.config_hash(entry)
+        with self._lock:
+            compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = compile_transform(entry)
+            with self._lock:
+                self._compiled[key] = compiled
+                self.compiled_now += 1
+        return compiled
+
+    def save(self, keep: List[Dict[str, Any]] = None) -> None:
+        """Persist the cache, dropping entries not in `keep` when it is given"""
+        with self._lock:
+            if keep is not None:
+                wanted = {self.config_hash(entry) for entry in keep}
+                self._compiled = {key: value for key, value in self._compiled.items() if key in wanted}
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix('.tmp')
+            entries = {}
+            for key, value in self._compiled.items():
+                # Round-tripped through JSON first, so the checksum matches what is loaded back
+                compiled = json.loads(json.dumps(asdict(value), default=str))
+                entries[key] = {'compiled': compiled, 'checksum': self._checksum(key, compiled)}
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': COMPILER_VERSION, 'entries': entries}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.cache_path)
@@ -0,0 +1,87 @@
+"""DuckDB storage backend shared by the example stacks.
+
+By default every stack runs on an in-memory database. With a `database`
+path the catalog lives in a file, so a restarted process picks up what the
+previous one materialized, and `memory_limit`/`temp_directory` let DuckDB
+spill to disk instead of growing past the pod's memory limit.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+import duckdb
+import yaml
+
+# Kubernetes quantity suffixes, see resources.compute in data-stack-config.yaml
+_MEMORY_UNITS = {
+    'Ki': 1024, 'Mi': 1024 ** 2, 'Gi': 1024 ** 3, 'Ti': 1024 ** 4,
+    'k': 1000, 'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3, 'T': 1000 ** 4,
+}
+
+# Share of the pod's memory handed to DuckDB; the rest is left for Python itself
+MEMORY_HEADROOM = 0.8
+
+
+def parse_cpu(max_cpu: Union[str, int, float, None]) -> Optional[int]:
+    """Turn a Kubernetes-style CPU quantity ("4", "500m") into a thread count"""
+    if max_cpu is None:
+        return None
+    value = str(max_cpu).strip()
+    if value.endswith('m'):
+        return max(1, int(value[:-1]) // 1000)
+    return max(1, int(float(value)))
+
+
+def parse_memory(max_memory: Union[str, int, None]) -> Optional[int]:
+    """Turn a Kubernetes-style memory quantity ("8Gi", "512M") into bytes"""
+    if max_memory is None:
+        return None
+    value = str(max_memory).strip()
+    for suffix in sorted(_MEMORY_UNITS, key=len, reverse=True):
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * _MEMORY_UNITS[suffix])
+    return int(value)
+
+
+@dataclass
+class StorageConfig:
+    database: str = ':memory:'
+    memory_limit: Optional[str] = None  # DuckDB syntax, e.g. "6GiB"
+    threads: Optional[int] = None
+    temp_directory: Optional[str] = None  # Where DuckDB spills when over memory_limit
+
+    @classmethod
+    def from_stack_config(cls, config_path: Union[str, Path], database: str = ':memory:',
+                          temp_directory: Optional[str] = '.ddse/tmp') -> 'StorageConfig':
+        """Derive limits from `resources.compute` of a data-stack-config.yaml"""
+        with open(config_path) as f:
+            config = yaml.safe_load(f) or {}
+        compute = (config.get('resources') or {}).get('compute') or {}
+
+        memory_limit = None
+        max_memory = parse_memory(compute.get('max_memory'))
+        if max_memory:
+            memory_limit = f"{int(max_memory * MEMORY_HEADROOM) // 1024 ** 2}MiB"
+
+        return cls(
+            database=database,
+            memory_limit=memory_limit,
+            threads=parse_cpu(compute.get('max_cpu')),
+            temp_directory=temp_directory,
+        )
+
+
+def connect(storage: Optional[StorageConfig] = None) -> duckdb.DuckDBPyConnection:
+    """Open the database described by `storage` (in-memory when not given)"""
+    storage = storage or StorageConfig()
+    config = {}
+    if storage.memory_limit:
+        config['memory_limit'] = storage.memory_limit
+    if storage.threads:
+        config['threads'] = storage.threads
+    if storage.temp_directory:
+        Path(storage.temp_directory).mkdir(parents=True, exist_ok=True)
+        config['temp_directory'] = storage.temp_directory
+    if storage.database != ':memory:':
+        Path(storage.database).parent.mkdir(parents=True, exist_ok=True)
+    return duckdb.connect(storage.database, config=config)
@@ -0,0 +1,29 @@
+"""The example stacks and lake tools are scripts, not a package; make their modules importable."""
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+for directory in ('simple-example', 'lake'):
+    sys.path.insert(0, str(ROOT / directory))
+
+
+def _load_script(name: str, filename: str):
+    spec = importlib.util.spec_from_file_location(name, ROOT / 'simple-example' / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def engine_module():
+    """3-stack-truly-declarative.py, which can't be imported by name"""
+    return _load_script('truly_declarative', '3-stack-truly-declarative.py')
+
+
+@pytest.fixture
+def simple_stack_module():
+    """1-simple-stack.py, loaded afresh so tests can patch it"""
+    return _load_script('simple_stack', '1-simple-stack.py')
@@ -0,0 +1,23 @@
+import multiprocessing
+import os
+
+import pytest
+
+from benchmark import _dagster, _outcome
+
+
+def test_a_variant_process_that_dies_is_reported_with_its_exit_code():
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=os._exit, args=(3,))
+    process.start()
+    outcome = _outcome(process, queue, poll=0.1)
+    process.join()
+    assert outcome == {'error': 'process exited with code 3 without reporting results', 'results': []}
+
+
+def test_dagster_variant_counts_the_partition_rows(tmp_path, monkeypatch):
+    pytest.importorskip('dagster')
+    monkeypatch.chdir(tmp_path)
+    (stage, run), = _dagster({})
+    assert stage == 'materialize' and run() > 0
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import duckdb
+
+import compaction
+
+
+def test_files_written_during_compaction_survive(tmp_path, monkeypatch):
+    root = tmp_path / 'data'
+    partition = root / 'event_type=like' / 'event_dt=2024-12-13' / 'event_hour=15'
+    partition.mkdir(parents=True)
+    conn = duckdb.connect()
+    for i in range(3):
+        conn.execute(f"COPY (SELECT {i}::BIGINT AS event_us) TO '{partition}/part_{i}.parquet'")
+
+    exchange = compaction._exchange_directories
+
+    def exchange_after_a_late_write(first, second):
+        conn.execute(f"COPY (SELECT 99::BIGINT AS event_us) TO '{partition}/part_late.parquet'")
+        exchange(first, second)
+
+    monkeypatch.setattr(compaction, '_exchange_directories', exchange_after_a_late_write)
+    compactor = compaction.Compactor(str(root), log_path=str(tmp_path / 'log.jsonl'))
+    [result] = compactor.run(now=datetime(2025, 1, 1))
+
+    assert result.rows == 3
+    assert (partition / 'part_late.parquet').exists()
+    assert conn.execute(f"SELECT count(*), sum(event_us) FROM '{partition}/*.parquet'").fetchone() == (4, 102)
+    assert not compactor.staging.exists()
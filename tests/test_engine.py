@@ -0,0 +1,100 @@
+import asyncio
+import shutil
+from pathlib import Path
+
+import duckdb
+import pytest
+
+
+def _external_pipeline(m):
+    return m.Pipeline(
+        sources=[],
+        transformations=[m.Transformation(
+            name='daily', inputs=['ext_sales'], output='ext_daily',
+            schema=m.Schema([m.Column('sale_date', m.DataType.TIMESTAMP), m.Column('total', m.DataType.FLOAT)]),
+            aggregations={'sum': ['amount']}, time_grain='day')],
+        serving=m.ServingLayer(dashboards=[]),
+    )
+
+
+def test_transformation_reads_a_table_already_in_the_catalog(engine_module, tmp_path, monkeypatch):
+    m = engine_module
+    monkeypatch.chdir(tmp_path)
+    engine = m.DeclarativeEngine(max_parallelism=2, state_dir=str(tmp_path / '.ddse'))
+    engine.conn.execute("CREATE TABLE ext_sales AS SELECT TIMESTAMP '2024-01-01' + INTERVAL (i) HOUR AS sale_date, "
+                        "i::DOUBLE AS amount FROM range(48) t(i)")
+    engine.execute_pipeline(_external_pipeline(m))
+    assert engine.conn.execute("SELECT count(*), sum(total) FROM ext_daily").fetchone() == (2, 1128.0)
+
+
+def test_unknown_input_is_rejected(engine_module):
+    with pytest.raises(ValueError, match='unknown table ext_sales'):
+        _external_pipeline(engine_module).validate()
+
+
+def test_backfill_keeps_maintained_aggregates_consistent(engine_module, tmp_path, monkeypatch):
+    m = engine_module
+    from partitions import PartitionSpec
+    monkeypatch.chdir(tmp_path)
+
+    def pipeline(offset):
+        pipeline = m.create_example_pipeline()
+        source = pipeline.sources[0]
+        source.query = (f"SELECT ts AS sale_date, (hour(ts) * 7 % 100 + {offset})::DOUBLE AS amount, "
+                        f"hour(ts) % 9 + 1 AS product_id "
+                        f"FROM generate_series(TIMESTAMP '2024-01-01', TIMESTAMP '2024-01-10', INTERVAL 1 HOUR) t(ts)")
+        source.partition = PartitionSpec('sale_date', 'day')
+        return pipeline
+
+    engine = m.DeclarativeEngine(max_parallelism=2, state_dir=str(tmp_path / '.ddse'))
+    engine.execute_pipeline(pipeline(0))
+    engine.backfill(pipeline(1), 'raw_sales', '2024-01-02', '2024-01-03')
+
+    expected = engine.conn.execute("""
+        SELECT date_trunc('day', sale_date), sum(amount), count(*) FROM raw_sales GROUP BY ALL ORDER BY 1
+    """).fetchall()
+    assert engine.conn.execute("SELECT * FROM sales_daily ORDER BY 1").fetchall() == expected
+    assert engine.conn.execute("SELECT sum(amount) FROM raw_sales").fetchone()[0] == 9288.0 + 48
+
+
+def test_rill_metrics_views_get_rollups(engine_module, tmp_path, monkeypatch):
+    m = engine_module
+    from rollups import load_metrics_views, rollup_query
+    monkeypatch.chdir(tmp_path)
+    project = tmp_path / 'serve'
+    for folder in ('metrics', 'models'):
+        shutil.copytree(Path(__file__).resolve().parent.parent / 'serve' / folder, project / folder)
+    pipeline = m.create_example_pipeline()
+    pipeline.sources.append(m.create_testing_trends_source())
+    pipeline.rill_project = str(project)
+
+    engine = m.DeclarativeEngine(max_parallelism=2, state_dir=str(tmp_path / '.ddse'))
+    engine.execute_pipeline(pipeline)
+
+    view, = load_metrics_views(project)
+    rolled = engine.conn.execute(rollup_query(view, grain='year', measures=[
+        'total_monthly_tests_measure', 'max_monthly_cases_measure', 'count_countries_measure'])).fetchall()
+    expected = engine.conn.execute("""
+        SELECT date_trunc('year', month), sum(monthly_tests), max(monthly_cases), count(DISTINCT country_code)
+        FROM dm_monthly_testing_positive_trends GROUP BY ALL ORDER BY ALL
+    """).fetchall()
+    assert [tuple(row) for row in rolled] == expected
+    assert (project / 'generated' / 'metrics' / f"{view.name}_rollup.yaml").exists()
+
+
+def test_serving_pool_is_read_only(engine_module, tmp_path, monkeypatch):
+    m = engine_module
+    from storage import StorageConfig
+    monkeypatch.chdir(tmp_path)
+    engine = m.DeclarativeEngine(max_parallelism=2, state_dir=str(tmp_path / '.ddse'),
+                                 storage=StorageConfig(database=str(tmp_path / 'stack.duckdb')))
+    engine.execute_pipeline(m.create_example_pipeline())
+    pool = engine.serving_pool(pool_size=2)
+
+    async def first_connection():
+        return await pool.acquire()
+
+    conn = asyncio.run(first_connection())
+    assert conn.execute("SELECT count(*) FROM sales_daily").fetchone()[0] > 0
+    with pytest.raises(duckdb.Error, match='read-only'):
+        conn.execute("CREATE TABLE scratch (a INTEGER)")
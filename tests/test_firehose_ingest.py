@@ -0,0 +1,31 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from firehose_ingest import FirehoseIngester
+
+START = datetime(2024, 12, 13, 15, tzinfo=timezone.utc)
+
+
+def _like(minutes: float) -> str:
+    time_us = int((START + timedelta(minutes=minutes)).timestamp() * 1_000_000)
+    return json.dumps({'kind': 'commit', 'did': 'did:plc:a', 'time_us': time_us, 'commit': {
+        'collection': 'app.bsky.feed.like', 'operation': 'create',
+        'record': {'subject': {'uri': 'at://post'}}}})
+
+
+def test_closed_hours_are_written_while_the_stream_runs(tmp_path):
+    ingester = FirehoseIngester(str(tmp_path), batch_size=10, close_after=timedelta(minutes=5))
+    written = []
+
+    def stream():
+        for minute in range(0, 150, 2):
+            yield _like(minute)
+            written.append(sorted(partition[2] for partition in ingester._buffers))
+
+    ingester.ingest(stream())
+    # Hour 15 is written once the stream reaches 16:05, well before the input ends
+    assert 15 not in written[45]
+    assert 16 in written[45]
+    assert ingester.stats.files_by_partition == {
+        f"event_type=like/event_dt=2024-12-13/event_hour={hour}": 1 for hour in (15, 16, 17)
+    }
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import duckdb
+
+from firehose_ingest import FileSource, FirehoseIngester
+from partition_index import PartitionIndex
+
+FIREHOSE = Path(__file__).resolve().parent.parent / 'data' / 'firehose.json'
+
+
+def _ingested_index(tmp_path):
+    FirehoseIngester(str(tmp_path / 'lake')).ingest(FileSource(str(FIREHOSE)))
+    index = PartitionIndex(str(tmp_path / 'lake'), str(tmp_path / 'index.json'))
+    index.refresh()
+    return index
+
+
+def test_indexes_ingester_output(tmp_path):
+    index = _ingested_index(tmp_path)
+    assert {entry.partitions['event_type'] for entry in index.files.values()} == {'post', 'like', 'follow', 'repost'}
+
+    posts = next(entry for entry in index.files.values() if entry.partitions['event_type'] == 'post')
+    low, high = posts.stats['created_ts']
+    assert isinstance(low, str) and low.startswith('2024-12-13') and low <= high
+    assert isinstance(posts.stats['event_us'][0], int)
+
+    assert len(index.prune(ranges={'created_ts': ('2024-12-13', None)})) == len(index.files)
+    assert index.prune(ranges={'created_ts': ('2025-01-01', None)}) == []
+
+    index.save()
+    assert PartitionIndex(str(tmp_path / 'lake'), str(tmp_path / 'index.json')).refresh() == 0
+
+
+def test_scan_across_event_types_keeps_every_column(tmp_path):
+    index = _ingested_index(tmp_path)
+    conn = duckdb.connect()
+    relation = index.scan(conn, filters={'event_hour': 15})
+    assert {'subject_did', 'uri', 'text', 'is_reply'} <= set(relation.columns)
+    counts = {event_type: (texts, subjects) for event_type, texts, subjects in relation.aggregate(
+        'event_type, count(text) AS texts, count(subject_did) AS subjects', 'event_type').fetchall()}
+    assert counts['post'][0] > 0 and counts['follow'][1] > 0
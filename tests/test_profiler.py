@@ -0,0 +1,42 @@
+from profiler import Profiler
+
+
+def test_critical_path_of_a_chain_deeper_than_the_recursion_limit():
+    profiler = Profiler()
+    with profiler.run('pipeline'):
+        for i in range(5000):
+            with profiler.span(f"t{i}", 'transformation', inputs=[f"t{i - 1}"] if i else []):
+                pass
+        with profiler.span('side', 'source'):
+            pass
+    path = profiler.critical_path()
+    assert [span.name for span in path] == [f"t{i}" for i in range(5000)]
+
+
+def test_only_queries_that_ran_in_full_are_profiled(engine_module, tmp_path, monkeypatch):
+    m = engine_module
+    monkeypatch.chdir(tmp_path)
+    engine = m.DeclarativeEngine(max_parallelism=2, state_dir=str(tmp_path / '.ddse'))
+    engine.profiler.profile_slowest = 100
+    pipeline = m.create_example_pipeline()
+    source = pipeline.sources[0]
+    source.incremental = False
+    source.query = ("SELECT ts AS sale_date, hour(ts)::DOUBLE AS amount, 1 AS product_id "
+                    "FROM generate_series(TIMESTAMP '2024-01-01', TIMESTAMP '2024-01-03', INTERVAL 1 HOUR) t(ts)")
+    engine.execute_pipeline(pipeline)
+    profiled = {span.name for span in engine.profiler.spans if span.profile}
+    assert {'raw_sales', 'sales_daily', 'Daily Sales Trend'} <= profiled
+
+    # Unchanged: the transformation is restored from the cache and the charts from the serving cache
+    engine.execute_pipeline(pipeline)
+    spans = {span.name: span for span in engine.profiler.spans}
+    assert spans['sales_daily'].statement is None and spans['Daily Sales Trend'].statement is None
+    assert 'sales_daily' not in {span.name for span in engine.profiler.spans if span.profile}
+
+
+def test_profiling_is_off_by_default(engine_module, tmp_path, monkeypatch):
+    m = engine_module
+    monkeypatch.chdir(tmp_path)
+    engine = m.DeclarativeEngine(max_parallelism=2, state_dir=str(tmp_path / '.ddse'))
+    engine.execute_pipeline(m.create_example_pipeline())
+    assert not any(span.profile for span in engine.profiler.spans)
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import duckdb
+import pytest
+
+from query_service import ConnectionPool, HTTPError, QueryService
+
+
+async def _get(service, path):
+    server = await service.start(port=0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(f"GET {path} HTTP/1.1\r\nConnection: close\r\n\r\n".encode())
+        status = (await reader.readline()).split()[1]
+        response = await reader.read()
+        writer.close()
+    return int(status), json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+
+def _service(metrics):
+    conn = duckdb.connect()
+    dashboard = SimpleNamespace(name='Sales', metrics=metrics, charts=[])
+    return QueryService([dashboard], ConnectionPool.from_connection(conn, size=1))
+
+
+def test_decimal_values_keep_every_digit():
+    service = _service([SimpleNamespace(name='Total', query="SELECT 12345678901234567.89::DECIMAL(19, 2)")])
+    status, body = asyncio.run(_get(service, '/dashboards/sales/metrics/total'))
+    assert (status, body['value']) == (200, '12345678901234567.89')
+
+
+def test_unexpected_errors_get_a_500_response():
+    service = _service([SimpleNamespace(name='Total', query="SELECT 1")])
+
+    async def broken(metric):
+        raise RuntimeError('metric backend unavailable')
+
+    service._metric_value = broken
+    status, body = asyncio.run(_get(service, '/dashboards/sales/metrics/total'))
+    assert (status, body) == (500, {'error': 'RuntimeError: metric backend unavailable'})
+
+
+class _BlockedConnection:
+    """Stands in for a DuckDB connection whose query runs until `release` is set"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def execute(self, query, params):
+        self.release.wait(5)
+        return SimpleNamespace(arrow=lambda: 'result')
+
+
+def test_cancelled_query_fails_its_waiters_and_frees_the_connection():
+    conn = _BlockedConnection()
+    service = QueryService([], ConnectionPool([conn]))
+
+    async def scenario():
+        leader = asyncio.create_task(service._run('SELECT 1'))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.create_task(service._run('SELECT 1'))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(HTTPError, match='cancelled'):
+            await asyncio.wait_for(waiter, 1)
+        assert service._in_flight == {}
+        conn.release.set()
+        assert await asyncio.wait_for(service.pool.acquire(), 1) is conn
+
+    asyncio.run(scenario())
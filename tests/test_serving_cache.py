@@ -0,0 +1,25 @@
+import datetime
+import decimal
+
+from serving_cache import ServingCache
+
+
+def test_values_keep_their_type_across_a_reload(tmp_path):
+    values = {
+        'decimal': decimal.Decimal('12345678901234567.89'),
+        'timestamp': datetime.datetime(2024, 1, 2, 3, 4, 5, 6),
+        'date': datetime.date(2024, 1, 2),
+        'time': datetime.time(3, 4, 5),
+        'interval': datetime.timedelta(days=1, microseconds=7),
+        'row': [decimal.Decimal('0.10'), 3, 'text', None],
+    }
+    cache = ServingCache(tmp_path / 'serving_cache.json')
+    for name, value in values.items():
+        cache.put(name, value)
+    cache.save()
+
+    reloaded = ServingCache(tmp_path / 'serving_cache.json')
+    for name, value in values.items():
+        cached = reloaded.get(name, float('inf'))
+        assert cached == value and type(cached) is type(value)
+    assert type(reloaded.get('row', float('inf'))[0]) is decimal.Decimal
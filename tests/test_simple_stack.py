@@ -0,0 +1,17 @@
+import pytest
+
+
+def test_template_stack_fingerprints_incremental_sources_by_watermark(simple_stack_module, tmp_path,
+                                                                      monkeypatch, capsys):
+    m = simple_stack_module
+    monkeypatch.chdir(tmp_path)
+    config = tmp_path / 'stack_config.yaml'
+    config.write_text(m.example_config)
+    monkeypatch.setattr(m, 'table_fingerprint', lambda conn, table: pytest.fail(f"{table} was scanned"))
+
+    stack = m.TemplateDataStack(config, state_dir=str(tmp_path / '.ddse'))
+    stack.ingest()
+    stack.transform()
+    stack.ingest()
+    stack.transform()
+    assert 'Skipped unchanged table: sales_daily' in capsys.readouterr().out
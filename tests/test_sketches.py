@@ -0,0 +1,26 @@
+import pyarrow as pa
+import pytest
+
+from sketches import HyperLogLog, TopK
+
+
+def test_hyperloglog_estimate_is_within_its_bounds():
+    sketch, other = HyperLogLog(), HyperLogLog()
+    sketch.add(pa.array([f"did:plc:{i}" for i in range(30_000)] + [None]))
+    other.add([f"did:plc:{i}" for i in range(20_000, 50_000)])
+    sketch.merge(HyperLogLog.from_json(other.to_json()))
+    estimate = sketch.estimate()
+    assert estimate.low <= 50_000 <= estimate.high
+
+
+def test_hyperloglogs_of_different_hashes_do_not_merge():
+    other = HyperLogLog.from_json({**HyperLogLog().to_json(), 'hash': 'xxhash'})
+    with pytest.raises(ValueError, match='xxhash'):
+        HyperLogLog().merge(other)
+
+
+def test_top_k_counts_arrow_values():
+    sketch = TopK()
+    sketch.add(pa.array(['a', 'b', 'a', None, 'a']))
+    sketch.add(['b'])
+    assert [(item, count.value) for item, count in sketch.top(2)] == [('a', 3), ('b', 2)]
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from sql_compiler import COMPILER_VERSION, SQLCompiler, compile_transform
+
+ENTRY = {
+    'source_table': 'raw_sales',
+    'output_table': 'daily_sales',
+    'group_by': ["date_trunc('day', sale_date)"],
+    'metrics': [{'name': 'total', 'agg': 'SUM', 'column': 'amount'}],
+    'filters': {'product_id': 3},
+}
+
+
+@pytest.mark.parametrize('expression', ['amount, product_id', 'amount --', '1 FROM range(3)', '(SELECT 1 FROM t)'])
+def test_expressions_must_be_one_table_free_expression(expression):
+    with pytest.raises(ValueError):
+        compile_transform({**ENTRY, 'group_by': [expression]})
+
+
+def test_cache_file_is_trusted_unless_edited(tmp_path, monkeypatch):
+    import sql_compiler
+    path = tmp_path / 'compiled_sql.json'
+    compiler = SQLCompiler(path)
+    compiler.compile(ENTRY)
+    compiler.save()
+    # Loading an intact cache parses nothing
+    monkeypatch.setattr(sql_compiler, 'select_items', lambda query: pytest.fail('re-parsed'))
+    assert SQLCompiler(path).compile(ENTRY) == compiler.compile(ENTRY)
+    assert SQLCompiler(path).compiled_now == 0
+    monkeypatch.undo()
+
+    cached = json.loads(path.read_text())
+    [entry] = cached['entries'].values()
+    entry['compiled']['select'] = 'SELECT 1; DROP TABLE raw_sales'
+    path.write_text(json.dumps(cached))
+    reloaded = SQLCompiler(path)
+    assert reloaded.compile(ENTRY).select == compiler.compile(ENTRY).select
+    assert reloaded.compiled_now == 1
+
+    path.write_text(json.dumps({'version': COMPILER_VERSION - 1, 'entries': cached['entries']}))
+    assert SQLCompiler(path)._compiled == {}
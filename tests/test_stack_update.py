@@ -0,0 +1,58 @@
+import importlib.util
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+CONFIG = """
+debounce_seconds: 0.05
+sources:
+  - table: raw_a
+  - table: raw_b
+transformations:
+  - source_table: raw_a
+    output_table: mart_a
+    metrics:
+      - {name: total, agg: SUM, column: amount}
+  - source_table: raw_b
+    output_table: mart_b
+    metrics:
+      - {name: total, agg: SUM, column: amount}
+dashboard: {}
+"""
+
+
+@pytest.fixture
+def stack_module():
+    path = Path(__file__).resolve().parent.parent / 'simple-example' / '2-stack-update.py'
+    spec = importlib.util.spec_from_file_location('stack_update', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_a_burst_of_changes_is_refreshed_once_off_the_main_thread(stack_module, tmp_path):
+    config = tmp_path / 'stack_config.yaml'
+    config.write_text(CONFIG)
+    stack = stack_module.DeclarativeStack(str(config))
+    assert stack.state_manager.debounce_seconds == 0.05
+    stack.conn.execute("CREATE TABLE raw_a AS SELECT 1.0 AS amount")
+    stack.conn.execute("CREATE TABLE raw_b AS SELECT 2.0 AS amount")
+
+    refreshed = []
+    refresh_table = stack._refresh_table
+    stack._refresh_table = lambda transform: (refreshed.append((transform['output_table'],
+                                                                threading.current_thread())),
+                                              refresh_table(transform))
+    stack.watch_for_changes()
+    stack.state_manager.update_state({'data': ['raw_a']})
+    stack.state_manager.update_state({'data': ['raw_b', 'raw_a']})
+    deadline = time.monotonic() + 5
+    while len(refreshed) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+    assert sorted(table for table, _ in refreshed) == ['mart_a', 'mart_b']
+    assert all(thread is not threading.main_thread() for _, thread in refreshed)
+    assert stack.conn.execute("SELECT total FROM mart_b").fetchone() == (2.0,)